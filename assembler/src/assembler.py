@@ -1,3 +1,14 @@
+import sys
+from array import array
+from contextlib import nullcontext
+
+import memfile
+import objfile
+
+# Bump whenever encoding or output formats change (recorded in benchmark results;
+# the batch build cache is keyed by a hash of the assembler code itself)
+ASSEMBLER_VERSION = "2.0"
+
 # first the instruction map 
 
 formats = {
@@ -164,143 +175,167 @@ def parse_immediate(value_str, symbol_table=None):
                 raise ValueError(f"Invalid immediate value: {value_str}")
 
 
+# Operand kinds recorded in the IR
+OPERAND_REG = "reg"   # R0..R7
+OPERAND_NUM = "num"   # numeric literal (decimal, 0x hex or bare hex)
+OPERAND_SYM = "sym"   # anything else, resolved through the symbol table
+
+
+class SourceLine:
+    """
+    One tokenized source line: the IR shared by both assembler passes.
+    Only lines carrying a label or a mnemonic are kept.
+    """
+    __slots__ = ("line_num", "text", "label", "mnemonic", "operands", "kinds")
+
+    def __init__(self, line_num, text, label, mnemonic, operands, kinds):
+        self.line_num = line_num    # 1-based line number in the source
+        self.text = text            # stripped source line (for listings)
+        self.label = label          # label defined on this line, or None
+        self.mnemonic = mnemonic    # upper-cased instruction/directive/data, or None
+        self.operands = operands    # tuple of cleaned operand strings
+        self.kinds = kinds          # tuple of OPERAND_* kinds, one per operand
+
+    def __repr__(self):
+        return (f"SourceLine({self.line_num}, label={self.label!r}, "
+                f"mnemonic={self.mnemonic!r}, operands={self.operands!r})")
+
+
+def classify_operand(operand):
+    """Return the OPERAND_* kind of a cleaned operand string."""
+    if operand in register_map:
+        return OPERAND_REG
+    try:
+        parse_immediate(operand)
+        return OPERAND_NUM
+    except ValueError:
+        return OPERAND_SYM
+
+
+def tokenize(lines):
+    """
+    Tokenize source lines once into a list of SourceLine records.
+    Blank and comment-only lines are dropped.
+    """
+    program = []
+    kind_cache = {}  # operands repeat heavily; classify each spelling once
+    for line_num, line in enumerate(lines, 1):
+        label, instruction, operands = parse_line(line)
+        if label is None and instruction is None:
+            continue
+        operands = tuple(operands)
+        kinds = []
+        for op in operands:
+            kind = kind_cache.get(op)
+            if kind is None:
+                kind = kind_cache[op] = classify_operand(op)
+            kinds.append(kind)
+        kinds = tuple(kinds)
+        program.append(SourceLine(line_num, line.strip(), label, instruction, operands, kinds))
+    return program
+
+
+def sign_extend_16(value):
+    """
+    Sign extend a 16-bit value to a 32-bit unsigned integer.
+    Negative inputs are taken as 16-bit two's complement first.
+    """
+    value &= 0xFFFF
+    if value & 0x8000:
+        return value | 0xFFFF0000
+    return value
+
+
 def sign_extend_to_32bit(value):
     """
     Sign extend a 16-bit value to 32-bit.
     Returns 32-bit binary string.
     """
-    # Handle negative numbers (two's complement for 16-bit)
-    if value < 0:
-        # Convert to 16-bit two's complement
-        value = value & 0xFFFF
-    
-    # Check if sign bit (bit 15) is set
-    if value & 0x8000:
-        # Negative: extend with 1s
-        extended = value | 0xFFFF0000
-    else:
-        # Positive: extend with 0s
-        extended = value & 0x0000FFFF
-    
-    # Convert to 32-bit binary string (handle as unsigned for formatting)
-    return format(extended & 0xFFFFFFFF, '032b')
+    return format(sign_extend_16(value), '032b')
 
 
-def encode_instruction(instruction, operands, symbol_table=None):
+# Word 1 layout: opcode(5) | index(2) | dont_care(16) | rdst(3) | rs1(3) | rs2(3)
+OPCODE_SHIFT = 27
+INDEX_SHIFT = 25
+RDST_SHIFT = 6
+RS1_SHIFT = 3
+RS2_SHIFT = 0
+
+# Register number by name (integer form of register_map)
+register_numbers = {name: int(bits, 2) for name, bits in register_map.items()}
+
+# Register fields per format: (operand index, field shift) pairs
+format_register_fields = {
+    "A": (),
+    "B": ((0, RDST_SHIFT),),                                # Rdst
+    "C": ((0, RS1_SHIFT), (1, RDST_SHIFT)),                 # MOV Rsrc, Rdst
+    "D": ((0, RDST_SHIFT), (1, RS1_SHIFT), (2, RS2_SHIFT)), # ADD Rdst, Rsrc1, Rsrc2
+    "E": ((0, RDST_SHIFT),),                                # LDM Rdst, Imm
+    "F": ((0, RDST_SHIFT), (1, RS1_SHIFT)),                 # IADD Rdst, Rsrc, Imm
+    "G": ((0, RDST_SHIFT), (2, RS1_SHIFT)),                 # LDD Rdst, offset(Rsrc)
+    "H": ((0, RS2_SHIFT), (2, RS1_SHIFT)),                  # STD Rsrc1, offset(Rsrc2)
+    "I": (),
+    "J": (),                                                # INT index (index field)
+    "M": ((0, RS2_SHIFT),),                                 # OUT, PUSH
+}
+
+# Extra register fields for instructions that deviate from their format
+instruction_extra_fields = {
+    "INC":  ((0, RS1_SHIFT),),   # INC/NOT also read the register through rs1
+    "NOT":  ((0, RS1_SHIFT),),
+    "SWAP": ((1, RS2_SHIFT),),   # SWAP also reads Rdst through rs2
+}
+
+# Operand holding the second-word value (immediate/offset/address) per format
+format_immediate_operand = {"E": 1, "F": 2, "G": 1, "H": 1, "I": 0}
+
+# Precomputed encoder entries:
+# mnemonic -> (pre-shifted opcode mask, register fields, immediate operand, num_words, format)
+encoder_table = {
+    name: (
+        int(info["opcode"], 2) << OPCODE_SHIFT,
+        format_register_fields[info["format"]] + instruction_extra_fields.get(name, ()),
+        format_immediate_operand.get(info["format"]) if info["num_words"] == 2 else None,
+        info["num_words"],
+        info["format"],
+    )
+    for name, info in instruction_map.items()
+}
+
+
+def encode_words(instruction, operands, symbol_table=None):
     """
-    Encode instruction and operands into binary words.
-    Returns list of 32-bit binary strings.
+    Encode instruction and operands into 32-bit integer words.
+    Returns a tuple of one or two ints.
     """
-    if instruction not in instruction_map:
+    entry = encoder_table.get(instruction)
+    if entry is None:
         raise ValueError(f"Unknown instruction: {instruction}")
-    
-    info = instruction_map[instruction]
-    opcode = info["opcode"]
-    num_words = info["num_words"]
-    fmt = info["format"]
-    
-    # Word 1 format: opcode(5) | index(2) | dont_care(16) | rdst(3) | rs1(3) | rs2(3)
-    # Initialize all fields to zeros
-    index_bits = "00"
-    rdst = "000"
-    rs1 = "000"
-    rs2 = "000"
-    dont_care = "0" * 16
-    
-    # Encode based on format
-    if fmt == "A":
-        # No operands: NOP, HLT, SETC, RET, RTI
-        pass
-    
-    elif fmt == "B":
-        # Single register: INC, NOT, IN, PUSH
-        rdst = register_map[operands[0]]
-        if instruction == "INC":
-            rs1 = register_map[operands[0]]  # INC uses rs2 as the register to increment
-        if instruction == "NOT":
-            rs1 = register_map[operands[0]]  # NOT uses rs2 as the register to negate
-    
-    elif fmt == "C":
-        # Two registers: MOV Rsrc, Rdst | SWAP Rsrc, Rdst
-        rs1 = register_map[operands[0]]   # Rsrc
-        rdst = register_map[operands[1]]  # Rdst
-        if instruction == "SWAP":
-            rs2=register_map[operands[1]]  # Rdst
-    
-    elif fmt == "D":
-        # Three registers: ADD Rdst, Rsrc1, Rsrc2
-        rdst = register_map[operands[0]]
-        rs1 = register_map[operands[1]]
-        rs2 = register_map[operands[2]]
-    
-    elif fmt == "E":
-        # Register + Immediate: LDM Rdst, Imm
-        rdst = register_map[operands[0]]
-        # Immediate goes in word 2
-    
-    elif fmt == "F":
-        # Two registers + Immediate: IADD Rdst, Rsrc, Imm
-        rdst = register_map[operands[0]]
-        rs1 = register_map[operands[1]]
-        # Immediate goes in word 2
-    
-    elif fmt == "G":
-        # LDD Rdst, offset(Rsrc) -> operands = [Rdst, offset, Rsrc]
-        rdst = register_map[operands[0]]
-        rs1 = register_map[operands[2]]  # Rsrc
-        # Offset goes in word 2
-    
-    elif fmt == "H":
-        # STD Rsrc1, offset(Rsrc2) -> operands = [Rsrc2, offset, Rsrc1]
-        rs2 = register_map[operands[0]]  # Rsrc1 (source data)
-        rs1 = register_map[operands[2]]   # Rsrc2 (base address)
-        # Offset goes in word 2
-    
-    elif fmt == "I":
-        # Jump/Call with address: JZ, JN, JC, JMP, CALL
-        # Address goes in word 2
-        pass
-    
-    elif fmt == "J":
-        # INT index
+    word1, fields, imm_operand, num_words, fmt = entry
+
+    for operand_index, shift in fields:
+        word1 |= register_numbers[operands[operand_index]] << shift
+
+    if fmt == "J":
+        # INT index: index = user_value + 2, stored in bits 26-25
         int_index = int(operands[0])
-        # index = user_value + 2, stored in bits 26-25
-        index_value = int_index + 2
-        index_bits = format(index_value, '02b')
+        if not 0 <= int_index <= 1:
+            raise ValueError(f"INT index must be 0 or 1, got {int_index}")
+        word1 |= (int_index + 2) << INDEX_SHIFT
 
-    elif fmt == "M":
-        # OUT , PUSH : single register operand
-        rs2 = register_map[operands[0]]
-    
-    # Build Word 1
-    word1 = opcode + index_bits + dont_care + rdst + rs1 + rs2
-    
-    result = [word1]
-    
-    # Build Word 2 if needed (immediate/offset/address)
-    if num_words == 2:
-        if fmt == "E":
-            # LDM: immediate is operands[1]
-            imm_value = parse_immediate(operands[1], symbol_table)
-        elif fmt == "F":
-            # IADD: immediate is operands[2]
-            imm_value = parse_immediate(operands[2], symbol_table)
-        elif fmt == "G":
-            # LDD: offset is operands[1]
-            imm_value = parse_immediate(operands[1], symbol_table)
-        elif fmt == "H":
-            # STD: offset is operands[1]
-            imm_value = parse_immediate(operands[1], symbol_table)
-        elif fmt == "I":
-            # Jump/Call: address is operands[0]
-            imm_value = parse_immediate(operands[0], symbol_table)
-        else:
-            imm_value = 0
-        
-        word2 = sign_extend_to_32bit(imm_value)
-        result.append(word2)
-    
-    return result
+    if num_words == 1:
+        return (word1,)
+    if imm_operand is None:
+        return (word1, 0)
+    return (word1, sign_extend_16(parse_immediate(operands[imm_operand], symbol_table)))
+
+
+def encode_instruction(instruction, operands, symbol_table=None):
+    """
+    Encode instruction and operands into binary words.
+    Returns list of 32-bit binary strings.
+    """
+    return [format(word, '032b') for word in encode_words(instruction, operands, symbol_table)]
 
 
 def binary_to_hex(binary_str):
@@ -308,187 +343,595 @@ def binary_to_hex(binary_str):
     return format(int(binary_str, 2), '08X')
 
 
-def pass1_build_symbol_table(lines):
+IMMEDIATE_SOURCE = "  ; immediate/offset"  # listing text for second words
+
+
+class MachineCode:
+    """
+    Encoded program image.
+    Words and their addresses are kept as array('I'); text is only
+    produced when a listing or output file is written.
+    """
+    __slots__ = ("addresses", "words", "origins", "program")
+
+    def __init__(self, program):
+        self.addresses = array('I')   # address of each emitted word
+        self.words = array('I')       # 32-bit machine words, in emission order
+        self.origins = array('i')     # IR index of the source line, -1 for second words
+        self.program = program        # tokenized source (list of SourceLine)
+
+    def __len__(self):
+        return len(self.words)
+
+    def source(self, i):
+        """Source text shown in listings for the i-th emitted word."""
+        origin = self.origins[i]
+        return IMMEDIATE_SOURCE if origin < 0 else self.program[origin].text
+
+    def __iter__(self):
+        """Yield (address, word, source) for each emitted word."""
+        for i in range(len(self.words)):
+            yield self.addresses[i], self.words[i], self.source(i)
+
+
+# Directives that only describe linkage; they take no space (see assemble_object)
+LINKAGE_DIRECTIVES = (".GLOBAL", ".EXTERN")
+
+
+def linkage_names(program, directive):
+    """Names listed by every .GLOBAL or .EXTERN line, in order."""
+    names = []
+    for entry in program:
+        if entry.mnemonic == directive:
+            names.extend(name for name in entry.operands if name not in names)
+    return names
+
+
+def line_size(entry):
+    """Words a tokenized line takes: 0 for a label alone, .ORG and linkage directives, 1 for data."""
+    instruction = entry.mnemonic
+    if instruction is None or instruction == ".ORG" or instruction in LINKAGE_DIRECTIVES:
+        return 0
+    if instruction in instruction_map:
+        return instruction_map[instruction]["num_words"]
+    return 1
+
+
+def org_address(entry, symbol_table):
+    """
+    Address a .ORG line moves to.
+    Raises ValueError naming the line.
+    """
+    operands = entry.operands
+    if not operands:
+        raise ValueError(f"Line {entry.line_num}: .ORG requires an address")
+    try:
+        return parse_immediate(operands[0], symbol_table)
+    except Exception as e:
+        raise ValueError(f"Line {entry.line_num}: Invalid .ORG address: {e}")
+
+
+def data_names(program):
+    """Names a data line may hold: every label, even one defined further down, and every import."""
+    names = {entry.label for entry in program if entry.label}
+    names.update(linkage_names(program, ".EXTERN"))
+    return names
+
+
+def place_line(entry, address, symbol_table, names):
+    """
+    Pass 1 for one line at address: record its label and check that it
+    is an instruction, directive or data word (names as from data_names).
+    Returns: address of the next line
+    Raises ValueError naming the line.
+    """
+    label = entry.label
+    if label:
+        if label in symbol_table:
+            raise ValueError(f"Line {entry.line_num}: Duplicate label '{label}'")
+        symbol_table[label] = address
+    instruction = entry.mnemonic
+    if instruction == ".ORG":
+        return org_address(entry, symbol_table)
+    if (instruction is not None and instruction not in instruction_map
+            and instruction not in LINKAGE_DIRECTIVES and instruction not in names):
+        try:
+            # If it parses as a number, it's data (takes 1 word)
+            parse_immediate(instruction, symbol_table)
+        except:
+            raise ValueError(f"Line {entry.line_num}: Unknown instruction '{instruction}'")
+    return address + line_size(entry)
+
+
+def pass1_build_symbol_table(program):
     """
     First pass: Build symbol table with label addresses.
+    Takes the tokenized program returned by tokenize().
     Returns: symbol_table dict {label: address}
     """
     symbol_table = {}
     current_address = 0
+    names = data_names(program)
     
-    for line_num, line in enumerate(lines, 1):
-        label, instruction, operands = parse_line(line)
-        
-        # If there's a label, record its address
-        if label:
-            if label in symbol_table:
-                raise ValueError(f"Line {line_num}: Duplicate label '{label}'")
-            symbol_table[label] = current_address
-        
-        # Handle .ORG directive
-        if instruction and instruction == ".ORG":
-            if not operands or len(operands) < 1:
-                raise ValueError(f"Line {line_num}: .ORG requires an address")
-            try:
-                new_address = parse_immediate(operands[0], symbol_table)
-                current_address = new_address
-            except Exception as e:
-                raise ValueError(f"Line {line_num}: Invalid .ORG address: {e}")
-            continue
-        
-        # If there's an instruction, advance address
-        if instruction:
-            # Check if it's a raw data value (hex number)
-            if instruction not in instruction_map:
-                # Try to parse as data value
-                try:
-                    # If it parses as a number, it's data (takes 1 word)
-                    parse_immediate(instruction, symbol_table)
-                    current_address += 1
-                    continue
-                except:
-                    raise ValueError(f"Line {line_num}: Unknown instruction '{instruction}'")
-            else:
-                num_words = instruction_map[instruction]["num_words"]
-                current_address += num_words
+    for entry in program:
+        instruction = entry.mnemonic
+        if entry.label is None and instruction in instruction_map:
+            # Plain instruction: the common case, no checks needed
+            current_address += instruction_map[instruction]["num_words"]
+        else:
+            current_address = place_line(entry, current_address, symbol_table, names)
     
     return symbol_table
 
 
-def pass2_generate_code(lines, symbol_table):
+def encode_line(entry, symbol_table, encode=encode_words):
+    """
+    Pass 2 for one line that takes space (see line_size).
+    Returns: tuple of its words
+    Raises ValueError naming the line.
+    """
+    instruction = entry.mnemonic
+    if instruction not in instruction_map:
+        try:
+            # Parse as data value and encode directly
+            data_value = parse_immediate(instruction, symbol_table)
+        except:
+            raise ValueError(f"Line {entry.line_num}: Unknown instruction '{instruction}'")
+        return (sign_extend_16(data_value),)
+    try:
+        return encode(instruction, entry.operands, symbol_table)
+    except Exception as e:
+        raise ValueError(f"Line {entry.line_num}: {e}")
+
+
+def pass2_generate_code(program, symbol_table, stats=None):
     """
     Second pass: Generate machine code.
-    Returns: list of (address, binary_word, hex_word, original_line) tuples
+    Takes the tokenized program returned by tokenize(). With stats (a
+    buildstats.BuildStats), encoding time is recorded separately.
+    Returns: MachineCode with addresses and words as array('I')
     """
-    output = []
+    encode = encode_words if stats is None else stats.timed("encode", encode_words, "pass2")
+    code = MachineCode(program)
+    addresses = code.addresses
+    words = code.words
+    origins = code.origins
     current_address = 0
     
-    for line_num, line in enumerate(lines, 1):
-        label, instruction, operands = parse_line(line)
+    for index, entry in enumerate(program):
+        instruction = entry.mnemonic
         
         # Handle .ORG directive
-        if instruction and instruction == ".ORG":
-            if not operands or len(operands) < 1:
-                raise ValueError(f"Line {line_num}: .ORG requires an address")
-            try:
-                new_address = parse_immediate(operands[0], symbol_table)
-                current_address = new_address
-            except Exception as e:
-                raise ValueError(f"Line {line_num}: Invalid .ORG address: {e}")
+        if instruction == ".ORG":
+            current_address = org_address(entry, symbol_table)
             continue
         
-        if instruction:
-            # Check if it's a raw data value (hex number)
-            if instruction not in instruction_map:
-                try:
-                    # Parse as data value and encode directly
-                    data_value = parse_immediate(instruction, symbol_table)
-                    binary_word = sign_extend_to_32bit(data_value)
-                    hex_word = binary_to_hex(binary_word)
-                    output.append((current_address, binary_word, hex_word, line.strip()))
-                    current_address += 1
-                    continue
-                except:
-                    raise ValueError(f"Line {line_num}: Unknown instruction '{instruction}'")
-            
-            try:
-                words = encode_instruction(instruction, operands, symbol_table)
-                for i, word in enumerate(words):
-                    binary_word = word  # Already 32-bit binary string
-                    hex_word = binary_to_hex(word)
-                    if i == 0:
-                        output.append((current_address, binary_word, hex_word, line.strip()))
-                    else:
-                        output.append((current_address, binary_word, hex_word, "  ; immediate/offset"))
-                    current_address += 1
-            except Exception as e:
-                raise ValueError(f"Line {line_num}: {e}")
-    
-    return output
+        if instruction is None or instruction in LINKAGE_DIRECTIVES:
+            continue
+        
+        encoded = encode_line(entry, symbol_table, encode)
+        addresses.append(current_address)
+        words.append(encoded[0])
+        origins.append(index)
+        current_address += 1
+        if len(encoded) == 2:
+            addresses.append(current_address)
+            words.append(encoded[1])
+            origins.append(-1)
+            current_address += 1
+    
+    return code
 
 
-def assemble_file(input_file, output_file):
+class AssembledImage:
+    """
+    Result of assembling one program.
+    Holds the encoded words and symbol table; listing and output-file
+    text is generated lazily, only when asked for.
+    """
+    __slots__ = ("name", "symbol_table", "code", "schedule", "optimization", "layout",
+                 "branch_profile")
+
+    def __init__(self, name, symbol_table, code, schedule=None, optimization=None, layout=None,
+                 branch_profile=None):
+        self.name = name                    # source name used in file headers
+        self.symbol_table = symbol_table    # {label: address}
+        self.code = code                    # MachineCode
+        self.schedule = schedule            # scheduler report, or None if not scheduled
+        self.optimization = optimization    # optimizer report, or None if not optimized
+        self.layout = layout                # block layout report, or None if not reordered
+        self.branch_profile = branch_profile  # codelayout.BranchCounts the layout used
+
+    def __len__(self):
+        return len(self.code)
+
+    @property
+    def words(self):
+        """Machine words in emission order (array('I'))."""
+        return self.code.words
+
+    @property
+    def addresses(self):
+        """Address of each emitted word (array('I'))."""
+        return self.code.addresses
+
+    def segments(self):
+        """Contiguous runs of words as a list of (base_address, array('I'))."""
+        return memfile.build_segments(self.code.addresses, self.code.words)
+
+    def hex_lines(self):
+        """Yield the lines of the commented _hex.mem file."""
+        yield f"// Machine code generated from: {self.name}\n"
+        yield f"// Total words: {len(self.code)}\n"
+        yield "// Format: ADDR | HEX | Source\n"
+        yield "//\n"
+        for addr, word, original in self.code:
+            yield f"{addr:04d}  {word:08X}  ; {original}\n"
+
+    def symbol_lines(self):
+        """Yield the symbol table as printable lines."""
+        for label, addr in self.symbol_table.items():
+            yield f"  {label}: {addr} (0x{addr:04X})\n"
+
+    def listing(self):
+        """Yield the full 100-column machine-code listing."""
+        yield "=" * 100 + "\n"
+        yield "GENERATED MACHINE CODE\n"
+        yield "=" * 100 + "\n"
+        yield f"{'Addr':<6} {'Binary (32-bit)':<34} {'Hex':<10} {'Source'}\n"
+        yield "-" * 100 + "\n"
+        for addr, word, original in self.code:
+            yield f"{addr:<6} {word:032b} {word:08X}   {original}\n"
+        yield "=" * 100 + "\n"
+
+    def write_mem(self, path, layout="packed"):
+        """Write the binary .mem file (for VHDL/machine) in a memfile layout."""
+        memfile.write_mem(path, self.segments(), layout)
+
+    def write_bin(self, path, header=False):
+        """Write a raw little-endian uint32 image (see memfile.write_bin)."""
+        memfile.write_bin(path, self.segments(), header)
+
+    def write_vhdl(self, path):
+        """Write the ram_image_pkg VHDL package ram.vhd initialises from (see memfile.vhdl_lines)."""
+        memfile.write_vhdl(path, self.segments(), self.name)
+
+    def write_hex(self, path):
+        """Write the hex file with comments (for manual inspection)."""
+        with open(path, 'w') as f:
+            f.writelines(self.hex_lines())
+
+
+def assemble_source(text, name="<source>", schedule=False, optimize=False, stats=None,
+                    reorder=None, train_inputs=()):
+    """
+    Assemble program text without touching the console or the filesystem.
+    With optimize, peephole and dead-code rewrites (see optimizer.py) run
+    before pass 1. With reorder, basic blocks are then laid out so the hot
+    path falls through (see codelayout.py): reorder is a
+    codelayout.BranchCounts, or True to profile the program first on the
+    functional simulator, reading IN values from train_inputs. With
+    schedule, instructions are reordered within basic blocks to hide
+    pipeline hazards (see scheduler.py) between the two passes. stats, a
+    buildstats.BuildStats, receives per-phase timings and program counters.
+    Returns: AssembledImage
+    Raises ValueError on assembly errors.
+    """
+    image, _program, _imports = _assemble(text, name, schedule, optimize, stats=stats,
+                                          reorder=reorder, train_inputs=train_inputs)
+    return image
+
+
+def _assemble(text, name, schedule, optimize, relocatable=False, stats=None, reorder=None,
+              train_inputs=()):
+    """
+    Shared pipeline of assemble_source and assemble_object. With
+    relocatable, .EXTERN symbols encode as 0 (the linker patches them).
+    Returns: (AssembledImage, final program, imports)
+    """
+    phase = nullcontext if stats is None else stats.phase
+    with phase("tokenize"):
+        lines = text.split('\n')
+        program = tokenize(lines)
+    optimization = None
+    if optimize:
+        from optimizer import optimize_program
+        with phase("optimize"):
+            program, optimization = optimize_program(program, relocatable)
+    layout = branch_profile = None
+    if reorder:
+        from codelayout import layout_program, run_profile
+        with phase("reorder"):
+            branch_profile = run_profile(program, train_inputs) if reorder is True else reorder
+            program, layout = layout_program(program, branch_profile)
+    with phase("pass1"):
+        symbol_table = pass1_build_symbol_table(program)
+    report = None
+    if schedule:
+        from scheduler import schedule_program
+        with phase("schedule"):
+            program, report = schedule_program(program, symbol_table)
+    imports = {}
+    if relocatable:
+        for symbol in linkage_names(program, ".EXTERN"):
+            if symbol in symbol_table:
+                raise ValueError(f"Symbol '{symbol}' is both defined and declared .EXTERN")
+            imports[symbol] = 0
+    resolve = {**symbol_table, **imports} if imports else symbol_table
+    with phase("pass2"):
+        code = pass2_generate_code(program, resolve, stats)
+    if stats is not None:
+        stats.count_program(len(lines), program, resolve)
+    image = AssembledImage(name, symbol_table, code, report, optimization, layout, branch_profile)
+    return image, program, imports
+
+
+def assemble_object(text, name="<source>", schedule=False, optimize=False, stats=None):
+    """
+    Assemble program text into a relocatable object (see objfile.py).
+    Lines before the first .ORG form the relocatable section, assembled
+    from address 0; every .ORG starts an absolute section. Each second
+    word or data word holding a symbol gets a relocation record.
+    .GLOBAL names the labels other modules may use, .EXTERN the symbols
+    this module takes from them.
+    stats is as for assemble_source.
+    Returns: (AssembledImage with provisional addresses, objfile.ObjectModule)
+    Raises ValueError on assembly errors.
+    """
+    image, program, imports = _assemble(text, name, schedule, optimize, relocatable=True,
+                                        stats=stats)
+    symbol_table = image.symbol_table
+    exports = linkage_names(program, ".GLOBAL")
+    for symbol in exports:
+        if symbol not in symbol_table:
+            raise ValueError(f"Exported symbol '{symbol}' is not defined")
+
+    # Section of every program line: each .ORG opens one for the lines after it
+    sections = [objfile.Section(None, array('I'), [])]
+    section_of = []
+    for entry in program:
+        section_of.append(len(sections) - 1)
+        if entry.mnemonic == ".ORG":
+            org = parse_immediate(entry.operands[0], symbol_table)
+            sections.append(objfile.Section(org, array('I'), []))
+
+    code = image.code
+    for i, word in enumerate(code.words):
+        origin = code.origins[i]
+        index = origin if origin >= 0 else code.origins[i - 1]
+        entry = program[index]
+        section = sections[section_of[index]]
+        symbol = None
+        if origin >= 0:
+            if entry.mnemonic not in instruction_map:
+                symbol = entry.mnemonic                     # data word
+        else:
+            operand = encoder_table[entry.mnemonic][2]
+            if operand is not None:
+                symbol = entry.operands[operand]            # second word
+        if symbol in symbol_table or symbol in imports:
+            section.relocations.append((len(section.words), symbol))
+        section.words.append(word)
+
+    symbols = {}
+    for index, entry in enumerate(program):
+        if entry.label:
+            section = section_of[index]
+            symbols[entry.label] = (section, symbol_table[entry.label] - (sections[section].org or 0))
+    module = objfile.ObjectModule(name, sections, symbols, exports, list(imports))
+    return image, module
+
+
+def output_paths(output_file, fmt="mem"):
+    """Return (image_file, hex_file) paths derived from output_file."""
+    base_name = output_file.rsplit('.', 1)[0]
+    return base_name + "." + fmt, base_name + "_hex.mem"
+
+
+def assemble_file(input_file, output_file, quiet=False, listing=None, layout="packed",
+                  fmt="mem", bin_header=False, symbols=None, schedule=False, optimize=False,
+                  stats=None, reorder=None, train_inputs=()):
     """
     Assemble an input file and write to output files.
     Creates two files:
-    - output_file.mem: Binary only (for VHDL/machine)
-    - output_file_hex.mem: Hex with comments (for manual inspection)
+    - output_file.mem: Binary only (for VHDL/machine), in the given
+      memfile layout (packed, dense or sparse); with fmt="bin" this is
+      output_file.bin, a raw little-endian uint32 image instead, with
+      fmt="vhd" output_file.vhd, the ram_image_pkg package ram.vhd
+      initialises from, and with fmt="obj" output_file.obj, a
+      relocatable object for linker.py
+    - output_file_hex.mem: Hex with comments (for manual inspection;
+      relocatable code is shown from address 0)
+    The full machine-code listing is only produced when listing is a
+    path, or '-' for stdout. symbols, if given, is a path to write the
+    symbol table to (read back by disassembler.py). optimize applies the
+    peephole and dead-code rewrites, reorder and train_inputs lay basic
+    blocks out by a branch profile (as for assemble_source) and schedule
+    reorders instructions to hide pipeline hazards; each prints what it
+    saved. reorder is not supported with fmt="obj". stats, a
+    buildstats.BuildStats, also times reading the source and every
+    output writer. quiet suppresses all console output.
+    Returns: AssembledImage
     """
-    # Read input file
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
-    
-    print(f"Assembling: {input_file}")
-    print("=" * 60)
-    
-    # Pass 1: Build symbol table
-    print("Pass 1: Building symbol table...")
-    symbol_table = pass1_build_symbol_table(lines)
+    phase = nullcontext if stats is None else stats.phase
+    if stats is not None:
+        stats.source = input_file
+    with phase("read"):
+        with open(input_file, 'r') as f:
+            text = f.read()
+    
+    if not quiet:
+        print(f"Assembling: {input_file}")
+        print("=" * 60)
+    
+    if fmt == "obj":
+        image, module = assemble_object(text, input_file, schedule, optimize, stats)
+    else:
+        image = assemble_source(text, input_file, schedule, optimize, stats, reorder, train_inputs)
+    
+    binary_file, hex_file = output_paths(output_file, fmt)
+    with phase(f"write_{fmt}"):
+        if fmt == "bin":
+            image.write_bin(binary_file, bin_header)
+        elif fmt == "obj":
+            objfile.write_object(binary_file, module)
+        elif fmt == "vhd":
+            image.write_vhdl(binary_file)
+        else:
+            image.write_mem(binary_file, layout)
+    with phase("write_hex"):
+        image.write_hex(hex_file)
+    
+    if not quiet:
+        if image.symbol_table:
+            print("\nSymbol Table:")
+            print("-" * 30)
+            sys.stdout.writelines(image.symbol_lines())
+            print()
+        if image.optimization is not None:
+            from optimizer import report_lines
+            print("Optimization (-O):")
+            print("-" * 30)
+            sys.stdout.writelines(report_lines(image.optimization))
+            print()
+        if image.layout is not None:
+            from codelayout import report_lines
+            print("Block order (profile-guided):")
+            print("-" * 30)
+            sys.stdout.writelines(report_lines(image.layout, image.branch_profile))
+            print()
+        if image.schedule is not None:
+            from scheduler import report_lines
+            print("Schedule (estimated stall cycles per block):")
+            print("-" * 30)
+            sys.stdout.writelines(report_lines(image.schedule))
+            print()
+        print("Output files:")
+        if fmt == "obj":
+            print(f"  Object (for linker.py): {binary_file}")
+        elif fmt == "vhd":
+            print(f"  VHDL package (for ram.vhd): {binary_file}")
+        else:
+            print(f"  Binary (for machine): {binary_file}")
+        print(f"  Hex (for inspection): {hex_file}")
+        print(f"Total instructions: {len(image)} words")
     
-    if symbol_table:
-        print("\nSymbol Table:")
-        print("-" * 30)
-        for label, addr in symbol_table.items():
-            print(f"  {label}: {addr} (0x{addr:04X})")
+    if listing == "-":
         print()
-    
-    # Pass 2: Generate code
-    print("Pass 2: Generating machine code...")
-    output = pass2_generate_code(lines, symbol_table)
-    
-    # Generate output file names
-    base_name = output_file.rsplit('.', 1)[0]
-    binary_file = base_name + ".mem"
-    hex_file = base_name + "_hex.mem"
-    
-    # Write binary file - ONLY binary, no comments (for VHDL/machine)
-    with open(binary_file, 'w') as f:
-        for addr, binary_word, hex_word, original in output:
-            f.write(f"{binary_word}\n")
-    
-    # Write hex file - with comments (for manual inspection)
-    with open(hex_file, 'w') as f:
-        f.write(f"// Machine code generated from: {input_file}\n")
-        f.write(f"// Total words: {len(output)}\n")
-        f.write(f"// Format: ADDR | HEX | Source\n")
-        f.write("//\n")
-        for addr, binary_word, hex_word, original in output:
-            f.write(f"{addr:04d}  {hex_word}  ; {original}\n")
-    
-    print(f"\nOutput files:")
-    print(f"  Binary (for machine): {binary_file}")
-    print(f"  Hex (for inspection): {hex_file}")
-    print(f"Total instructions: {len(output)} words")
-    
-    # Print output for verification (console still shows full details)
-    print("\n" + "=" * 100)
-    print("GENERATED MACHINE CODE")
-    print("=" * 100)
-    print(f"{'Addr':<6} {'Binary (32-bit)':<34} {'Hex':<10} {'Source'}")
-    print("-" * 100)
-    for addr, binary_word, hex_word, original in output:
-        print(f"{addr:<6} {binary_word} {hex_word:<10} {original}")
-    print("=" * 100)
+        with phase("write_listing"):
+            sys.stdout.writelines(image.listing())
+    elif listing:
+        with phase("write_listing"):
+            with open(listing, 'w') as f:
+                f.writelines(image.listing())
+        if not quiet:
+            print(f"  Listing: {listing}")
+    
+    if symbols:
+        with phase("write_symbols"):
+            with open(symbols, 'w') as f:
+                f.writelines(image.symbol_lines())
+        if not quiet:
+            print(f"  Symbols: {symbols}")
+    
+    return image
 
 
 def main():
-    import sys
-    
-    if len(sys.argv) >= 3:
-        # Command line usage: python assembler.py input.asm output.mem
-        input_file = sys.argv[1]
-        output_file = sys.argv[2]
-        assemble_file(input_file, output_file)
-    
-    elif len(sys.argv) == 2:
-        # Single argument: input file, output defaults to input.mem
-        input_file = sys.argv[1]
-        output_file = input_file.rsplit('.', 1)[0] + ".mem"
-        assemble_file(input_file, output_file)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Assembler for the 32-bit pipelined processor")
+    parser.add_argument("input", nargs="?", help="input .asm file (omit to run the built-in test)")
+    parser.add_argument("output", nargs="?", help="output .mem file (default: input with .mem)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no console output")
+    parser.add_argument("--listing", metavar="FILE",
+                        help="write the full machine-code listing to FILE ('-' for stdout)")
+    parser.add_argument("--symbols", metavar="FILE", help="write the symbol table to FILE")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="peephole and dead-code rewrites (redundant MOV/NOP/JMP, unreachable code)")
+    parser.add_argument("--schedule", action="store_true",
+                        help="reorder instructions within basic blocks to hide pipeline hazards")
+    parser.add_argument("--reorder-blocks", nargs="?", const=True, default=None, metavar="PROFILE",
+                        help="lay basic blocks out so the hot path falls through, by a "
+                             "'profiler.py --json' PROFILE of the same build, or by a run of the "
+                             "program on the functional simulator if none is given")
+    parser.add_argument("--train-in", dest="train_inputs", type=lambda s: int(s, 0), nargs="*",
+                        default=[], metavar="V",
+                        help="with --reorder-blocks and no PROFILE: IN port values for the run")
+    parser.add_argument("--layout", choices=memfile.LAYOUTS, default="packed",
+                        help="packed: emission order (default); dense: zero-padded to .ORG "
+                             "addresses; sparse: @address records")
+    parser.add_argument("--format", choices=("mem", "bin", "vhd", "obj"), default="mem", dest="fmt",
+                        help="mem: binary text (default); bin: raw little-endian uint32 image; "
+                             "vhd: ram_image_pkg constants for ram.vhd (no textio); "
+                             "obj: relocatable object for linker.py")
+    parser.add_argument("--bin-header", action="store_true",
+                        help="with --format bin: add the segment-table header")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write per-phase timings and program counters as JSON ('-' for stdout)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile, write the profile to FILE and print the hottest functions")
+    parser.add_argument("--stream", action="store_true",
+                        help="single pass, writing the image as the source is read (packed or dense "
+                             ".mem, or .bin without header; no _hex.mem)")
+    args = parser.parse_args()
+    
+    if args.input:
+        # Command line usage: python assembler.py input.asm [output.mem]
+        output_file = args.output or args.input.rsplit('.', 1)[0] + ".mem"
+        if args.stream:
+            unsupported = [flag for flag, used in (("-O", args.optimize), ("--schedule", args.schedule),
+                                                   ("--reorder-blocks", args.reorder_blocks),
+                                                   ("--listing", args.listing), ("--stats", args.stats),
+                                                   ("--bin-header", args.bin_header),
+                                                   ("--format obj", args.fmt == "obj"),
+                                                   ("--format vhd", args.fmt == "vhd"),
+                                                   ("--layout sparse", args.layout == "sparse"))
+                           if used]
+            if unsupported:
+                parser.error(f"--stream does not support {', '.join(unsupported)}")
+        if args.reorder_blocks and args.fmt == "obj":
+            parser.error("--reorder-blocks needs the whole program (not supported with --format obj)")
+        reorder = args.reorder_blocks
+        if isinstance(reorder, str):
+            from codelayout import load_profile
+            try:
+                reorder = load_profile(reorder)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        stats = None
+        if args.stats:
+            from buildstats import BuildStats
+            stats = BuildStats()
+        profiler = None
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if args.stream:
+            from streaming import stream_file
+            stream_file(args.input, output_paths(output_file, args.fmt)[0], quiet=args.quiet,
+                        layout=args.layout, fmt=args.fmt, symbols=args.symbols)
+        else:
+            assemble_file(args.input, output_file, quiet=args.quiet, listing=args.listing,
+                          layout=args.layout, fmt=args.fmt, bin_header=args.bin_header,
+                          symbols=args.symbols, schedule=args.schedule,
+                          optimize=args.optimize, stats=stats, reorder=reorder,
+                          train_inputs=args.train_inputs)
+        if profiler is not None:
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            if not args.quiet:
+                print(f"\nProfile ({args.profile}), hottest functions by own time:")
+                pstats.Stats(profiler, stream=sys.stdout).sort_stats("tottime").print_stats(15)
+        if stats is not None:
+            stats.write_json(args.stats)
     
     else:
         # No arguments: run test
-        print("Usage: python assembler.py <input.asm> [output.mem]")
+        print("Usage: python assembler.py <input.asm> [output.mem] [--quiet] [--listing FILE] [--symbols FILE] [-O] [--reorder-blocks [PROFILE]] [--train-in V ...] [--schedule] [--layout L] [--format F] [--stats FILE] [--profile FILE] [--stream]")
         print("\nRunning built-in test...\n")
         
         # Test with inline assembly
@@ -506,24 +949,15 @@ END:    OUT R1          ; Output result
         HLT             ; Halt
 """
         
-        lines = test_code.strip().split('\n')
+        image = assemble_source(test_code.strip())
         
-        # Pass 1
-        symbol_table = pass1_build_symbol_table(lines)
         print("Symbol Table:")
-        for label, addr in symbol_table.items():
+        for label, addr in image.symbol_table.items():
             print(f"  {label}: {addr}")
         print()
         
-        # Pass 2
-        output = pass2_generate_code(lines, symbol_table)
-        
-        print("Generated Code:")
-        print(f"{'Addr':<6} {'Binary (32-bit)':<34} {'Hex':<10} {'Source'}")
-        print("-" * 90)
-        for addr, binary_word, hex_word, original in output:
-            print(f"{addr:<6} {binary_word} {hex_word:<10} {original}")
+        sys.stdout.writelines(image.listing())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,220 @@
+"""
+Batch assembly of many .asm files across a process pool.
+Keeps an on-disk cache keyed by a hash of the source, the output options
+and the assembler's own code (every module in BUILD_MODULES), so
+unchanged files with intact outputs are skipped and any change to the
+assembler rebuilds everything.
+
+Usage: python batch.py <file.asm|dir> [...] [-o OUTDIR] [-j JOBS]
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import memfile
+from assembler import ASSEMBLER_VERSION, assemble_file, output_paths
+
+
+DEFAULT_CACHE = ".asm_build_cache.json"
+
+# Modules whose code decides what assemble_file writes (-O, scheduling and
+# block layout included, with the simulator the layout's training run uses)
+BUILD_MODULES = ("assembler", "memfile", "objfile", "optimizer", "scheduler", "codelayout",
+                 "profiler", "simulator")
+
+_code_digest = None
+
+
+def collect_jobs(paths, output_dir=None):
+    """
+    Expand files/directories into (input_file, output_file) pairs.
+    Directories are searched recursively for .asm files. With output_dir,
+    outputs mirror the layout below each directory argument.
+    """
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, _dirs, files in os.walk(path):
+                for name in files:
+                    if name.lower().endswith(".asm"):
+                        found.append(os.path.join(root, name))
+            sources = [(src, os.path.relpath(src, path)) for src in sorted(found)]
+        else:
+            sources = [(path, os.path.basename(path))]
+        for src, rel in sources:
+            base = rel.rsplit('.', 1)[0] + ".mem"
+            if output_dir:
+                out = os.path.join(output_dir, base)
+            else:
+                out = src.rsplit('.', 1)[0] + ".mem"
+            jobs.append((src, out))
+    return jobs
+
+
+def code_digest():
+    """
+    SHA-256 of the source of BUILD_MODULES (read once per process), so
+    cached outputs never outlive a change to the assembler.
+    """
+    global _code_digest
+    if _code_digest is None:
+        import importlib.util
+
+        digest = hashlib.sha256()
+        for name in BUILD_MODULES:
+            spec = importlib.util.find_spec(name)
+            if spec is None or not spec.origin:
+                raise ValueError(f"Cannot find the source of module '{name}'")
+            with open(spec.origin, 'rb') as f:
+                digest.update(name.encode() + b"\0" + f.read() + b"\0")
+        _code_digest = digest.hexdigest()
+    return _code_digest
+
+
+def source_key(data, options):
+    """Cache key for source bytes under the assembler's code and the output options."""
+    digest = hashlib.sha256()
+    digest.update(ASSEMBLER_VERSION.encode())
+    digest.update(code_digest().encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def output_stamp(output_file, options):
+    """(size, mtime_ns) of both outputs, or None if either is missing."""
+    stamp = []
+    for path in output_paths(output_file, options.get("fmt", "mem")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp.extend((st.st_size, st.st_mtime_ns))
+    return stamp
+
+
+def load_cache(cache_file):
+    """Load the cache dict, or an empty one if missing or unreadable."""
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(cache_file, cache):
+    """Write the cache atomically."""
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, cache_file)
+
+
+def assemble_job(input_file, output_file, options):
+    """
+    Worker: assemble one file quietly; options are assemble_file keywords.
+    Returns: (seconds, word_count, error_message or None)
+    """
+    start = time.perf_counter()
+    try:
+        out_dir = os.path.dirname(output_file)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        image = assemble_file(input_file, output_file, quiet=True, **options)
+    except Exception as e:
+        return time.perf_counter() - start, 0, f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, len(image), None
+
+
+def run_batch(jobs, cache_file=DEFAULT_CACHE, workers=None, force=False, options=None):
+    """
+    Assemble jobs in parallel, skipping cache hits.
+    options are extra assemble_file keywords (layout, fmt, bin_header).
+    Returns: list of (input_file, status, seconds, words, error) with
+    status one of 'cached', 'built', 'failed'.
+    """
+    options = options or {}
+    cache = {} if force else load_cache(cache_file)
+    results = {}
+    pending = []
+
+    for input_file, output_file in jobs:
+        with open(input_file, 'rb') as f:
+            key = source_key(f.read(), options)
+        entry = cache.get(os.path.abspath(output_file))
+        if entry and entry.get("key") == key and entry.get("stamp") == output_stamp(output_file, options):
+            results[input_file] = (input_file, "cached", 0.0, entry.get("words", 0), None)
+        else:
+            pending.append((input_file, output_file, key))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(job, pool.submit(assemble_job, job[0], job[1], options)) for job in pending]
+            for (input_file, output_file, key), future in futures:
+                seconds, words, error = future.result()
+                cache_id = os.path.abspath(output_file)
+                if error:
+                    cache.pop(cache_id, None)
+                    results[input_file] = (input_file, "failed", seconds, 0, error)
+                else:
+                    cache[cache_id] = {"key": key, "stamp": output_stamp(output_file, options), "words": words}
+                    results[input_file] = (input_file, "built", seconds, words, None)
+
+    save_cache(cache_file, cache)
+    return [results[input_file] for input_file, _ in jobs]
+
+
+def print_report(results, elapsed):
+    """Print per-file timings and the cache hit rate."""
+    print("=" * 70)
+    print("BATCH ASSEMBLY REPORT")
+    print("=" * 70)
+    print(f"{'Status':<8} {'Time':>10} {'Words':>7}  File")
+    print("-" * 70)
+    for input_file, status, seconds, words, error in results:
+        print(f"{status:<8} {seconds * 1000:>8.1f}ms {words:>7}  {input_file}")
+        if error:
+            print(f"{'':<28}{error}")
+    print("-" * 70)
+    total = len(results)
+    hits = sum(1 for r in results if r[1] == "cached")
+    failed = sum(1 for r in results if r[1] == "failed")
+    rate = 100.0 * hits / total if total else 0.0
+    print(f"Files: {total}  Built: {total - hits - failed}  Cached: {hits}  Failed: {failed}")
+    print(f"Cache hit rate: {rate:.1f}%")
+    print(f"Wall time: {elapsed * 1000:.1f}ms")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Assemble many .asm files in parallel with a build cache")
+    parser.add_argument("paths", nargs="+", help=".asm files or directories (searched recursively)")
+    parser.add_argument("-o", "--output-dir", help="write outputs here instead of next to each source")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--force", action="store_true", help="ignore the cache and rebuild everything")
+    parser.add_argument("--layout", choices=memfile.LAYOUTS, default="packed", help=".mem layout")
+    parser.add_argument("--format", choices=("mem", "bin", "vhd", "obj"), default="mem", dest="fmt",
+                        help="image format (obj: relocatable objects for linker.py)")
+    parser.add_argument("--bin-header", action="store_true", help="with --format bin: add the header")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    jobs = collect_jobs(args.paths, args.output_dir)
+    options = {"layout": args.layout, "fmt": args.fmt, "bin_header": args.bin_header}
+    results = run_batch(jobs, args.cache, args.jobs, args.force, options)
+    print_report(results, time.perf_counter() - start)
+    sys.exit(1 if any(r[1] == "failed" for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Benchmark for the assembler front end.
+Compares the old double parse (parse_line in both passes) against
+tokenizing once into the shared IR, and the binary-string encoder
+against the integer encoder.
+
+With --suite, times every phase of the assembler (tokenize, pass 1,
+pass 2 and writing the .mem and _hex.mem files) and the peak memory of a
+whole build on generated programs from 1k words up to the full RAM:
+
+- formats: every instruction, so every format A-M
+- labels:  a label on every line, branches and loads naming labels
+- org:     16-word .ORG sections placed in scrambled address order
+- data:    raw data words (hex, decimal, negative, label names)
+
+--json writes the results as a baseline; --baseline compares a run with
+one and exits with status 1 if any phase got slower (or used more
+memory) than --tolerance allows.
+
+Usage: python benchmark.py [--lines N ...] | --suite [--sizes N ...] [--programs P ...] [--json FILE] [--baseline FILE]
+"""
+
+import random
+import time
+
+from assembler import (parse_line, parse_immediate, tokenize, pass1_build_symbol_table,
+                       pass2_generate_code, encode_words, binary_to_hex, AssembledImage,
+                       instruction_map, register_map, ASSEMBLER_VERSION)
+from simulator import MEMORY_DEPTH
+
+
+# Instruction mix used for synthetic programs (one entry per line)
+SAMPLE_LINES = [
+    "        LDM R0, 0x10        ; load constant",
+    "        IADD R1, R0, -5     ; add immediate",
+    "        ADD R2, R1, R0      ; three registers",
+    "        LDD R3, 4(R2)       ; load with offset",
+    "        STD R3, 8(R2)       ; store with offset",
+    "        MOV R3, R4",
+    "        PUSH R4",
+    "        POP R5",
+    "        JZ L{n}             # forward branch",
+    "L{n}:   OUT R5",
+]
+
+
+def generate_program(num_lines):
+    """Generate a synthetic program with roughly num_lines lines."""
+    lines = []
+    n = 0
+    while len(lines) < num_lines:
+        for template in SAMPLE_LINES:
+            lines.append(template.format(n=n) + "\n")
+        n += 1
+    return lines[:num_lines] + ["        HLT\n"]
+
+
+# One line per instruction, so every format A-M (operands filled in per use)
+FORMAT_LINES = [
+    "NOP", "HLT", "SETC", "RET", "RTI",                     # A
+    "INC R{a}", "NOT R{b}", "IN R{a}", "POP R{b}",          # B
+    "MOV R{a}, R{b}", "SWAP R{b}, R{a}",                    # C
+    "ADD R{a}, R{b}, R{c}", "SUB R{c}, R{a}, R{b}", "AND R{b}, R{c}, R{a}",  # D
+    "LDM R{a}, 0x{imm:X}",                                  # E
+    "IADD R{b}, R{a}, {imm}",                               # F
+    "LDD R{c}, {imm}(R{a})",                                # G
+    "STD R{a}, {imm}(R{b})",                                # H
+    "JZ F{n}", "JN F{n}", "JC F{n}", "JMP F{n}", "CALL F{n}",  # I
+    "INT {index}",                                          # J
+    "OUT R{c}", "PUSH R{a}",                                # M
+]
+
+BENCH_PROGRAMS = ("formats", "labels", "org", "data")
+
+BENCH_SIZES = (1024, 4096, 16384, 65536, MEMORY_DEPTH)     # words, up to the full RAM
+
+PHASES = ("parse", "pass1", "pass2", "emit")
+
+
+def _words(line):
+    """Words a generated line assembles to."""
+    _label, name, _operands = parse_line(line)
+    if name is None or name == ".ORG":
+        return 0
+    return instruction_map[name]["num_words"] if name in instruction_map else 1
+
+
+def _fill(num_words, next_line):
+    """Collect lines from next_line(n) until they assemble to num_words words."""
+    lines = []
+    words = 0
+    n = 0
+    while words < num_words:
+        line = next_line(n)
+        size = _words(line)
+        if words + size > num_words:
+            line, size = "        NOP", 1
+        lines.append(line + "\n")
+        words += size
+        n += 1
+    return lines
+
+
+def generate_formats(num_words):
+    """Every instruction in turn, with a label every 32 lines for the jumps to name."""
+    rng = random.Random(num_words)
+
+    def line(n):
+        template = FORMAT_LINES[n % len(FORMAT_LINES)]
+        text = template.format(a=rng.randrange(8), b=rng.randrange(8), c=rng.randrange(8),
+                               imm=rng.randrange(0x7FFF), index=n & 1, n=n // 32)
+        return f"F{n // 32}:  {text}" if n % 32 == 0 else f"        {text}"
+
+    return _fill(num_words, line)
+
+
+def generate_labels(num_words):
+    """A label on every line; branches, calls and LDMs name labels behind and ahead."""
+    rng = random.Random(num_words)
+    count = num_words // 2
+
+    def line(n):
+        target = min(max(n + rng.randrange(-64, 64), 0), count - 1)
+        choice = n % 4
+        if choice == 0:
+            text = f"JZ L{target}"
+        elif choice == 1:
+            text = f"LDM R{n % 8}, L{target}"
+        elif choice == 2:
+            text = f"CALL L{target}"
+        else:
+            text = f"ADD R{n % 8}, R{(n + 1) % 8}, R{(n + 2) % 8}"
+        return f"L{n}: {text}"
+
+    return _fill(num_words, line)
+
+
+def generate_org(num_words):
+    """16-word sections, each behind its own .ORG, in scrambled address order."""
+    sections = list(range(0, num_words, 16))
+    random.Random(num_words).shuffle(sections)
+    lines = []
+    for base in sections:
+        lines.append(f"        .ORG 0x{base:X}\n")
+        size = min(16, num_words - base)
+        lines.extend(_fill(size, lambda n: "        LDM R1, 0x10" if n % 3 == 0 and n < size - 2
+                           else f"        INC R{n % 8}"))
+    return lines
+
+
+def generate_data(num_words):
+    """Raw data words in every spelling, between labelled instructions."""
+    rng = random.Random(num_words)
+
+    def line(n):
+        choice = n % 8
+        if choice == 0:
+            return f"D{n}:  LDM R0, D{n}"
+        if choice < 3:
+            return f"        0x{rng.randrange(0x10000):04X}"
+        if choice < 5:
+            return f"        {rng.randrange(-32768, 32768)}"
+        if choice == 5:
+            return f"        {rng.randrange(0x10000):X}"
+        return f"        D{n - choice}"
+
+    return _fill(num_words, line)
+
+
+GENERATORS = {
+    "formats": generate_formats,
+    "labels": generate_labels,
+    "org": generate_org,
+    "data": generate_data,
+}
+
+
+def best_of(func, repeat):
+    """Run func repeat times and return the fastest wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_parse(num_lines, repeat=5):
+    """
+    Time the front end both ways on a synthetic program.
+    Returns: (double_parse_seconds, tokenize_once_seconds)
+    """
+    lines = generate_program(num_lines)
+
+    def double_parse():
+        # What the passes did before the IR: parse every line twice
+        for _ in range(2):
+            for line in lines:
+                parse_line(line)
+
+    def tokenize_once():
+        tokenize(lines)
+
+    return best_of(double_parse, repeat), best_of(tokenize_once, repeat)
+
+
+def _string_sign_extend(value):
+    """The original sign_extend_to_32bit: a 16-bit value as a 32-character binary string."""
+    if value < 0:
+        value = value & 0xFFFF
+    if value & 0x8000:
+        extended = value | 0xFFFF0000
+    else:
+        extended = value & 0x0000FFFF
+    return format(extended & 0xFFFFFFFF, '032b')
+
+
+def _string_encode(instruction, operands, symbol_table=None):
+    """
+    The original encoder, kept as the reference for bench_encode: builds
+    each word by concatenating '0'/'1' field strings.
+    Returns: list of 32-bit binary strings
+    """
+    if instruction not in instruction_map:
+        raise ValueError(f"Unknown instruction: {instruction}")
+
+    info = instruction_map[instruction]
+    opcode = info["opcode"]
+    num_words = info["num_words"]
+    fmt = info["format"]
+
+    index_bits = "00"
+    rdst = "000"
+    rs1 = "000"
+    rs2 = "000"
+    dont_care = "0" * 16
+
+    if fmt == "B":
+        rdst = register_map[operands[0]]
+        if instruction == "INC":
+            rs1 = register_map[operands[0]]
+        if instruction == "NOT":
+            rs1 = register_map[operands[0]]
+    elif fmt == "C":
+        rs1 = register_map[operands[0]]
+        rdst = register_map[operands[1]]
+        if instruction == "SWAP":
+            rs2 = register_map[operands[1]]
+    elif fmt == "D":
+        rdst = register_map[operands[0]]
+        rs1 = register_map[operands[1]]
+        rs2 = register_map[operands[2]]
+    elif fmt == "E":
+        rdst = register_map[operands[0]]
+    elif fmt == "F":
+        rdst = register_map[operands[0]]
+        rs1 = register_map[operands[1]]
+    elif fmt == "G":
+        rdst = register_map[operands[0]]
+        rs1 = register_map[operands[2]]
+    elif fmt == "H":
+        rs2 = register_map[operands[0]]
+        rs1 = register_map[operands[2]]
+    elif fmt == "J":
+        index_bits = format(int(operands[0]) + 2, '02b')
+    elif fmt == "M":
+        rs2 = register_map[operands[0]]
+
+    result = [opcode + index_bits + dont_care + rdst + rs1 + rs2]
+    if num_words == 2:
+        if fmt == "E":
+            imm_value = parse_immediate(operands[1], symbol_table)
+        elif fmt == "F":
+            imm_value = parse_immediate(operands[2], symbol_table)
+        elif fmt in ("G", "H"):
+            imm_value = parse_immediate(operands[1], symbol_table)
+        elif fmt == "I":
+            imm_value = parse_immediate(operands[0], symbol_table)
+        else:
+            imm_value = 0
+        result.append(_string_sign_extend(imm_value))
+    return result
+
+
+def bench_encode(num_lines, repeat=5):
+    """
+    Time encoding every instruction of a synthetic program both ways.
+    Returns: (string_encoder_seconds, integer_encoder_seconds)
+    """
+    program = tokenize(generate_program(num_lines))
+    symbol_table = pass1_build_symbol_table(program)
+    instructions = [(e.mnemonic, e.operands) for e in program if e.mnemonic]
+
+    def encode_strings():
+        # Old path: '0'/'1' strings, then int(..., 2) for the hex column
+        for mnemonic, operands in instructions:
+            for word in _string_encode(mnemonic, operands, symbol_table):
+                binary_to_hex(word)
+
+    def encode_ints():
+        for mnemonic, operands in instructions:
+            encode_words(mnemonic, operands, symbol_table)
+
+    return best_of(encode_strings, repeat), best_of(encode_ints, repeat)
+
+
+def bench_passes(num_lines, repeat=5):
+    """Time tokenize + pass 1 + pass 2 on a synthetic program."""
+    lines = generate_program(num_lines)
+
+    def run():
+        program = tokenize(lines)
+        symbol_table = pass1_build_symbol_table(program)
+        pass2_generate_code(program, symbol_table)
+
+    return best_of(run, repeat)
+
+
+def _phase_times(lines, mem_file, hex_file, repeat):
+    """Best time of each phase on one program. Returns: dict with lines, words and seconds per phase"""
+    program = tokenize(lines)
+    symbol_table = pass1_build_symbol_table(program)
+    code = pass2_generate_code(program, symbol_table)
+    image = AssembledImage("<benchmark>", symbol_table, code)
+
+    def emit():
+        image.write_mem(mem_file)
+        image.write_hex(hex_file)
+
+    return {
+        "lines": len(lines),
+        "words": len(code),
+        "parse": best_of(lambda: tokenize(lines), repeat),
+        "pass1": best_of(lambda: pass1_build_symbol_table(program), repeat),
+        "pass2": best_of(lambda: pass2_generate_code(program, symbol_table), repeat),
+        "emit": best_of(emit, repeat),
+    }
+
+
+def bench_program(lines, repeat=3):
+    """
+    Time each assembler phase on one program and measure the peak memory
+    of a whole build (tracemalloc, so Python allocations only).
+    Returns: dict with lines, words, seconds per phase and peak_bytes
+    """
+    import os
+    import tempfile
+    import tracemalloc
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mem_file = os.path.join(tmp, "bench.mem")
+        hex_file = os.path.join(tmp, "bench_hex.mem")
+        # The timed build is released when the helper returns, before the peak is traced
+        result = _phase_times(lines, mem_file, hex_file, repeat)
+
+        tracemalloc.start()
+        build = tokenize(lines)
+        table = pass1_build_symbol_table(build)
+        AssembledImage("<benchmark>", table, pass2_generate_code(build, table)).write_mem(mem_file)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_suite(programs=BENCH_PROGRAMS, sizes=BENCH_SIZES, repeat=3):
+    """
+    Benchmark every generated program at every size.
+    Returns: dict with the run's metadata and results keyed by
+    'program/words'
+    """
+    import platform
+
+    results = {}
+    for name in programs:
+        for size in sizes:
+            results[f"{name}/{size}"] = bench_program(GENERATORS[name](size), repeat)
+    return {
+        "assembler_version": ASSEMBLER_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_to_baseline(suite, baseline, tolerance=0.2):
+    """
+    Compare a run with a baseline, phase by phase and for peak memory.
+    Returns: list of (key, metric, baseline value, new value, ratio,
+    regressed) for every metric both runs measured
+    """
+    rows = []
+    for key, result in suite["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if old is None:
+            continue
+        for metric in PHASES + ("peak_bytes",):
+            if metric in old and old[metric]:
+                ratio = result[metric] / old[metric]
+                rows.append((key, metric, old[metric], result[metric], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def print_suite(suite):
+    """Print per-phase throughput and peak memory of a suite run."""
+    print("=" * 70)
+    print("ASSEMBLER BENCHMARK SUITE (throughput in thousand words/s)")
+    print("=" * 70)
+    print(f"{'Program':<16} {'Words':>7} {'Parse':>8} {'Pass 1':>8} {'Pass 2':>8} {'Emit':>8} {'Peak MB':>8}")
+    print("-" * 70)
+    for key, result in suite["results"].items():
+        rates = [result["words"] / result[phase] / 1000 if result[phase] else 0.0 for phase in PHASES]
+        print(f"{key.split('/')[0]:<16} {result['words']:>7} "
+              + " ".join(f"{rate:>8.0f}" for rate in rates)
+              + f" {result['peak_bytes'] / (1 << 20):>8.1f}")
+    print("=" * 70)
+
+
+def print_comparison(rows, tolerance):
+    """Print a baseline comparison; regressions are marked."""
+    print(f"Baseline comparison (tolerance {tolerance:.0%}):")
+    print("-" * 70)
+    for key, metric, old, new, ratio, regressed in rows:
+        mark = "REGRESSION" if regressed else ""
+        print(f"  {key:<16} {metric:<11} {ratio:>6.2f}x  {mark}")
+    regressions = sum(1 for row in rows if row[5])
+    print(f"Regressions: {regressions} of {len(rows)} measurements")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Assembler front-end benchmark")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="program sizes to benchmark (source lines)")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help="runs per measurement (best is kept; default: 5, 3 with --suite)")
+    parser.add_argument("--suite", action="store_true",
+                        help="time every phase on generated programs up to the full RAM")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCH_SIZES), metavar="WORDS",
+                        help="--suite program sizes in words (default: 1k to 256k)")
+    parser.add_argument("--programs", nargs="+", choices=BENCH_PROGRAMS, default=list(BENCH_PROGRAMS),
+                        help="--suite programs to generate (default: all)")
+    parser.add_argument("--json", metavar="FILE", help="write the --suite results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="compare the --suite results with FILE")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown allowed against the baseline (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.suite:
+        for size in args.sizes:
+            if not 16 <= size <= MEMORY_DEPTH:
+                parser.error(f"--sizes must be between 16 and {MEMORY_DEPTH} words")
+        suite = run_suite(args.programs, args.sizes, args.repeat or 3)
+        print_suite(suite)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(suite, f, indent=2)
+                f.write("\n")
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                rows = compare_to_baseline(suite, json.load(f), args.tolerance)
+            print_comparison(rows, args.tolerance)
+            sys.exit(1 if any(row[5] for row in rows) else 0)
+        return
+
+    args.repeat = args.repeat or 5
+
+    print("=" * 70)
+    print("ASSEMBLER FRONT-END BENCHMARK")
+    print("=" * 70)
+    print(f"{'Lines':>8} {'Double parse':>14} {'Tokenize once':>14} {'Speedup':>8} {'Full build':>12}")
+    print("-" * 70)
+    for num_lines in args.lines:
+        double, once = bench_parse(num_lines, args.repeat)
+        full = bench_passes(num_lines, args.repeat)
+        print(f"{num_lines:>8} {double * 1000:>12.1f}ms {once * 1000:>12.1f}ms "
+              f"{double / once:>7.2f}x {full * 1000:>10.1f}ms")
+    print("-" * 70)
+    print(f"{'Lines':>8} {'String encoder':>14} {'Int encoder':>14} {'Speedup':>8}")
+    print("-" * 70)
+    for num_lines in args.lines:
+        strings, ints = bench_encode(num_lines, args.repeat)
+        print(f"{num_lines:>8} {strings * 1000:>12.1f}ms {ints * 1000:>12.1f}ms {strings / ints:>7.2f}x")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Build statistics for the assembler (assembler.py --stats).
+A BuildStats passed to assemble_source, assemble_object or assemble_file
+records, for every phase it runs (read, tokenize, optimize, pass1,
+schedule, pass2 and each output writer), the wall time and the net
+number of memory blocks allocated (sys.getallocatedblocks). Encoding is
+timed inside pass 2. Counters describe the program: source lines, statements,
+labels, words per format and immediates resolved through the symbol
+table.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from assembler import instruction_map, encoder_table
+
+
+class BuildStats:
+    """Per-phase timings and program counters of one build."""
+    __slots__ = ("source", "phases", "counters")
+
+    def __init__(self, source=None):
+        self.source = source        # input name, filled in by assemble_file
+        self.phases = {}            # name -> {"seconds", "blocks", "calls"[, "within"]}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as (another run of) phase name."""
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            record = self.phases.setdefault(name, {"seconds": 0.0, "blocks": 0, "calls": 0})
+            record["seconds"] += elapsed
+            record["blocks"] += sys.getallocatedblocks() - blocks
+            record["calls"] += 1
+
+    def timed(self, name, func, within):
+        """
+        Wrap func so every call adds to phase name, reported as part of
+        phase within. Allocations are not counted per call.
+        """
+        record = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "within": within})
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                record["seconds"] += clock() - start
+                record["calls"] += 1
+        return wrapper
+
+    def count_program(self, line_count, program, symbol_table):
+        """Record the program counters; symbol_table is the one pass 2 resolved against."""
+        per_format = {fmt: 0 for fmt in sorted({info["format"] for info in instruction_map.values()})}
+        per_format["data"] = 0
+        resolved = 0
+        for entry in program:
+            name = entry.mnemonic
+            if name is None:
+                continue
+            if name in instruction_map:
+                per_format[instruction_map[name]["format"]] += instruction_map[name]["num_words"]
+                imm_operand = encoder_table[name][2]
+                if (imm_operand is not None and imm_operand < len(entry.operands)
+                        and entry.operands[imm_operand] in symbol_table):
+                    resolved += 1
+            elif name == ".ORG":
+                if entry.operands and entry.operands[0] in symbol_table:
+                    resolved += 1
+            elif not name.startswith("."):
+                per_format["data"] += 1
+                if name in symbol_table:
+                    resolved += 1
+        self.counters = {
+            "lines": line_count,
+            "statements": len(program),
+            "labels": sum(1 for entry in program if entry.label),
+            "words": sum(per_format.values()),
+            "words_per_format": per_format,
+            "symbol_immediates": resolved,
+        }
+
+    def to_dict(self):
+        """Statistics as a JSON-ready dict; total_seconds sums the top-level phases."""
+        return {
+            "source": self.source,
+            "total_seconds": sum(record["seconds"] for record in self.phases.values()
+                                 if "within" not in record),
+            "phases": self.phases,
+            "counters": self.counters,
+        }
+
+    def write_json(self, path):
+        """Write the statistics as JSON to path, or to stdout for '-'."""
+        text = json.dumps(self.to_dict(), indent=2) + "\n"
+        if path == "-":
+            sys.stdout.write(text)
+        else:
+            with open(path, 'w') as f:
+                f.write(text)
@@ -0,0 +1,371 @@
+"""
+Profile-guided basic-block layout for the assembler (assembler.py
+--reorder-blocks). Runs on the tokenized program after -O and before
+pass 1, so the symbol table is computed for the new block order.
+
+Branch counts come from a profile written by 'profiler.py --json' for
+the same source and options (without --reorder-blocks), or from a
+functional run of the program (run_profile). Within each section, blocks
+are chained greedily along their hottest edges, the way Pettis and
+Hansen lay out procedures:
+
+- a block that falls through, or the not-taken side of JZ/JN/JC, is
+  followed by its successor where possible
+- a block ending in JMP is followed by the JMP's target, and the JMP is
+  dropped
+- cold chains go after the hot ones, in source order
+
+Wherever a block ends up away from the block it fell through to, a JMP
+to that block is added (with a generated label if it had none). JZ, JN
+and JC have no inverse forms in this ISA, so branch sense is never
+flipped: the taken side of a conditional branch stays taken. A section
+is only rewritten when the JMPs its profiled run would execute drop.
+
+Pinned code stays where it is: the first block of every .ORG section
+(what the .ORG address, a vector or a numeric jump enters), the vector
+table, sections holding data words or numeric jump targets past their
+start (see scheduler.jump_targets), and a last block that runs off the
+end of its section. A section that would grow into another one is left
+as it is. Code that computes addresses of its own instructions must
+label them.
+"""
+
+from assembler import (SourceLine, instruction_map, pass1_build_symbol_table, OPERAND_SYM,
+                       LINKAGE_DIRECTIVES)
+from optimizer import VECTOR_WORDS, instruction_cycles, line_addresses
+from scheduler import jump_targets
+
+
+CONDITIONAL = frozenset(("JZ", "JN", "JC"))
+
+# Block ends: transfers that leave the straight-line path (CALL and INT
+# return to the next instruction, so they do not end a block)
+BLOCK_ENDS = CONDITIONAL | {"JMP", "RET", "RTI", "HLT"}
+
+# Block ends that never fall through
+NO_FALLTHROUGH = frozenset(("JMP", "RET", "RTI", "HLT"))
+
+LABEL_PREFIX = "__BLOCK_"       # labels added for blocks a new JMP has to reach
+
+
+class BranchCounts:
+    """Execution and taken-branch counts per address of one profiled run."""
+    __slots__ = ("counts", "taken", "ops", "source", "fault")
+
+    def __init__(self, counts, taken, ops=None, source=None, fault=None):
+        self.counts = counts        # {address: executions}
+        self.taken = taken          # {address: taken executions} of JZ/JN/JC
+        self.ops = ops              # {address: mnemonic} of those branches, checked
+                                    # against the program, or None (profiled here)
+        self.source = source        # profile path, or None for a functional run
+        self.fault = fault          # error that stopped the functional run early, or None
+
+
+def load_profile(path):
+    """
+    Read the JSON profile written by 'profiler.py --json'.
+    Returns: BranchCounts
+    Raises ValueError if the file is not such a profile.
+    """
+    import json
+
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: not a profile ({e})")
+    if not isinstance(data, dict) or "counts" not in data or "branches" not in data:
+        raise ValueError(f"{path}: not a profile written by profiler.py --json")
+    try:
+        counts = {int(address, 16): count for address, count in data["counts"].items()}
+        branches = {int(address, 16): branch for address, branch in data["branches"].items()}
+        taken = {address: branch["taken"] for address, branch in branches.items()}
+        ops = {address: branch["op"] for address, branch in branches.items()}
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{path}: malformed profile ({e})")
+    return BranchCounts(counts, taken, ops, path)
+
+
+def run_profile(program, inputs=(), max_steps=10_000_000):
+    """
+    Assemble a tokenized program as it stands and run it on the functional
+    simulator with profiling counters on. A run that stops on a simulation
+    error (say a program without HLT running into data) keeps the counts
+    gathered up to there, and notes the error.
+    Returns: BranchCounts
+    """
+    import memfile
+    from assembler import pass2_generate_code
+    from simulator import Simulator, SimulationError
+
+    code = pass2_generate_code(program, pass1_build_symbol_table(program))
+    sim = Simulator(memfile.build_segments(code.addresses, code.words), inputs)
+    sim.enable_profiling()
+    fault = None
+    try:
+        sim.run(max_steps)
+    except SimulationError as e:
+        fault = str(e)
+    counts, taken = sim.exec_counts, sim.taken_counts
+    executed = [address for address, count in enumerate(counts) if count]
+    return BranchCounts({address: counts[address] for address in executed},
+                        {address: taken[address] for address in executed}, fault=fault)
+
+
+class _Block:
+    """A run of source lines entered only at its first line."""
+    __slots__ = ("index", "entries", "labels", "last", "count", "last_count", "fall_count",
+                 "target")
+
+    def __init__(self, index, entries):
+        self.index = index          # position in the section
+        self.entries = entries      # SourceLines, leading labels included
+        self.labels = []            # labels naming its address
+        for entry in entries:
+            if entry.label:
+                self.labels.append(entry.label)
+            if entry.mnemonic is not None:
+                break
+        instructions = [e for e in entries if e.mnemonic is not None]
+        self.last = instructions[-1] if instructions else None
+        self.count = 0              # executions of the first instruction
+        self.last_count = 0         # executions of the last one
+        self.fall_count = 0         # times control fell through its end
+        self.target = None          # index of the block its JMP/Jcc names, in this section
+
+    def falls_through(self):
+        return self.last is None or self.last.mnemonic not in NO_FALLTHROUGH
+
+
+def _split_blocks(entries):
+    """Cut a section's lines into blocks at labels and after BLOCK_ENDS."""
+    blocks = []
+    current = []
+    for entry in entries:
+        if entry.label and any(e.mnemonic is not None for e in current):
+            blocks.append(current)
+            current = []
+        current.append(entry)
+        if entry.mnemonic in BLOCK_ENDS:
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return [_Block(index, block) for index, block in enumerate(blocks)]
+
+
+def _chain(blocks, tail):
+    """
+    Greedy chaining along the heaviest fall-through candidates: a block's
+    own fall-through edge, or a JMP's edge to its target.
+    Returns: block indexes in their new order
+    """
+    edges = []
+    for block in blocks:
+        following = block.index + 1
+        if block.falls_through() and following < len(blocks):
+            edges.append((-block.fall_count, 0, block.index, following))
+        if block.last is not None and block.last.mnemonic == "JMP" and block.target is not None:
+            edges.append((-block.last_count, 1, block.index, block.target))
+    edges.sort()
+
+    chain_of = list(range(len(blocks)))
+    chains = {index: [index] for index in range(len(blocks))}
+    for _weight, _kind, src, dst in edges:
+        a, b = chain_of[src], chain_of[dst]
+        if a == b or dst == 0 or src == tail or chains[a][-1] != src or chains[b][0] != dst:
+            continue
+        if 0 in chains[a] and tail in chains[b]:
+            continue                # the entry and the pinned tail cannot share a chain
+        chains[a].extend(chains[b])
+        for index in chains.pop(b):
+            chain_of[index] = a
+
+    first = chains.pop(chain_of[0])
+    last = chains.pop(chain_of[tail]) if tail is not None and chain_of[tail] in chains else []
+    middle = sorted(chains.values(), key=lambda chain: (-max(blocks[i].count for i in chain), chain[0]))
+    return first + [index for chain in middle for index in chain] + last
+
+
+def _label_of(block, taken):
+    """A label naming the block's address, adding one if it has none."""
+    if block.labels:
+        return block.labels[0], None
+    number = 0
+    while f"{LABEL_PREFIX}{number}" in taken:
+        number += 1
+    label = f"{LABEL_PREFIX}{number}"
+    taken.add(label)
+    block.labels.append(label)
+    first = block.entries[0]
+    return label, SourceLine(first.line_num, f"{label}:", label, None, (), ())
+
+
+def _layout_section(entries, counts, taken, labels):
+    """
+    Lay one section's blocks out by their counts.
+    Returns: (new entries, report dict), or None if nothing improves
+    """
+    blocks = _split_blocks(entries)
+    if len(blocks) < 2:
+        return None
+    block_of = {label: block.index for block in blocks for label in block.labels}
+    for block in blocks:
+        first = next((e for e in block.entries if e.mnemonic is not None), None)
+        block.count = counts.get(id(first), 0) if first is not None else 0
+        last = block.last
+        if last is None:
+            continue
+        block.last_count = counts.get(id(last), 0)
+        if last.mnemonic in CONDITIONAL:
+            block.fall_count = block.last_count - taken.get(id(last), 0)
+        elif last.mnemonic not in NO_FALLTHROUGH:
+            block.fall_count = block.last_count
+        if last.mnemonic in CONDITIONAL or last.mnemonic == "JMP":
+            if last.kinds == (OPERAND_SYM,):
+                block.target = block_of.get(last.operands[0])
+    tail = len(blocks) - 1 if blocks[-1].falls_through() else None
+
+    order = _chain(blocks, tail)
+    if order == list(range(len(blocks))):
+        return None
+
+    out = []
+    removed = added = words = 0
+    new_labels = []
+    for position, index in enumerate(order):
+        block = blocks[index]
+        following = order[position + 1] if position + 1 < len(order) else None
+        lines = list(block.entries)
+        last = block.last
+        if last is not None and last.mnemonic == "JMP" and block.target == following:
+            # Its target comes next: drop the JMP, keeping any label it carries
+            lines.remove(last)
+            if last.label:
+                lines.append(SourceLine(last.line_num, last.text, last.label, None, (), ()))
+            removed += block.last_count
+            words -= instruction_map["JMP"]["num_words"]
+        elif block.falls_through() and index + 1 < len(blocks) and following != index + 1:
+            label, line = _label_of(blocks[index + 1], labels)
+            if line is not None:
+                new_labels.append((index + 1, line))
+            anchor = last or block.entries[-1]
+            lines.append(SourceLine(anchor.line_num, f"JMP {label}  ; block order", None, "JMP",
+                                    (label,), (OPERAND_SYM,)))
+            added += block.fall_count
+            words += instruction_map["JMP"]["num_words"]
+        out.append((index, lines))
+
+    saved = (removed - added) * instruction_cycles("JMP")
+    if saved <= 0:
+        return None
+    labelled = dict(new_labels)
+    result = []
+    for index, lines in out:
+        if index in labelled:
+            result.append(labelled[index])
+        result.extend(lines)
+    return result, {
+        "blocks": len(blocks),
+        "moved": sum(1 for position, index in enumerate(order) if position != index),
+        "removed": removed,
+        "added": added,
+        "words": words,
+        "saved": saved,
+    }
+
+
+def layout_program(program, profile):
+    """
+    Reorder the relocatable basic blocks of a tokenized program by a
+    profile of its branches.
+    Returns: (laid-out program, report) where report lists every section
+    rewritten as dicts with address, label, line, blocks, moved, removed
+    and added (JMP executions in the profiled run), words (size change)
+    and saved (estimated cycles over the profiled run).
+    Raises ValueError if the profile names a branch the program does not
+    have there.
+    """
+    symbol_table = pass1_build_symbol_table(program)
+    addresses = line_addresses(program, symbol_table)
+    targets = jump_targets(program)
+
+    # Counts per instruction line (keyed by id, as lines may repeat their text)
+    counts, taken = {}, {}
+    for entry, address in zip(program, addresses):
+        name = entry.mnemonic
+        if name not in instruction_map:
+            continue
+        if address in profile.counts:
+            counts[id(entry)] = profile.counts[address]
+        if address in profile.taken:
+            taken[id(entry)] = profile.taken[address]
+    if profile.ops is not None:
+        at = {address: entry.mnemonic for entry, address in zip(program, addresses)
+              if entry.mnemonic in CONDITIONAL}
+        for address, op in profile.ops.items():
+            if at.get(address) != op:
+                raise ValueError(f"Profile {profile.source} does not match the program: "
+                                 f"no {op} at 0x{address:04X}")
+
+    sections = []
+    start = 0
+    for index, entry in enumerate(program):
+        if entry.mnemonic == ".ORG":
+            sections.append((start, index))
+            start = index + 1
+    sections.append((start, len(program)))
+
+    def size(entries):
+        return sum(instruction_map[e.mnemonic]["num_words"] if e.mnemonic in instruction_map else 1
+                   for e in entries if e.mnemonic is not None and e.mnemonic not in LINKAGE_DIRECTIVES)
+
+    # Address range of every section that holds words
+    spans = {}
+    for number, (start, end) in enumerate(sections):
+        words = size(program[start:end])
+        if words:
+            spans[number] = (addresses[start], addresses[start] + words)
+
+    labels = set(symbol_table)
+    laid_out = list(program)
+    report = []
+    for number in sorted(spans, reverse=True):          # back to front, so indexes hold
+        start, end = sections[number]
+        entries = program[start:end]
+        if any(e.mnemonic is not None and e.mnemonic not in instruction_map for e in entries):
+            continue                                    # data words or linkage directives
+        base, end_address = spans[number]
+        if base < VECTOR_WORDS or any(base < target < end_address for target in targets):
+            continue
+        result = _layout_section(entries, counts, taken, labels)
+        if result is None:
+            continue
+        lines, summary = result
+        new_end = end_address + summary["words"]
+        if any(other_base < new_end and base < other_end
+               for other, (other_base, other_end) in spans.items() if other != number):
+            continue                                    # would run into another section
+        spans[number] = (base, new_end)
+        laid_out[start:end] = lines
+        first = entries[0]
+        report.append({"address": base, "label": first.label, "line": first.line_num, **summary})
+    report.sort(key=lambda section: section["address"])
+    return laid_out, report
+
+
+def report_lines(report, profile=None):
+    """Yield the layout report as printable lines."""
+    if profile is not None:
+        yield f"  Counts from: {profile.source or 'functional run'}\n"
+        if profile.fault is not None:
+            yield f"  Run stopped early: {profile.fault} (counts up to there)\n"
+    if not report:
+        yield "  No section improved: blocks left in source order\n"
+    for section in report:
+        where = section["label"] or f"line {section['line']}"
+        yield (f"  0x{section['address']:04X} {where:<16} {section['blocks']:>3} blocks "
+               f"{section['moved']:>3} moved  JMPs executed -{section['removed']} +{section['added']}  "
+               f"{section['words']:+d} words  (saved {section['saved']} cycles)\n")
+    total = sum(section["saved"] for section in report)
+    yield f"  Total saved over the profiled run: {total} cycles\n"
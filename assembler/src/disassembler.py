@@ -0,0 +1,256 @@
+"""
+Disassembler for .mem, _hex.mem and .bin images.
+Decoding is driven by a 32-entry table indexed by the opcode field and
+built from the assembler's instruction_map, formats and encoder field
+tables, so it always agrees with what the assembler emits. Images are
+streamed in chunks (memfile.iter_chunks), so memory use does not grow
+with image size.
+
+Jump/call targets are shown as labels when a symbol table is given: a
+file written by 'assembler.py --symbols', or the .asm source itself.
+
+Usage: python disassembler.py <image> [-s SYMBOLS] [--source] [-o FILE]
+"""
+
+import re
+
+import memfile
+from assembler import (instruction_map, formats, format_register_fields, instruction_extra_fields,
+                       format_immediate_operand, assemble_source, OPCODE_SHIFT, INDEX_SHIFT)
+
+
+# Operand spec kinds
+SPEC_REG = "reg"        # register field at a shift
+SPEC_IMM = "imm"        # second word (immediate or offset)
+SPEC_ADDR = "addr"      # second word used as a code address
+SPEC_INDEX = "index"    # INT index field
+
+
+def register_fields(name):
+    """(operand index, shift) pairs the encoder fills for one mnemonic."""
+    fmt = instruction_map[name]["format"]
+    return format_register_fields[fmt] + instruction_extra_fields.get(name, ())
+
+
+def operand_specs(name):
+    """
+    Operand specs for one mnemonic, in source order, derived from the
+    same field tables the encoder uses. Operands encoded into more than
+    one field (INC, NOT, SWAP) are read from the first.
+    Returns: tuple of (kind, shift) pairs
+    """
+    info = instruction_map[name]
+    fmt = info["format"]
+    registers = {}
+    for index, shift in register_fields(name):
+        registers.setdefault(index, shift)
+    immediate = format_immediate_operand.get(fmt) if info["num_words"] == 2 else None
+    specs = []
+    for index in range(len(formats[fmt]) - 1):
+        if index in registers:
+            specs.append((SPEC_REG, registers[index]))
+        elif index == immediate:
+            specs.append((SPEC_ADDR if fmt == "I" else SPEC_IMM, 0))
+        elif fmt == "J":
+            specs.append((SPEC_INDEX, INDEX_SHIFT))
+    return tuple(specs)
+
+
+def unused_mask(name):
+    """Bits of the first word the encoder never sets for this mnemonic."""
+    mask = 0x1F << OPCODE_SHIFT
+    for _index, shift in register_fields(name):
+        mask |= 7 << shift
+    if instruction_map[name]["format"] == "J":
+        mask |= 3 << INDEX_SHIFT
+    return ~mask & 0xFFFFFFFF
+
+
+# Decode table indexed by opcode:
+# (mnemonic, num_words, operand specs, offset form, unused-bit mask) or None
+DECODE_TABLE = [None] * 32
+for _name, _info in instruction_map.items():
+    DECODE_TABLE[int(_info["opcode"], 2)] = (
+        _name,
+        _info["num_words"],
+        operand_specs(_name),
+        _info["format"] in ("G", "H"),    # LDD/STD print as offset(Rsrc)
+        unused_mask(_name),
+    )
+
+
+def format_data(word):
+    """Render a data word; flag values a data line cannot reproduce (not 16-bit sign-extended)."""
+    if word < 0x8000:
+        return f"0x{word:X}"
+    if word >= 0xFFFF8000:
+        return str(word - (1 << 32))
+    return f"0x{word:X}    ; 32-bit data word, not representable as a data line"
+
+
+def format_immediate(value):
+    """Render a second word: sign-extended values as negative decimal, else hex."""
+    if value >= 0xFFFF8000:
+        return str(value - (1 << 32))
+    return f"0x{value:X}"
+
+
+def render(entry, word, second, labels=None):
+    """Assembly text for one decoded instruction."""
+    name, _size, specs, offset_form, _unused = entry
+    operands = []
+    for kind, shift in specs:
+        if kind == SPEC_REG:
+            operands.append(f"R{(word >> shift) & 7}")
+        elif kind == SPEC_INDEX:
+            operands.append(str(((word >> shift) & 3) - 2))
+        elif second is None:
+            operands.append("?")
+        elif kind == SPEC_ADDR and labels and second in labels:
+            operands.append(labels[second][0])
+        elif kind == SPEC_ADDR:
+            operands.append(f"0x{second:X}")
+        else:
+            operands.append(format_immediate(second))
+    if offset_form:
+        operands[1:] = [f"{operands[1]}({operands[2]})"]
+    if not operands:
+        return name
+    return f"{name} {', '.join(operands)}"
+
+
+CACHE_LIMIT = 1 << 16     # rendered encodings kept, so memory stays bounded
+
+
+def disassemble(chunks, labels=None):
+    """
+    Decode a stream of (base_address, words) runs (memfile.iter_chunks).
+    labels maps address -> [names] for jump/call targets.
+    A two-word instruction whose second word is missing (end of image or
+    a gap) is shown with '?'. Undefined opcodes, and words with bits set
+    outside the fields their instruction uses, are shown as data words.
+    Yields: (address, words tuple, text)
+    """
+    cache = {}          # encodings repeat heavily (NOP padding, unrolled code)
+    table = DECODE_TABLE
+    held = None         # (address, word, entry) waiting for its second word
+    for base, run in chunks:
+        address = base - 1
+        for word in run:
+            address += 1
+            if held is not None:
+                first_address, first, entry = held
+                held = None
+                if address == first_address + 1:
+                    key = (first << 32) | word
+                    text = cache.get(key)
+                    if text is None:
+                        if len(cache) >= CACHE_LIMIT:
+                            cache.clear()
+                        text = cache[key] = render(entry, first, word, labels)
+                    yield first_address, (first, word), text
+                    continue
+                yield first_address, (first,), render(entry, first, None, labels)
+            text = cache.get(word)
+            if text is not None:
+                yield address, (word,), text
+                continue
+            entry = table[word >> OPCODE_SHIFT]
+            if entry is None or word & entry[4]:
+                yield address, (word,), format_data(word)
+                continue
+            if entry[1] == 2:
+                held = (address, word, entry)
+                continue
+            if len(cache) >= CACHE_LIMIT:
+                cache.clear()
+            text = cache[word] = render(entry, word, None)
+            yield address, (word,), text
+    if held is not None:
+        first_address, first, entry = held
+        yield first_address, (first,), render(entry, first, None, labels)
+
+
+SYMBOL_LINE = re.compile(r"^\s*([^\s:]+):\s*(\d+)")
+
+
+def load_symbols(path):
+    """
+    Load a symbol table from an 'assembler.py --symbols' file or an .asm source.
+    Returns: {address: [names]}
+    """
+    if path.lower().endswith(".asm"):
+        with open(path, 'r') as f:
+            table = assemble_source(f.read(), path).symbol_table
+    else:
+        table = {}
+        with open(path, 'r') as f:
+            for line in f:
+                match = SYMBOL_LINE.match(line)
+                if match:
+                    table[match.group(1)] = int(match.group(2))
+    labels = {}
+    for name, address in table.items():
+        labels.setdefault(address, []).append(name)
+    return labels
+
+
+def listing_lines(decoded, labels=None):
+    """Yield annotated listing lines: address, hex words, assembly."""
+    bodies = {}         # word -> formatted rest of line, for one-word entries
+    for address, words, text in decoded:
+        if labels and address in labels:
+            for name in labels[address]:
+                yield f"{name}:\n"
+        if len(words) == 2:
+            yield f"{address:05X}  {words[0]:08X} {words[1]:08X}  {text}\n"
+            continue
+        body = bodies.get(words[0])
+        if body is None:
+            if len(bodies) >= CACHE_LIMIT:
+                bodies.clear()
+            body = bodies[words[0]] = f"  {words[0]:08X}           {text}\n"
+        yield f"{address:05X}{body}"
+
+
+def source_lines(decoded, labels=None):
+    """Yield re-assemblable source: .ORG at every gap, labels, instructions."""
+    next_address = None
+    for address, words, text in decoded:
+        if address != next_address:
+            yield f".ORG 0x{address:X}\n"
+        if labels and address in labels:
+            for name in labels[address]:
+                yield f"{name}:\n"
+        yield f"    {text}\n"
+        next_address = address + len(words)
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Disassemble a .mem/_hex.mem/.bin image")
+    parser.add_argument("image", help="image to disassemble")
+    parser.add_argument("-s", "--symbols", help="symbol file (assembler.py --symbols) or .asm source")
+    parser.add_argument("--source", action="store_true",
+                        help="emit re-assemblable source instead of an annotated listing")
+    parser.add_argument("-o", "--output", help="write to FILE instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        labels = load_symbols(args.symbols) if args.symbols else None
+        decoded = disassemble(memfile.iter_chunks(args.image), labels)
+        lines = (source_lines if args.source else listing_lines)(decoded, labels)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Linker for relocatable objects written by 'assembler.py --format obj'.
+Places the sections of every module, resolves labels across modules and
+writes the final .mem (or .bin) image, plus an optional symbol map that
+'disassembler.py -s' reads.
+
+Absolute (.ORG) sections stay at their address. Relocatable sections
+are placed in command-line order from --base (default: just past the
+highest absolute section), each at the first address where it does not
+overlap an absolute section. .asm inputs are assembled to objects first,
+so shared modules can be linked from source or from prebuilt objects.
+
+Usage: python linker.py <module.obj|module.asm> [...] -o OUTPUT [--base ADDR] [--map FILE]
+"""
+
+import os
+from array import array
+
+import memfile
+import objfile
+from assembler import assemble_object, sign_extend_16
+
+
+IMMEDIATE_LIMIT = 0x8000    # addresses below this survive the 16-bit sign extension
+
+
+def load_module(path):
+    """Read an object file, or assemble an .asm source into one."""
+    if path.lower().endswith(".asm"):
+        with open(path, 'r') as f:
+            return assemble_object(f.read(), path)[1]
+    return objfile.read_object(path)
+
+
+def place_sections(modules, base=None):
+    """
+    Choose the base address of every section.
+    Returns: list (per module) of lists (per section) of base addresses
+    Raises ValueError when absolute sections overlap.
+    """
+    fixed = sorted((s.org, s.org + len(s.words), m.name)
+                   for m in modules for s in m.sections if s.org is not None and s.words)
+    for (start, end, name), (next_start, _next_end, next_name) in zip(fixed, fixed[1:]):
+        if next_start < end:
+            raise ValueError(f"Section at 0x{next_start:X} ({next_name}) overlaps "
+                             f"0x{start:X}-0x{end - 1:X} ({name})")
+
+    cursor = base if base is not None else max((end for _start, end, _name in fixed), default=0)
+    bases = []
+    for module in modules:
+        placed = []
+        for section in module.sections:
+            if section.org is not None:
+                placed.append(section.org)
+                continue
+            size = len(section.words)
+            address = cursor
+            for start, end, _name in fixed:
+                if address < end and start < address + size:
+                    address = end
+            placed.append(address)
+            cursor = address + size
+        bases.append(placed)
+    return bases
+
+
+def link(modules, base=None):
+    """
+    Link object modules into one image.
+    Returns: (segments, symbols) where segments is a list of
+    (base_address, array('I')) in address order and symbols maps every
+    exported label, and every local label as 'module.LABEL', to its
+    final address.
+    Raises ValueError on overlapping sections, duplicate exports,
+    undefined imports and addresses a 16-bit immediate cannot hold.
+    """
+    bases = place_sections(modules, base)
+
+    exported = {}           # symbol -> (module name, address)
+    for module, placed in zip(modules, bases):
+        for symbol in module.exports:
+            if symbol in exported:
+                raise ValueError(f"Symbol '{symbol}' is exported by both "
+                                 f"{exported[symbol][0]} and {module.name}")
+            section, offset = module.symbols[symbol]
+            exported[symbol] = (module.name, placed[section] + offset)
+    for module in modules:
+        for symbol in module.imports:
+            if symbol not in exported:
+                raise ValueError(f"{module.name}: undefined symbol '{symbol}'")
+
+    segments = []
+    symbols = {symbol: address for symbol, (_name, address) in exported.items()}
+    for module, placed in zip(modules, bases):
+        prefix = os.path.splitext(os.path.basename(module.name))[0]
+        local = {}
+        for label, (section, offset) in module.symbols.items():
+            local[label] = placed[section] + offset
+            if label not in module.exports:
+                symbols[f"{prefix}.{label}"] = local[label]
+        for section, section_base in zip(module.sections, placed):
+            words = array('I', section.words)
+            for offset, symbol in section.relocations:
+                address = local[symbol] if symbol in local else exported[symbol][1]
+                if address >= IMMEDIATE_LIMIT:
+                    raise ValueError(f"{module.name}: '{symbol}' at 0x{address:X} does not fit "
+                                     f"a 16-bit immediate")
+                words[offset] = sign_extend_16(address)
+            if words:
+                segments.append((section_base, words))
+    segments.sort(key=lambda segment: segment[0])
+    return segments, symbols
+
+
+def map_lines(symbols):
+    """Yield the symbol map in the assembler's --symbols format, by address."""
+    for symbol, address in sorted(symbols.items(), key=lambda item: (item[1], item[0])):
+        yield f"  {symbol}: {address} (0x{address:04X})\n"
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Link relocatable objects into a memory image")
+    parser.add_argument("inputs", nargs="+", help="object files (.obj) or .asm sources")
+    parser.add_argument("-o", "--output", required=True, help="output image (.mem or .bin)")
+    parser.add_argument("--base", type=lambda s: int(s, 0), metavar="ADDR",
+                        help="first address for relocatable sections "
+                             "(default: after the highest .ORG section)")
+    parser.add_argument("--layout", choices=memfile.LAYOUTS, default="dense",
+                        help=".mem layout (default: dense, zero-padded to every address)")
+    parser.add_argument("--format", choices=("mem", "bin"), default="mem", dest="fmt",
+                        help="mem: binary text (default); bin: raw little-endian uint32 image")
+    parser.add_argument("--bin-header", action="store_true",
+                        help="with --format bin: add the segment-table header")
+    parser.add_argument("--map", metavar="FILE", help="write the symbol map to FILE")
+    args = parser.parse_args()
+
+    try:
+        modules = [load_module(path) for path in args.inputs]
+        segments, symbols = link(modules, args.base)
+        if args.fmt == "bin":
+            memfile.write_bin(args.output, segments, args.bin_header)
+        else:
+            memfile.write_mem(args.output, segments, args.layout)
+        if args.map:
+            with open(args.map, 'w') as f:
+                f.writelines(map_lines(symbols))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"Linked {len(modules)} modules into {args.output}")
+    print("=" * 60)
+    for base, words in segments:
+        print(f"  0x{base:05X}-0x{base + len(words) - 1:05X}  {len(words)} words")
+    print(f"Total: {sum(len(words) for _base, words in segments)} words")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Vectorized lockstep executor: runs N machine states through one program
+at once with NumPy (requires numpy).
+
+Each lane has its own registers, CCR, PC and SP, stored as arrays. Every
+step picks the lowest PC among running lanes and executes that
+instruction for all lanes sitting on it, so lanes that diverge on
+JZ/JN/JC are simply masked out until they meet again. The memory image is
+shared read-only; stores go to per-lane overlays. Semantics are the same
+as simulator.py. A lane that reaches an undefined opcode stops there,
+marked in faulted with its error in errors, while the others run on.
+
+Usage: python lockstep.py <image> --inputs FILE [--max-steps N]
+       (FILE holds one line of IN port values per lane)
+"""
+
+import numpy as np
+
+from simulator import (MEMORY_DEPTH, ADDR_MASK, WORD_MASK, RESET_VECTOR, INTERRUPT_VECTOR,
+                       OP_NOP, OP_HLT, OP_SETC, OP_INC, OP_NOT, OP_LDM, OP_MOV, OP_SWAP,
+                       OP_IADD, OP_ADD, OP_SUB, OP_AND, OP_JZ, OP_JN, OP_JC, OP_JMP,
+                       OP_OUT, OP_IN, OP_PUSH, OP_POP, OP_LDD, OP_STD, OP_CALL, OP_RET,
+                       OP_INT, OP_RTI, SimulationError, decode_instruction, load_program)
+import memfile
+
+
+class LockstepExecutor:
+    """
+    N independent machine states stepped together.
+    inputs: optional (N, K) array of IN port values per lane (0 once used up)
+    regs:   optional (N, 8) array of initial register values
+    """
+
+    def __init__(self, segments, lanes, inputs=None, regs=None):
+        self.lanes = lanes
+        self.image = np.frombuffer(memfile.expand_segments(segments, MEMORY_DEPTH), dtype=np.uint32)
+        self.regs = np.zeros((lanes, 8), dtype=np.uint64)
+        if regs is not None:
+            self.regs[:] = np.asarray(regs, dtype=np.uint64) & WORD_MASK
+        self.pc = np.full(lanes, int(self.image[RESET_VECTOR]) & ADDR_MASK, dtype=np.int64)
+        self.sp = np.full(lanes, MEMORY_DEPTH - 1, dtype=np.int64)
+        self.z = np.zeros(lanes, dtype=np.uint64)
+        self.n = np.zeros(lanes, dtype=np.uint64)
+        self.c = np.zeros(lanes, dtype=np.uint64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.faulted = np.zeros(lanes, dtype=bool)
+        self.errors = {}          # lane -> SimulationError message, for faulted lanes
+        self.steps = np.zeros(lanes, dtype=np.int64)
+        if inputs is None:
+            inputs = np.zeros((lanes, 0), dtype=np.uint64)
+        self.inputs = np.asarray(inputs, dtype=np.uint64) & WORD_MASK
+        self.in_ptr = np.zeros(lanes, dtype=np.int64)
+        self._out_chunks = []     # (lane indices, values) per OUT step
+        self._slots = {}          # address -> overlay slot
+        self._ov_vals = []        # per slot: (N,) stored values
+        self._ov_valid = []       # per slot: (N,) lanes that stored there
+        self._decoded = {}        # pc -> decoded tuple for unmodified code
+        self.group_steps = 0      # vector steps taken
+
+    # -- memory with per-lane overlays -------------------------------------
+
+    def _read(self, lanes, addrs):
+        """Read one word per lane at addrs (arrays of equal length)."""
+        values = self.image[addrs].astype(np.uint64)
+        if self._slots:
+            for address in np.unique(addrs):
+                slot = self._slots.get(int(address))
+                if slot is None:
+                    continue
+                sel = addrs == address
+                owners = lanes[sel]
+                values[sel] = np.where(self._ov_valid[slot][owners],
+                                       self._ov_vals[slot][owners], values[sel])
+        return values
+
+    def _write(self, lanes, addrs, values):
+        """Store one word per lane into that lane's overlay."""
+        for address in np.unique(addrs):
+            address = int(address)
+            slot = self._slots.get(address)
+            if slot is None:
+                slot = self._slots[address] = len(self._ov_vals)
+                self._ov_vals.append(np.zeros(self.lanes, dtype=np.uint64))
+                self._ov_valid.append(np.zeros(self.lanes, dtype=bool))
+            sel = addrs == address
+            owners = lanes[sel]
+            self._ov_vals[slot][owners] = values[sel]
+            self._ov_valid[slot][owners] = True
+
+    def _push(self, lanes, values):
+        sp = self.sp[lanes]
+        self._write(lanes, sp, values)
+        self.sp[lanes] = (sp - 1) & ADDR_MASK
+
+    def _pop(self, lanes):
+        sp = (self.sp[lanes] + 1) & ADDR_MASK
+        self.sp[lanes] = sp
+        return self._read(lanes, sp)
+
+    def _fetch(self, lanes, pc):
+        """
+        Decode the instruction at pc for lanes.
+        Lanes whose overlays changed the code there are deferred; lanes
+        that hit an undefined opcode are marked faulted.
+        Returns: (lanes that execute now, decoded tuple), or (None, None)
+        if they faulted
+        """
+        second = (pc + 1) & ADDR_MASK
+        if pc not in self._slots and second not in self._slots:
+            d = self._decoded.get(pc)
+            if d is None:
+                try:
+                    d = decode_instruction(int(self.image[pc]), int(self.image[second]), pc)
+                except SimulationError as e:
+                    self._fault(lanes, e)
+                    return None, None
+                self._decoded[pc] = d
+            return lanes, d
+        words = self._read(lanes, np.full(len(lanes), pc, dtype=np.int64))
+        seconds = self._read(lanes, np.full(len(lanes), second, dtype=np.int64))
+        w0, s0 = int(words[0]), int(seconds[0])
+        lanes = lanes[(words == w0) & (seconds == s0)]
+        try:
+            return lanes, decode_instruction(w0, s0, pc)
+        except SimulationError as e:
+            self._fault(lanes, e)
+            return None, None
+
+    def _fault(self, lanes, error):
+        """Stop lanes on an error; they keep the state from before the instruction."""
+        self.faulted[lanes] = True
+        for lane in lanes.tolist():
+            self.errors[lane] = str(error)
+
+    # -- execution ----------------------------------------------------------
+
+    def interrupt(self, lanes=None):
+        """Take the external interrupt on the given lanes (default: all)."""
+        lanes = np.arange(self.lanes) if lanes is None else np.asarray(lanes)
+        self._push(lanes, self.pc[lanes].astype(np.uint64))
+        self._push(lanes, self.c[lanes] | (self.n[lanes] << 1) | (self.z[lanes] << 2))
+        self.pc[lanes] = int(self.image[INTERRUPT_VECTOR]) & ADDR_MASK
+        self.halted[lanes] = False
+
+    def _set_flags(self, lanes, r):
+        self.n[lanes] = r >> 31
+        self.z[lanes] = r == 0
+
+    def run(self, max_steps=1_000_000):
+        """
+        Step all lanes until each has halted, faulted or retired max_steps
+        instructions.
+        Returns: number of vector steps taken
+        """
+        regs = self.regs
+        taken_steps = 0
+        while True:
+            running = np.nonzero(~self.halted & ~self.faulted & (self.steps < max_steps))[0]
+            if len(running) == 0:
+                break
+            pcs = self.pc[running]
+            pc = int(pcs.min())
+            lanes, decoded = self._fetch(running[pcs == pc], pc)
+            if lanes is None:
+                continue
+            op, rd, r1, r2, value, next_pc = decoded
+            self.steps[lanes] += 1
+            taken_steps += 1
+            new_pc = next_pc
+
+            if op == OP_ADD or op == OP_IADD or op == OP_INC:
+                if op == OP_ADD:
+                    r = regs[lanes, r1] + regs[lanes, r2]
+                else:
+                    r = regs[lanes, r1] + np.uint64(value if op == OP_IADD else 1)
+                self.c[lanes] = r >> 32
+                r &= WORD_MASK
+                regs[lanes, rd] = r
+                self._set_flags(lanes, r)
+            elif op == OP_SUB:
+                a = regs[lanes, r1]
+                b = regs[lanes, r2]
+                self.c[lanes] = a < b
+                r = (a - b) & WORD_MASK
+                regs[lanes, rd] = r
+                self._set_flags(lanes, r)
+            elif op == OP_AND or op == OP_NOT:
+                r = regs[lanes, r1] & regs[lanes, r2] if op == OP_AND else regs[lanes, r1] ^ WORD_MASK
+                regs[lanes, rd] = r
+                self._set_flags(lanes, r)
+            elif op == OP_JZ or op == OP_JN or op == OP_JC:
+                flag = self.z if op == OP_JZ else self.n if op == OP_JN else self.c
+                taken = flag[lanes] == 1
+                flag[lanes[taken]] = 0
+                new_pc = np.where(taken, value & ADDR_MASK, next_pc)
+            elif op == OP_JMP:
+                new_pc = value & ADDR_MASK
+            elif op == OP_LDM:
+                regs[lanes, rd] = value
+            elif op == OP_MOV:
+                regs[lanes, rd] = regs[lanes, r1]
+            elif op == OP_LDD:
+                regs[lanes, rd] = self._read(lanes, ((regs[lanes, r1] + np.uint64(value)) & ADDR_MASK).astype(np.int64))
+            elif op == OP_STD:
+                addrs = ((regs[lanes, r1] + np.uint64(value)) & ADDR_MASK).astype(np.int64)
+                self._write(lanes, addrs, regs[lanes, r2])
+            elif op == OP_OUT:
+                self._out_chunks.append((lanes, regs[lanes, r2].copy()))
+            elif op == OP_IN:
+                ptr = self.in_ptr[lanes]
+                have = ptr < self.inputs.shape[1]
+                values = np.zeros(len(lanes), dtype=np.uint64)
+                values[have] = self.inputs[lanes[have], ptr[have]]
+                regs[lanes, rd] = values
+                self.in_ptr[lanes] = ptr + 1
+            elif op == OP_PUSH:
+                self._push(lanes, regs[lanes, r2])
+            elif op == OP_POP:
+                regs[lanes, rd] = self._pop(lanes)
+            elif op == OP_CALL:
+                self._push(lanes, np.full(len(lanes), next_pc, dtype=np.uint64))
+                new_pc = value & ADDR_MASK
+            elif op == OP_RET:
+                new_pc = (self._pop(lanes) & ADDR_MASK).astype(np.int64)
+            elif op == OP_SWAP:
+                a = regs[lanes, r1].copy()
+                regs[lanes, r1] = regs[lanes, rd]
+                regs[lanes, rd] = a
+            elif op == OP_SETC:
+                self.c[lanes] = 1
+            elif op == OP_NOP:
+                pass
+            elif op == OP_HLT:
+                self.halted[lanes] = True
+                new_pc = pc
+            elif op == OP_INT:
+                self._push(lanes, np.full(len(lanes), next_pc, dtype=np.uint64))
+                self._push(lanes, self.c[lanes] | (self.n[lanes] << 1) | (self.z[lanes] << 2))
+                new_pc = (self._read(lanes, np.full(len(lanes), value, dtype=np.int64)) & ADDR_MASK).astype(np.int64)
+            elif op == OP_RTI:
+                flags = self._pop(lanes)
+                self.c[lanes] = flags & 1
+                self.n[lanes] = (flags >> 1) & 1
+                self.z[lanes] = (flags >> 2) & 1
+                new_pc = (self._pop(lanes) & ADDR_MASK).astype(np.int64)
+            else:
+                self.steps[lanes] -= 1
+                self._fault(lanes, SimulationError(f"Unhandled opcode {op:05b} at 0x{pc:05X}"))
+                continue
+            self.pc[lanes] = new_pc
+
+        self.group_steps += taken_steps
+        return taken_steps
+
+    # -- results -------------------------------------------------------------
+
+    def outputs(self, lane):
+        """OUT port values written by one lane, in order."""
+        values = []
+        for lanes, chunk in self._out_chunks:
+            hit = np.nonzero(lanes == lane)[0]
+            if len(hit):
+                values.append(int(chunk[hit[0]]))
+        return values
+
+    def all_outputs(self):
+        """OUT port values for every lane, as a list of lists."""
+        values = [[] for _ in range(self.lanes)]
+        for lanes, chunk in self._out_chunks:
+            for lane, value in zip(lanes.tolist(), chunk.tolist()):
+                values[lane].append(value)
+        return values
+
+    def state(self, lane):
+        """Architectural state of one lane, shaped like Simulator.state()."""
+        return {
+            "pc": int(self.pc[lane]),
+            "sp": int(self.sp[lane]),
+            "ccr": int(self.c[lane] | (self.n[lane] << 1) | (self.z[lane] << 2)),
+            "regs": [int(v) for v in self.regs[lane]],
+            "steps": int(self.steps[lane]),
+            "halted": bool(self.halted[lane]),
+        }
+
+
+def load_inputs(path):
+    """Read one line of IN values (hex with 0x, or decimal) per lane into an (N, K) array."""
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#')[0].replace(',', ' ').split()
+            if line:
+                rows.append([int(v, 0) for v in line])
+    width = max((len(r) for r in rows), default=0)
+    inputs = np.zeros((len(rows), width), dtype=np.uint64)
+    for i, row in enumerate(rows):
+        inputs[i, :len(row)] = row
+    return inputs
+
+
+def main():
+    import argparse
+    import sys
+    import time
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="Run one program over many input vectors in lockstep")
+    parser.add_argument("image", help=".mem/.bin image or .asm source")
+    parser.add_argument("--inputs", required=True, help="file with one line of IN values per lane")
+    parser.add_argument("--max-steps", type=int, default=1_000_000, help="instruction limit per lane")
+    args = parser.parse_args()
+
+    try:
+        inputs = load_inputs(args.inputs)
+        executor = LockstepExecutor(load_program(args.image), len(inputs), inputs)
+        start = time.perf_counter()
+        executor.run(args.max_steps)
+        elapsed = time.perf_counter() - start
+    except (OSError, ValueError, SimulationError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    total = int(executor.steps.sum())
+    results = Counter(tuple(outputs) for outputs in executor.all_outputs())
+    print("=" * 60)
+    print(f"LOCKSTEP RUN: {args.image}")
+    print("=" * 60)
+    print(f"Lanes: {executor.lanes}  Halted: {int(executor.halted.sum())}  "
+          f"Faulted: {int(executor.faulted.sum())}")
+    print(f"Instructions: {total} in {executor.group_steps} vector steps")
+    if elapsed > 0:
+        print(f"Speed: {total / elapsed / 1e6:.2f} M instr/s")
+    print(f"Distinct output sequences: {len(results)}")
+    for outputs, count in results.most_common(5):
+        shown = " ".join(f"{v:X}" for v in outputs[:16]) or "-"
+        print(f"  {count:>6} lanes: {shown}{' ...' if len(outputs) > 16 else ''}")
+    if executor.errors:
+        errors = Counter(executor.errors.values())
+        print(f"Faults: {len(errors)} distinct")
+        for message, count in errors.most_common(5):
+            print(f"  {count:>6} lanes: {message}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+Memory image files: .mem text layouts, raw .bin images and readers.
+
+Layouts:
+- packed: one 32-bit binary word per line in emission order (.ORG ignored)
+- dense:  one word per line for every address from 0 up to the highest
+          used address, gaps filled with zeros (what ram.vhd loads)
+- sparse: '@<hex address>' records, each followed by the run of words
+          stored from that address on
+
+Raw binary (.bin) images hold little-endian uint32 words. Without a
+header the file is the dense image from address 0, so it can be mapped
+directly (numpy.frombuffer(data, '<u4')). With a header it starts with
+
+    magic 'AIMG' | version u32 | segment count u32 | reserved u32
+    segment table: (base address u32, word count u32) per segment
+
+followed by each segment's words in table order.
+
+write_vhdl() emits the populated words as constants of the VHDL package
+ram_image_pkg, which memory/ram.vhd initialises from without file I/O.
+
+iter_chunks() and iter_words() stream any of these, and _hex.mem
+listings, without loading the whole image.
+"""
+
+import struct
+import sys
+from array import array
+
+
+LAYOUTS = ("packed", "dense", "sparse")
+
+BIN_MAGIC = b"AIMG"
+BIN_VERSION = 1
+BIN_HEADER = struct.Struct("<4sIII")
+BIN_SEGMENT = struct.Struct("<II")
+
+
+def build_segments(addresses, words):
+    """
+    Group emitted words into contiguous runs.
+    Returns: list of (base_address, array('I')) in emission order.
+    """
+    segments = []
+    run = None
+    next_address = None
+    for address, word in zip(addresses, words):
+        if address != next_address:
+            run = array('I')
+            segments.append((address, run))
+        run.append(word)
+        next_address = address + 1
+    return segments
+
+
+def expand_segments(segments, depth=None):
+    """
+    Lay segments out into one flat image starting at address 0.
+    depth defaults to just past the highest used address. Later
+    segments overwrite earlier ones where they overlap.
+    Returns: array('I')
+    """
+    if depth is None:
+        depth = max((base + len(run) for base, run in segments), default=0)
+    image = array('I', bytes(4 * depth))
+    for base, run in segments:
+        end = base + len(run)
+        if end > depth:
+            raise ValueError(f"Segment at 0x{base:X} ends past memory depth {depth}")
+        image[base:end] = run
+    return image
+
+
+def mem_lines(segments, layout="packed"):
+    """Yield the text lines of a .mem file in the given layout."""
+    if layout == "packed":
+        for _base, run in segments:
+            for word in run:
+                yield f"{word:032b}\n"
+    elif layout == "dense":
+        for word in expand_segments(segments):
+            yield f"{word:032b}\n"
+    elif layout == "sparse":
+        for base, run in segments:
+            yield f"@{base:X}\n"
+            for word in run:
+                yield f"{word:032b}\n"
+    else:
+        raise ValueError(f"Unknown layout: {layout}")
+
+
+def write_mem(path, segments, layout="packed"):
+    """Write segments to a .mem file in the given layout."""
+    with open(path, 'w') as f:
+        f.writelines(mem_lines(segments, layout))
+
+
+def parse_word(text):
+    """Parse a 32-character binary or 8-character hex word."""
+    if len(text) == 32:
+        return int(text, 2)
+    if len(text) == 8:
+        return int(text, 16)
+    raise ValueError(f"Not a 32-bit binary or 8-digit hex word: {text!r}")
+
+
+def read_mem(path):
+    """
+    Read a packed, dense or sparse .mem file.
+    Words without a preceding '@' record start at address 0.
+    Blank lines and '//' comments are skipped.
+    Returns: list of (base_address, array('I'))
+    """
+    segments = []
+    run = None
+    with open(path, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            try:
+                if line[0] == "@":
+                    run = array('I')
+                    segments.append((int(line[1:], 16), run))
+                    continue
+                if run is None:
+                    run = array('I')
+                    segments.append((0, run))
+                run.append(parse_word(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_num}: {e}")
+    return [(base, run) for base, run in segments if run]
+
+
+def _le_bytes(words):
+    """Little-endian bytes of an array('I')."""
+    if sys.byteorder == "little":
+        return words.tobytes()
+    swapped = array('I', words)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _le_words(data):
+    """array('I') from little-endian bytes."""
+    words = array('I')
+    words.frombytes(data)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words
+
+
+def write_bin(path, segments, header=False):
+    """
+    Write a raw little-endian uint32 image.
+    Without header: the dense image from address 0.
+    With header: segment table plus only the populated words.
+    """
+    with open(path, 'wb') as f:
+        if not header:
+            f.write(_le_bytes(expand_segments(segments)))
+            return
+        f.write(BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, len(segments), 0))
+        for base, run in segments:
+            f.write(BIN_SEGMENT.pack(base, len(run)))
+        for _base, run in segments:
+            f.write(_le_bytes(run))
+
+
+def read_bin(path):
+    """
+    Read a raw binary image, with or without header.
+    Returns: list of (base_address, array('I'))
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != BIN_MAGIC:
+        if len(data) % 4:
+            raise ValueError(f"{path}: size {len(data)} is not a multiple of 4 bytes")
+        return [(0, _le_words(data))] if data else []
+
+    _magic, version, count, _reserved = BIN_HEADER.unpack_from(data, 0)
+    if version != BIN_VERSION:
+        raise ValueError(f"{path}: unsupported image version {version}")
+    offset = BIN_HEADER.size
+    table = []
+    for _ in range(count):
+        table.append(BIN_SEGMENT.unpack_from(data, offset))
+        offset += BIN_SEGMENT.size
+    segments = []
+    for base, length in table:
+        end = offset + 4 * length
+        if end > len(data):
+            raise ValueError(f"{path}: segment at 0x{base:X} is truncated")
+        segments.append((base, _le_words(data[offset:end])))
+        offset = end
+    return segments
+
+
+VHDL_PACKAGE = "ram_image_pkg"     # the package memory/ram.vhd uses
+VHDL_WORDS_PER_LINE = 6
+
+
+def vhdl_lines(segments, source=None, enabled=True):
+    """
+    Yield a VHDL package holding the image as constants for ram.vhd:
+    RAM_INIT_SEGMENTS lists (base address, index of the first word,
+    word count) per segment and RAM_INIT_WORDS the populated words only.
+    Later segments overwrite earlier ones, as in expand_segments. An empty
+    image gets one zero-length segment and word (no null arrays). With
+    enabled False the package is the empty one that leaves ram.vhd on
+    its textio path.
+    """
+    segments = [(base, run) for base, run in segments if run]
+    total = sum(len(run) for _base, run in segments)
+    yield f"-- Generated by assembler.py{f' from {source}' if source else ''}; do not edit.\n"
+    if enabled:
+        yield f"-- {total} words in {len(segments)} segments.\n"
+    else:
+        yield "-- Empty image: RAM_INIT_ENABLED is FALSE, so ram.vhd reads INIT_FILENAME with textio.\n"
+        yield "-- Replace with: python assembler/src/assembler.py <program.asm> memory/ram_image_pkg.vhd --format vhd\n"
+    yield "LIBRARY ieee;\n"
+    yield "USE ieee.std_logic_1164.ALL;\n"
+    yield "\n"
+    yield f"PACKAGE {VHDL_PACKAGE} IS\n"
+    yield "    TYPE ram_segment IS RECORD\n"
+    yield "        base  : NATURAL;    -- address of the first word\n"
+    yield "        first : NATURAL;    -- its index in RAM_INIT_WORDS\n"
+    yield "        count : NATURAL;\n"
+    yield "    END RECORD;\n"
+    yield "    TYPE ram_segment_array IS ARRAY (NATURAL RANGE <>) OF ram_segment;\n"
+    yield "    TYPE ram_word_array IS ARRAY (NATURAL RANGE <>) OF STD_LOGIC_VECTOR(31 DOWNTO 0);\n"
+    yield "\n"
+    yield f"    CONSTANT RAM_INIT_ENABLED : BOOLEAN := {'TRUE' if enabled else 'FALSE'};\n"
+    yield "\n"
+    yield f"    CONSTANT RAM_INIT_SEGMENTS : ram_segment_array(0 TO {max(len(segments), 1) - 1}) := (\n"
+    if not segments:
+        yield "        0 => (0, 0, 0));\n"
+    first = 0
+    for number, (base, run) in enumerate(segments):
+        end = ");" if number == len(segments) - 1 else ","
+        yield f"        {number} => (16#{base:05X}#, {first}, {len(run)}){end}\n"
+        first += len(run)
+    yield "\n"
+    yield f"    CONSTANT RAM_INIT_WORDS : ram_word_array(0 TO {max(total, 1) - 1}) := (\n"
+    if not segments:
+        yield '        0 => X"00000000");\n'
+    index = 0
+    for number, (base, run) in enumerate(segments):
+        yield f"        -- segment {number}: 16#{base:05X}#\n"
+        for start in range(0, len(run), VHDL_WORDS_PER_LINE):
+            chunk = run[start:start + VHDL_WORDS_PER_LINE]
+            words = ", ".join(f'{index + i} => X"{word:08X}"' for i, word in enumerate(chunk))
+            index += len(chunk)
+            yield f"        {words}{');' if index == total else ','}\n"
+    yield f"END PACKAGE {VHDL_PACKAGE};\n"
+
+
+def write_vhdl(path, segments, source=None):
+    """Write segments as the ram_image_pkg VHDL package (see vhdl_lines)."""
+    with open(path, 'w') as f:
+        f.writelines(vhdl_lines(segments, source))
+
+
+def is_bin(path):
+    """True if path is a raw binary image (.bin extension or header magic)."""
+    if path.lower().endswith(".bin"):
+        return True
+    with open(path, 'rb') as f:
+        return f.read(4) == BIN_MAGIC
+
+
+def read_image(path):
+    """Read any supported image (text .mem layouts or raw .bin) as segments."""
+    return read_bin(path) if is_bin(path) else read_mem(path)
+
+
+def _iter_bin_chunks(path, chunk_words):
+    """Stream (base_address, array('I')) runs from a raw binary image."""
+    with open(path, 'rb') as f:
+        head = f.read(BIN_HEADER.size)
+        if head[:4] != BIN_MAGIC:
+            table = [(0, None)]
+            f.seek(0)
+        else:
+            _magic, version, count, _reserved = BIN_HEADER.unpack(head)
+            if version != BIN_VERSION:
+                raise ValueError(f"{path}: unsupported image version {version}")
+            table = [BIN_SEGMENT.unpack(f.read(BIN_SEGMENT.size)) for _ in range(count)]
+        for base, length in table:
+            address = base
+            remaining = length
+            while remaining is None or remaining > 0:
+                want = chunk_words if remaining is None else min(chunk_words, remaining)
+                data = f.read(4 * want)
+                if len(data) % 4:
+                    raise ValueError(f"{path}: size is not a multiple of 4 bytes")
+                if remaining is not None and len(data) < 4 * want:
+                    raise ValueError(f"{path}: segment at 0x{base:X} is truncated")
+                if not data:
+                    break
+                words = _le_words(data)
+                yield address, words
+                address += len(words)
+                if remaining is not None:
+                    remaining -= len(words)
+
+
+def _parse_text_line(line, address):
+    """
+    Parse one text image line.
+    Returns: (address, word), (address, None) for an '@' record, or None
+    for blank and comment lines.
+    """
+    line = line.split(';', 1)[0].split('#', 1)[0].strip()
+    if not line or line[0] == "/":
+        return None
+    if line[0] == "@":
+        return int(line[1:], 16), None
+    fields = line.split(None, 2)
+    if len(fields) == 1 and line.isalnum():    # int() would accept "_"
+        if len(line) == 32:
+            return address, int(line, 2)
+        if len(line) == 8:
+            return address, int(line, 16)
+    if len(fields) < 2 or len(fields[1]) != 8 or not fields[0].isdigit():
+        raise ValueError(f"Unrecognised image line: {line!r}")
+    return int(fields[0]), int(fields[1], 16)
+
+
+def _be_words(data):
+    """array('I') from big-endian bytes."""
+    words = array('I')
+    words.frombytes(data)
+    if sys.byteorder == "little":
+        words.byteswap()
+    return words
+
+
+def _bulk_words(lines):
+    """
+    Convert a batch made only of plain 32-character binary (or only of
+    8-character hex) word lines in one step, without a per-line loop.
+    Returns: array('I'), or None if the batch needs line-by-line parsing.
+    """
+    # Every line but the last must end in a newline after exactly one word;
+    # the last may lack the newline. Only then is each line one word.
+    lengths = set(map(len, lines[:-1]))
+    last = len(lines[-1])
+    text = "".join(lines).replace("\n", "")
+    count = len(lines)
+    try:
+        # int() rejects any other character but tolerates '_', a sign, a
+        # 0b prefix and surrounding whitespace, so rule those out first
+        if (lengths <= {33} and last in (32, 33) and len(text) == 32 * count and "_" not in text
+                and text[0] in "01" and text[1] in "01" and text[-1] in "01"):
+            return _be_words(int(text, 2).to_bytes(4 * count, "big"))
+        if lengths <= {9} and last in (8, 9) and len(text) == 8 * count:
+            data = bytes.fromhex(text)
+            if len(data) == 4 * count:
+                return _be_words(data)
+    except ValueError:
+        pass
+    return None
+
+
+def _iter_text_chunks(path, chunk_words):
+    """
+    Stream (base_address, array('I')) runs from a text image.
+    Batches made only of plain binary (or only of plain hex) word lines
+    are converted in bulk; anything else goes line by line.
+    """
+    base = address = 0
+    run = array('I')
+    line_num = 0
+    with open(path, 'r') as f:
+        while True:
+            lines = f.readlines(33 * chunk_words)
+            if not lines:
+                break
+            words = _bulk_words(lines)
+            if words is not None:
+                run.extend(words)
+                address += len(words)
+                line_num += len(lines)
+            else:
+                for line in lines:
+                    line_num += 1
+                    try:
+                        parsed = _parse_text_line(line, address)
+                    except ValueError as e:
+                        raise ValueError(f"{path}:{line_num}: {e}")
+                    if parsed is None:
+                        continue
+                    at, word = parsed
+                    if at != address:
+                        if run:
+                            yield base, run
+                            run = array('I')
+                        base = address = at
+                    if word is not None:
+                        run.append(word)
+                        address += 1
+            if len(run) >= chunk_words:
+                yield base, run
+                run = array('I')
+                base = address
+    if run:
+        yield base, run
+
+
+def iter_chunks(path, chunk_words=1 << 16):
+    """
+    Stream any supported image in constant memory as (base_address,
+    array('I')) runs of roughly chunk_words words, in file order.
+    Text lines may be 32-character binary or 8-character hex words,
+    '@<hex address>' records, or _hex.mem listing lines
+    ('<decimal address>  <hex word>  ; source'); '//', ';' and '#'
+    comments are ignored.
+    """
+    if is_bin(path):
+        return _iter_bin_chunks(path, chunk_words)
+    return _iter_text_chunks(path, chunk_words)
+
+
+def detect_format(path):
+    """
+    Name the image format from its header or first data line: 'raw binary',
+    'raw binary (header)', 'sparse', 'binary text', 'hex text', 'listing'
+    or 'empty'.
+    """
+    if is_bin(path):
+        with open(path, 'rb') as f:
+            return "raw binary (header)" if f.read(4) == BIN_MAGIC else "raw binary"
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split(';', 1)[0].split('#', 1)[0].strip()
+            if not line or line[0] == "/":
+                continue
+            if line[0] == "@":
+                return "sparse"
+            if len(line.split()) > 1:
+                return "listing"
+            return "binary text" if len(line) == 32 else "hex text"
+    return "empty"
+
+
+def iter_words(path, chunk_words=1 << 16):
+    """Stream (address, word) pairs from any supported image (see iter_chunks)."""
+    for base, run in iter_chunks(path, chunk_words):
+        yield from zip(range(base, base + len(run)), run)
+
+
+def load_image(path, depth=None):
+    """Read any supported image and expand it to a flat array('I')."""
+    return expand_segments(read_image(path), depth)
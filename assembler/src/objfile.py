@@ -0,0 +1,85 @@
+"""
+Relocatable object files: written by 'assembler.py --format obj', read
+by linker.py.
+
+An object is a JSON document:
+
+    {"format": "asm-object", "version": 1, "name": <source>,
+     "sections": [{"org": <address or null>, "words": [...],
+                   "relocations": [[offset, symbol], ...]}, ...],
+     "symbols": {label: [section index, offset], ...},
+     "exports": [label, ...], "imports": [symbol, ...]}
+
+A section with "org": null is relocatable and placed by the linker;
+the others stay at their .ORG address. Each relocation names the word
+(offset into its section) that must hold the 16-bit sign-extended
+address of a symbol: a label of the same module, or an import resolved
+against the other modules' exports.
+"""
+
+import json
+
+
+OBJECT_FORMAT = "asm-object"
+OBJECT_VERSION = 1
+
+
+class Section:
+    """Words of one .ORG section, or of the relocatable section (org None)."""
+    __slots__ = ("org", "words", "relocations")
+
+    def __init__(self, org, words, relocations):
+        self.org = org                      # absolute base address, or None if relocatable
+        self.words = words                  # array('I') or list of ints
+        self.relocations = relocations      # list of (offset, symbol)
+
+
+class ObjectModule:
+    """One separately assembled module."""
+    __slots__ = ("name", "sections", "symbols", "exports", "imports")
+
+    def __init__(self, name, sections, symbols, exports, imports):
+        self.name = name            # source name
+        self.sections = sections    # list of Section
+        self.symbols = symbols      # {label: (section index, offset)}, every label defined here
+        self.exports = exports      # labels visible to other modules (.GLOBAL)
+        self.imports = imports      # symbols expected from other modules (.EXTERN)
+
+
+def write_object(path, module):
+    """Write an ObjectModule as JSON."""
+    data = {
+        "format": OBJECT_FORMAT,
+        "version": OBJECT_VERSION,
+        "name": module.name,
+        "sections": [{"org": s.org, "words": list(s.words),
+                      "relocations": [list(r) for r in s.relocations]}
+                     for s in module.sections],
+        "symbols": {label: list(place) for label, place in module.symbols.items()},
+        "exports": list(module.exports),
+        "imports": list(module.imports),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+        f.write("\n")
+
+
+def read_object(path):
+    """
+    Read an object file written by write_object.
+    Returns: ObjectModule
+    Raises ValueError if the file is not an object of this version.
+    """
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: not an object file ({e})")
+    if not isinstance(data, dict) or data.get("format") != OBJECT_FORMAT:
+        raise ValueError(f"{path}: not an object file")
+    if data.get("version") != OBJECT_VERSION:
+        raise ValueError(f"{path}: object version {data.get('version')} is not supported")
+    sections = [Section(s["org"], s["words"], [tuple(r) for r in s["relocations"]])
+                for s in data["sections"]]
+    symbols = {label: tuple(place) for label, place in data["symbols"].items()}
+    return ObjectModule(data["name"], sections, symbols, data["exports"], data["imports"])
@@ -0,0 +1,281 @@
+"""
+Peephole and dead-code optimizer for the assembler (assembler.py -O).
+Runs on the tokenized program before pass 1, so addresses and the symbol
+table are computed for the shortened program. Rewrites, repeated until
+nothing changes:
+
+- unreachable instructions after JMP/RET/RTI/HLT (up to the next label)
+- NOP padding
+- JMP to the instruction that directly follows it
+- redundant MOVs: copying a register onto itself or onto a register
+  already known to hold the same value
+- LDM Rx, a followed by IADD Rx, Rx, k becomes LDM Rx, a+k when the sum
+  still fits the 16-bit immediate and the flags IADD sets are overwritten
+  before anything can read them
+
+Removing words moves everything after them, so only .ORG sections made
+of instructions alone, clear of the vector table and with no numeric
+jump or vector target past their start, are rewritten (see
+scheduler.jump_targets). Labels on removed
+instructions stay where they are, on the next instruction. Code that
+computes addresses of its own instructions must label them.
+"""
+
+from assembler import (SourceLine, instruction_map, pass1_build_symbol_table, parse_immediate,
+                       sign_extend_16, OPERAND_NUM, OPERAND_SYM, LINKAGE_DIRECTIVES)
+from pipeline_model import COSTS
+from scheduler import TERMINATORS, instruction_effects, jump_targets
+
+
+# Control transfers that never fall through to the next instruction
+UNCONDITIONAL = frozenset(("JMP", "RET", "RTI", "HLT"))
+
+# Transfers after which register and flag contents cannot be followed
+BARRIERS = TERMINATORS | {"INT"}
+
+ALL_FLAGS = frozenset(("Z", "N", "C"))
+
+VECTOR_WORDS = 4    # M[0] reset, M[1] interrupt, M[2..3] INT vectors are read as addresses
+
+FLAG_LOOKAHEAD = 32     # instructions searched for the flags a folded IADD would have set
+
+
+def instruction_cycles(name):
+    """Estimated cycles one execution of an instruction costs (pipeline_model.COSTS)."""
+    cycles = 1
+    if instruction_map[name]["num_words"] == 2:
+        cycles += COSTS["immediate"]
+    if name in ("JMP", "CALL"):
+        cycles += COSTS["decode_redirect"]
+    return cycles
+
+
+class Rewriter:
+    """Applies the peephole rules to one .ORG section and records what they saved."""
+
+    def __init__(self, entries, report):
+        self.entries = entries      # SourceLines of the section
+        self.report = report        # shared list of change records
+
+    def record(self, entry, rule, words, cycles):
+        self.report.append({
+            "line": entry.line_num,
+            "rule": rule,
+            "text": entry.text,
+            "words": words,
+            "cycles": cycles,
+        })
+
+    def drop(self, out, entry, rule, executed=True):
+        """Record a removed instruction; its label stays in out as a label-only line."""
+        name = entry.mnemonic
+        self.record(entry, rule, instruction_map[name]["num_words"],
+                    instruction_cycles(name) if executed else 0)
+        if entry.label:
+            out.append(SourceLine(entry.line_num, entry.text, entry.label, None, (), ()))
+
+    def run(self):
+        """Apply every rule until none of them changes the section."""
+        while True:
+            changes = len(self.report)
+            for rule in (self.remove_unreachable, self.remove_nops, self.remove_jump_to_next,
+                         self.remove_redundant_moves, self.fold_load_add):
+                self.entries = rule(self.entries)
+            if len(self.report) == changes:
+                return self.entries
+
+    def remove_unreachable(self, entries):
+        out = []
+        dead = False
+        for entry in entries:
+            if entry.label:
+                dead = False
+            if dead and entry.mnemonic is not None:
+                self.drop(out, entry, "unreachable", executed=False)
+                continue
+            out.append(entry)
+            dead = entry.mnemonic in UNCONDITIONAL
+        return out
+
+    def remove_nops(self, entries):
+        out = []
+        for entry in entries:
+            if entry.mnemonic == "NOP":
+                self.drop(out, entry, "NOP")
+            else:
+                out.append(entry)
+        return out
+
+    def remove_jump_to_next(self, entries):
+        # Labels naming the address right after each entry, found walking backwards
+        following = [()] * len(entries)
+        labels = ()
+        for index in range(len(entries) - 1, -1, -1):
+            following[index] = labels
+            entry = entries[index]
+            if entry.mnemonic is not None:
+                labels = ()
+            if entry.label:
+                labels = labels + (entry.label,)
+        out = []
+        for entry, labels in zip(entries, following):
+            if entry.mnemonic == "JMP" and entry.kinds == (OPERAND_SYM,) and entry.operands[0] in labels:
+                self.drop(out, entry, "JMP to next")
+            else:
+                out.append(entry)
+        return out
+
+    def remove_redundant_moves(self, entries):
+        out = []
+        group = {}              # register -> id of the set of registers holding one value
+        groups = 0
+        for entry in entries:
+            name = entry.mnemonic
+            if entry.label:
+                group.clear()
+            if name is None:
+                out.append(entry)
+                continue
+            effects = instruction_effects(entry)
+            if effects is None:
+                group.clear()
+            elif name == "MOV":
+                src, dst = entry.operands[0], entry.operands[1]
+                if src == dst or (src in group and group[src] == group.get(dst)):
+                    self.drop(out, entry, "redundant MOV")
+                    continue
+                if src not in group:
+                    groups += 1
+                    group[src] = groups
+                group[dst] = group[src]
+            else:
+                for resource in effects[1]:
+                    group.pop(resource, None)
+            if name in BARRIERS:
+                group.clear()
+            out.append(entry)
+        return out
+
+    def fold_load_add(self, entries):
+        out = []
+        index = 0
+        while index < len(entries):
+            load = entries[index]
+            add = entries[index + 1] if index + 1 < len(entries) else None
+            index += 1
+            if (add is None or load.mnemonic != "LDM" or add.mnemonic != "IADD" or add.label
+                    or load.kinds[1:] != (OPERAND_NUM,) or add.kinds[2:] != (OPERAND_NUM,)
+                    or add.operands[:2] != (load.operands[0], load.operands[0])):
+                out.append(load)
+                continue
+            value = (sign_extend_16(parse_immediate(load.operands[1]))
+                     + sign_extend_16(parse_immediate(add.operands[2]))) & 0xFFFFFFFF
+            if 0x8000 <= value < 0xFFFF8000 or flags_live(entries, index + 1):
+                out.append(load)
+                continue
+            operand = f"0x{value:X}" if value < 0x8000 else str(value - (1 << 32))
+            register = load.operands[0]
+            self.record(add, "LDM+IADD folded", instruction_map["IADD"]["num_words"],
+                        instruction_cycles("IADD"))
+            out.append(SourceLine(
+                load.line_num, f"LDM {register}, {operand}  ; folded lines {load.line_num}-{add.line_num}",
+                load.label, "LDM", (register, operand), load.kinds))
+            index += 1
+        return out
+
+
+def flags_live(entries, index):
+    """
+    True unless every flag is overwritten, from entries[index] on, before
+    a label, control transfer or flag reader. Gives up (live) after
+    FLAG_LOOKAHEAD instructions.
+    """
+    pending = set(ALL_FLAGS)
+    for entry in entries[index:index + FLAG_LOOKAHEAD]:
+        name = entry.mnemonic
+        if entry.label or name in BARRIERS:
+            return True
+        if name is None:
+            continue
+        effects = instruction_effects(entry)
+        if effects is None:
+            return True
+        pending -= effects[1]
+        if not pending:
+            return False
+    return True
+
+
+def line_addresses(program, symbol_table):
+    """Address of every SourceLine, as pass 1 assigns them."""
+    addresses = []
+    address = 0
+    for entry in program:
+        name = entry.mnemonic
+        if name == ".ORG":
+            address = parse_immediate(entry.operands[0], symbol_table)
+        addresses.append(address)
+        if name in instruction_map:
+            address += instruction_map[name]["num_words"]
+        elif name is not None and name != ".ORG" and name not in LINKAGE_DIRECTIVES:
+            address += 1
+    return addresses
+
+
+def optimize_program(program, relocatable=False):
+    """
+    Apply the peephole and dead-code rules to a tokenized program.
+    With relocatable, the lines before the first .ORG are placed by the
+    linker, never over the vector table.
+    Returns: (optimized program, report) where report lists every change
+    as dicts with line, rule, text, words and cycles (estimated cycles
+    saved per execution of the removed code).
+    Raises ValueError on the same errors pass 1 reports.
+    """
+    symbol_table = pass1_build_symbol_table(program)
+    # .GLOBAL/.EXTERN lines take no space; keep them out of the way, up front
+    linkage = [e for e in program if e.mnemonic in LINKAGE_DIRECTIVES and not e.label]
+    program = [e for e in program if e.mnemonic not in LINKAGE_DIRECTIVES or e.label]
+    addresses = line_addresses(program, symbol_table)
+    targets = jump_targets(program)
+    report = []
+
+    sections = []
+    start = 0
+    for index, entry in enumerate(program):
+        if entry.mnemonic == ".ORG":
+            sections.append((start, index))
+            start = index + 1
+    sections.append((start, len(program)))
+
+    optimized = linkage
+    previous = 0
+    for number, (start, end) in enumerate(sections):
+        optimized.extend(program[previous:start])      # the .ORG line itself
+        previous = end
+        entries = program[start:end]
+        if any(e.mnemonic is not None and e.mnemonic not in instruction_map for e in entries):
+            optimized.extend(entries)                   # holds data words
+            continue
+        if entries:
+            base = addresses[start]
+            end_address = base + sum(instruction_map[e.mnemonic]["num_words"]
+                                     for e in entries if e.mnemonic is not None)
+            in_vectors = base < VECTOR_WORDS and not (relocatable and number == 0)
+            if in_vectors or any(base < target < end_address for target in targets):
+                optimized.extend(entries)               # numerically addressed inside
+                continue
+        optimized.extend(Rewriter(entries, report).run())
+    optimized.extend(program[previous:])
+    report.sort(key=lambda change: change["line"])
+    return optimized, report
+
+
+def report_lines(report):
+    """Yield the optimization report as printable lines."""
+    for change in report:
+        yield (f"  line {change['line']:<5} {change['rule']:<16} {change['words']} words "
+               f"{change['cycles']:>2} cycles  {change['text']}\n")
+    words = sum(change["words"] for change in report)
+    cycles = sum(change["cycles"] for change in report)
+    yield f"  Total saved: {words} words, {cycles} cycles (one pass through each site)\n"
@@ -0,0 +1,262 @@
+"""
+Cycle-level performance model of the 5-stage pipeline.
+Replays a program on the functional simulator and charges the costs the
+RTL pays, without a waveform simulation:
+
+- fill:          4 cycles before the first instruction retires
+- immediate:     +1 cycle to fetch the second word of a two-word instruction
+- arbiter:       +1 cycle per data-memory access, since memory_arbiter.vhd
+                 gives the MEM stage priority and stalls fetch
+- load-use:      +1 cycle when LDD/POP is followed by a reader of its result
+                 (load_use_detection_unit.vhd)
+- multi-cycle:   SWAP 2, INT 3, RTI 2 cycles (OPCODES.txt)
+- control flow:  JMP/CALL resolve in decode (1 bubble); JZ/JN/JC resolve in
+                 execute (2 bubbles when mispredicted, 1 when correctly
+                 predicted taken); RET/RTI/INT redirect from memory (3 bubbles)
+
+The costs live in COSTS so they can be tuned against waveforms.
+
+Usage: python pipeline_model.py <image> [--in V ...] [--predictor P|all] [--json FILE]
+"""
+
+from simulator import (Simulator, SimulationError, decode_word, load_program, MNEMONICS,
+                       OP_ADD, OP_SUB, OP_AND, OP_IADD, OP_INC, OP_NOT, OP_MOV, OP_SWAP,
+                       OP_LDD, OP_STD, OP_OUT, OP_PUSH, OP_POP, OP_JZ, OP_JN, OP_JC,
+                       OP_JMP, OP_CALL, OP_RET, OP_INT, OP_RTI, INSTRUCTION_SIZE)
+
+
+COSTS = {
+    "fill": 4,
+    "immediate": 1,
+    "arbiter": 1,
+    "load_use": 1,
+    "decode_redirect": 1,      # JMP, CALL
+    "predicted_taken": 1,      # conditional branch, predicted and taken
+    "mispredict": 2,           # conditional branch resolved in execute
+    "memory_redirect": 3,      # RET, RTI, INT
+}
+
+# Extra cycles of multi-cycle instructions beyond the first
+MULTI_CYCLE_EXTRA = {OP_SWAP: 1, OP_INT: 2, OP_RTI: 1}
+
+# Data-memory accesses made in the MEM stage
+DATA_ACCESSES = {OP_LDD: 1, OP_STD: 1, OP_PUSH: 1, OP_POP: 1, OP_CALL: 1, OP_RET: 1,
+                 OP_INT: 3, OP_RTI: 2}
+
+# Conditional branches and the CCR bit each tests ([0]=C, [1]=N, [2]=Z)
+CONDITIONAL_BRANCHES = {OP_JZ: 1 << 2, OP_JN: 1 << 1, OP_JC: 1 << 0}
+
+
+def source_registers(op, rd, r1, r2):
+    """Registers an instruction reads in decode (for load-use detection)."""
+    if op in (OP_ADD, OP_SUB, OP_AND, OP_STD):
+        return (r1, r2)
+    if op in (OP_IADD, OP_INC, OP_NOT, OP_MOV, OP_LDD):
+        return (r1,)
+    if op == OP_SWAP:
+        return (r1, rd)
+    if op in (OP_OUT, OP_PUSH):
+        return (r2,)
+    return ()
+
+
+class Predictor:
+    """Branch predictor policy; subclasses override predict/update."""
+    name = "base"
+
+    def predict(self, pc):
+        return False
+
+    def update(self, pc, taken):
+        pass
+
+
+class StaticNotTaken(Predictor):
+    name = "not-taken"
+
+
+class StaticTaken(Predictor):
+    name = "taken"
+
+    def predict(self, pc):
+        return True
+
+
+class OneBit(Predictor):
+    """Last outcome per branch address (initially not taken)."""
+    name = "1bit"
+
+    def __init__(self):
+        self.last = {}
+
+    def predict(self, pc):
+        return self.last.get(pc, False)
+
+    def update(self, pc, taken):
+        self.last[pc] = taken
+
+
+class TwoBit(Predictor):
+    """Saturating 2-bit counter per branch address (initially weakly not taken)."""
+    name = "2bit"
+
+    def __init__(self):
+        self.counters = {}
+
+    def predict(self, pc):
+        return self.counters.get(pc, 1) >= 2
+
+    def update(self, pc, taken):
+        count = self.counters.get(pc, 1)
+        self.counters[pc] = min(count + 1, 3) if taken else max(count - 1, 0)
+
+
+PREDICTORS = {cls.name: cls for cls in (StaticNotTaken, StaticTaken, OneBit, TwoBit)}
+
+
+def model_program(sim, predictors, max_steps=1_000_000):
+    """
+    Step sim one instruction at a time and account pipeline costs.
+    predictors: list of Predictor instances evaluated side by side.
+    Returns: report dict (see print_report for the fields)
+    """
+    counts = {
+        "instructions": 0,
+        "immediate_cycles": 0,
+        "arbiter_conflicts": 0,
+        "load_use_stalls": 0,
+        "redirect_cycles": 0,
+    }
+    multi_cycle = {MNEMONICS[op]: 0 for op in MULTI_CYCLE_EXTRA}
+    branches = {}                          # pc -> [mnemonic, executed, taken]
+    mispredicts = {p.name: {} for p in predictors}
+    predicted_taken = {p.name: 0 for p in predictors}
+    pending_load = None                    # destination of LDD/POP in the previous slot
+
+    while counts["instructions"] < max_steps and not sim.halted:
+        pc = sim.pc
+        op, rd, r1, r2, value, _next_pc = decode_word(sim.memory, pc)
+        flags = sim.ccr
+        sim.run(1)
+        counts["instructions"] += 1
+
+        if INSTRUCTION_SIZE[op] == 2:
+            counts["immediate_cycles"] += COSTS["immediate"]
+        accesses = DATA_ACCESSES.get(op)
+        if accesses:
+            counts["arbiter_conflicts"] += accesses
+        if pending_load is not None and pending_load in source_registers(op, rd, r1, r2):
+            counts["load_use_stalls"] += 1
+        pending_load = rd if op in (OP_LDD, OP_POP) else None
+        extra = MULTI_CYCLE_EXTRA.get(op)
+        if extra:
+            multi_cycle[MNEMONICS[op]] += extra
+
+        if op in CONDITIONAL_BRANCHES:
+            # From the flag tested, so a branch to the next instruction still counts as taken
+            taken = bool(flags & CONDITIONAL_BRANCHES[op])
+            stats = branches.setdefault(pc, [MNEMONICS[op], 0, 0])
+            stats[1] += 1
+            stats[2] += taken
+            for predictor in predictors:
+                guess = predictor.predict(pc)
+                if guess != taken:
+                    table = mispredicts[predictor.name]
+                    table[pc] = table.get(pc, 0) + 1
+                elif taken:
+                    predicted_taken[predictor.name] += 1
+                predictor.update(pc, taken)
+        elif op in (OP_JMP, OP_CALL):
+            counts["redirect_cycles"] += COSTS["decode_redirect"]
+        elif op in (OP_RET, OP_RTI, OP_INT):
+            counts["redirect_cycles"] += COSTS["memory_redirect"]
+
+    base = (COSTS["fill"] + counts["instructions"] + counts["immediate_cycles"]
+            + counts["arbiter_conflicts"] * COSTS["arbiter"]
+            + counts["load_use_stalls"] * COSTS["load_use"]
+            + sum(multi_cycle.values()) + counts["redirect_cycles"])
+
+    policies = {}
+    for predictor in predictors:
+        missed = sum(mispredicts[predictor.name].values())
+        branch_cycles = (missed * COSTS["mispredict"]
+                         + predicted_taken[predictor.name] * COSTS["predicted_taken"])
+        cycles = base + branch_cycles
+        policies[predictor.name] = {
+            "cycles": cycles,
+            "cpi": cycles / counts["instructions"] if counts["instructions"] else 0.0,
+            "mispredictions": missed,
+            "branch_cycles": branch_cycles,
+            "mispredictions_by_address": {f"0x{pc:05X}": n for pc, n in
+                                          sorted(mispredicts[predictor.name].items())},
+        }
+
+    report = dict(counts)
+    report["halted"] = sim.halted
+    report["multi_cycle_extra"] = multi_cycle
+    report["branches"] = {f"0x{pc:05X}": {"op": s[0], "executed": s[1], "taken": s[2]}
+                          for pc, s in sorted(branches.items())}
+    report["predictors"] = policies
+    return report
+
+
+def print_report(report):
+    """Print a model report as text."""
+    print("=" * 70)
+    print("PIPELINE PERFORMANCE MODEL")
+    print("=" * 70)
+    print(f"Instructions:        {report['instructions']} ({'halted' if report['halted'] else 'step limit'})")
+    print(f"Immediate fetches:   {report['immediate_cycles']} cycles")
+    print(f"Arbiter conflicts:   {report['arbiter_conflicts']} (fetch stalled by data access)")
+    print(f"Load-use stalls:     {report['load_use_stalls']}")
+    print(f"Control redirects:   {report['redirect_cycles']} cycles (JMP/CALL/RET/RTI/INT)")
+    for name, extra in report["multi_cycle_extra"].items():
+        print(f"{name + ' extra:':<21}{extra} cycles")
+    print("-" * 70)
+    print(f"{'Predictor':<12} {'Cycles':>12} {'CPI':>7} {'Mispredicts':>12} {'Branch cyc':>11}")
+    for name, policy in report["predictors"].items():
+        print(f"{name:<12} {policy['cycles']:>12} {policy['cpi']:>7.3f} "
+              f"{policy['mispredictions']:>12} {policy['branch_cycles']:>11}")
+    if report["branches"]:
+        print("-" * 70)
+        names = list(report["predictors"])
+        print(f"{'Branch':<9} {'Op':<4} {'Executed':>9} {'Taken':>9}  " +
+              " ".join(f"{n:>10}" for n in names))
+        for addr, stats in report["branches"].items():
+            missed = [report["predictors"][n]["mispredictions_by_address"].get(addr, 0) for n in names]
+            print(f"{addr:<9} {stats['op']:<4} {stats['executed']:>9} {stats['taken']:>9}  " +
+                  " ".join(f"{m:>10}" for m in missed))
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Cycle-level pipeline performance model")
+    parser.add_argument("image", help=".mem/.bin image or .asm source")
+    parser.add_argument("--in", dest="inputs", type=lambda s: int(s, 0), nargs="*", default=[],
+                        help="IN port values, consumed in order")
+    parser.add_argument("--max-steps", type=int, default=1_000_000, help="instruction limit")
+    parser.add_argument("--predictor", choices=sorted(PREDICTORS) + ["all"], default="all",
+                        help="branch predictor policy to model (default: compare all)")
+    parser.add_argument("--json", metavar="FILE", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    names = sorted(PREDICTORS) if args.predictor == "all" else [args.predictor]
+    try:
+        sim = Simulator(load_program(args.image), args.inputs)
+        report = model_program(sim, [PREDICTORS[n]() for n in names], args.max_steps)
+    except (OSError, ValueError, SimulationError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
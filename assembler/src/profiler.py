@@ -0,0 +1,266 @@
+"""
+Execution hot-spot profiler.
+Runs an image on the functional simulator with its profiling counters on
+(Simulator.enable_profiling): one array('Q') counter per address for
+executions and one for taken JZ/JN/JC, so the run loop pays one array
+increment per instruction and nothing per branch not taken.
+
+Basic blocks are recovered from the counts after the run: a block starts
+at a jump, call or INT vector target, after any control transfer, where
+execution did not fall through from the previous instruction, or where
+the count changes (an entry the image does not show, such as a return
+from the external interrupt). Code overwritten while running is decoded
+as it is at the end of the run.
+
+The _hex.mem listing is written back annotated: execution count, taken/
+not taken for conditional branches and a block number at each block
+start, next to every ADDR | HEX | Source line.
+
+Usage: python profiler.py <program.asm|image_hex.mem|image> [--listing FILE] [-o FILE] [--json FILE] [--top N] [--in V ...] [--max-steps N]
+"""
+
+import re
+
+from assembler import OPCODE_SHIFT
+from simulator import (Simulator, decode_word, ADDR_MASK, RESET_VECTOR,
+                       INTERRUPT_VECTOR, MNEMONICS, OP_JZ, OP_JN, OP_JC, OP_JMP, OP_CALL,
+                       OP_RET, OP_INT, OP_RTI, OP_HLT)
+
+
+CONDITIONAL_BRANCHES = (OP_JZ, OP_JN, OP_JC)
+
+# Instructions after which execution does not simply fall through
+TRANSFERS = frozenset(CONDITIONAL_BRANCHES + (OP_JMP, OP_CALL, OP_RET, OP_INT, OP_RTI, OP_HLT))
+
+# Instructions whose second word is a code address
+DIRECT_TARGETS = frozenset(CONDITIONAL_BRANCHES + (OP_JMP, OP_CALL))
+
+LISTING_LINE = re.compile(r"^(\d+)\s+([0-9A-Fa-f]{8})\b\s*(.*)$")
+
+LISTING_FORMAT = "// Format: ADDR | HEX | COUNT | TAKEN/NOT TAKEN | BLOCK | Source\n"
+
+
+class Profile:
+    """Counters of one profiled run and the basic blocks found in them."""
+    __slots__ = ("counts", "taken", "memory", "steps", "halted", "blocks", "block_at")
+
+    def __init__(self, sim):
+        self.counts = sim.exec_counts       # executions per address
+        self.taken = sim.taken_counts       # taken conditional branches per address
+        self.memory = sim.memory
+        self.steps = sim.steps
+        self.halted = sim.halted
+        self.blocks = find_blocks(self.memory, self.counts)
+        self.block_at = {block[0]: number for number, block in enumerate(self.blocks)}
+
+    def executed(self):
+        """Executed addresses in ascending order."""
+        return [address for address, count in enumerate(self.counts) if count]
+
+    def branches(self):
+        """
+        Conditional branches that ran.
+        Returns: list of (address, mnemonic, taken, not taken)
+        """
+        memory, counts, taken = self.memory, self.counts, self.taken
+        out = []
+        for address in self.executed():
+            op = memory[address] >> OPCODE_SHIFT
+            if op in CONDITIONAL_BRANCHES:
+                out.append((address, MNEMONICS[op], taken[address], counts[address] - taken[address]))
+        return out
+
+    def to_dict(self, image=None):
+        """The profile as a JSON-ready dict (addresses as 0x%05X strings)."""
+        return {
+            "image": image,
+            "instructions": self.steps,
+            "halted": self.halted,
+            "counts": {f"0x{address:05X}": self.counts[address] for address in self.executed()},
+            "branches": {f"0x{address:05X}": {"op": op, "taken": taken, "not_taken": not_taken}
+                         for address, op, taken, not_taken in self.branches()},
+            "blocks": [{"start": f"0x{start:05X}", "end": f"0x{end:05X}",
+                        "instructions": size, "count": count}
+                       for start, end, size, count in self.blocks],
+        }
+
+
+def find_blocks(memory, counts):
+    """
+    Split the executed instructions into basic blocks.
+    Returns: list of (start, end, instructions, count) in address order,
+    where end is the address after the last instruction and count is
+    how often the block was entered
+    """
+    executed = [address for address, count in enumerate(counts) if count]
+    decoded = {address: decode_word(memory, address) for address in executed}
+    leaders = {memory[RESET_VECTOR] & ADDR_MASK, memory[INTERRUPT_VECTOR] & ADDR_MASK}
+    for op, _rd, _r1, _r2, value, _next_pc in decoded.values():
+        if op in DIRECT_TARGETS:
+            leaders.add(value & ADDR_MASK)
+        elif op == OP_INT:
+            leaders.add(memory[value] & ADDR_MASK)
+
+    blocks = []
+    start = size = None
+    follows = -1        # address the previous instruction falls through to
+    for address in executed:
+        op, _rd, _r1, _r2, _value, next_pc = decoded[address]
+        if (start is None or address != follows or address in leaders
+                or counts[address] != counts[start]):
+            if start is not None:
+                blocks.append((start, follows, size, counts[start]))
+            start, size = address, 0
+        size += 1
+        follows = next_pc
+        if op in TRANSFERS:
+            blocks.append((start, next_pc, size, counts[start]))
+            start = None
+    if start is not None:
+        blocks.append((start, follows, size, counts[start]))
+    return blocks
+
+
+def profile_program(segments, inputs=(), max_steps=None):
+    """Run an image with profiling counters on. Returns: a Profile"""
+    sim = Simulator(segments, inputs)
+    sim.enable_profiling()
+    sim.run(max_steps)
+    return Profile(sim)
+
+
+def annotate_listing(lines, profile):
+    """
+    Yield the lines of a _hex.mem listing with the profile's counts added.
+    Second words (and words never executed) get an empty count column.
+    """
+    counts, taken, memory = profile.counts, profile.taken, profile.memory
+    for line in lines:
+        if line.startswith("// Format:"):
+            yield LISTING_FORMAT
+            status = "halted" if profile.halted else "step limit reached"
+            yield f"// Profile: {profile.steps} instructions ({status}), {len(profile.blocks)} blocks\n"
+            continue
+        match = LISTING_LINE.match(line)
+        if match is None:
+            yield line if line.endswith("\n") else line + "\n"
+            continue
+        address = int(match.group(1)) & ADDR_MASK
+        count = counts[address]
+        branch = block = ""
+        if count:
+            if memory[address] >> OPCODE_SHIFT in CONDITIONAL_BRANCHES:
+                branch = f"{taken[address]}/{count - taken[address]}"
+            if address in profile.block_at:
+                block = f"B{profile.block_at[address]}"
+        yield (f"{match.group(1)}  {match.group(2)}  {count or '':>10}  {branch:<21}  "
+               f"{block:<6}  {match.group(3)}\n")
+
+
+def listing_sources(lines):
+    """Map address -> source text from _hex.mem listing lines."""
+    sources = {}
+    for line in lines:
+        match = LISTING_LINE.match(line)
+        if match:
+            sources.setdefault(int(match.group(1)) & ADDR_MASK, match.group(3).lstrip("; ").strip())
+    return sources
+
+
+def print_report(profile, sources, top=10):
+    """Print the hottest addresses, blocks and branches."""
+    steps = profile.steps or 1
+    print("=" * 70)
+    print("EXECUTION PROFILE")
+    print("=" * 70)
+    print(f"Instructions: {profile.steps} ({'halted' if profile.halted else 'step limit reached'})")
+    executed = profile.executed()
+    print(f"Addresses executed: {len(executed)}  Basic blocks: {len(profile.blocks)}")
+    print("-" * 70)
+    print(f"{'Addr':<9} {'Count':>12} {'Share':>7}  Source")
+    counts = profile.counts
+    for address in sorted(executed, key=lambda a: -counts[a])[:top]:
+        print(f"0x{address:05X}  {counts[address]:>12} {100 * counts[address] / steps:>6.1f}%  "
+              f"{sources.get(address, '')}")
+    print("-" * 70)
+    print(f"{'Block':<7} {'Start':<9} {'Instrs':>6} {'Entries':>12} {'Executed':>12} {'Share':>7}")
+    hot = sorted(enumerate(profile.blocks), key=lambda b: -b[1][2] * b[1][3])[:top]
+    for number, (start, _end, size, count) in hot:
+        print(f"B{number:<6} 0x{start:05X}  {size:>6} {count:>12} {size * count:>12} "
+              f"{100 * size * count / steps:>6.1f}%")
+    branches = profile.branches()
+    if branches:
+        print("-" * 70)
+        print(f"{'Branch':<9} {'Op':<4} {'Taken':>12} {'Not taken':>12} {'Taken %':>8}")
+        for address, op, taken, not_taken in sorted(branches, key=lambda b: -(b[2] + b[3]))[:top]:
+            print(f"0x{address:05X}  {op:<4} {taken:>12} {not_taken:>12} "
+                  f"{100 * taken / (taken + not_taken):>7.1f}%")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import json
+    import os
+    import sys
+
+    import memfile
+    from assembler import assemble_source
+    from simulator import SimulationError
+
+    parser = argparse.ArgumentParser(description="Execution hot-spot profiler with annotated listings")
+    parser.add_argument("image", help=".asm source, _hex.mem listing or any .mem/.bin image")
+    parser.add_argument("--listing", metavar="FILE",
+                        help="_hex.mem listing to annotate (default: the image itself if it "
+                             "is a listing, or the listing of the .asm)")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="annotated listing (default: <image>_profile.txt)")
+    parser.add_argument("--json", metavar="FILE", help="also write the profile as JSON")
+    parser.add_argument("--top", type=int, default=10, help="rows per report table (default: 10)")
+    parser.add_argument("--in", dest="inputs", type=lambda s: int(s, 0), nargs="*", default=[],
+                        help="IN port values, consumed in order (0 once exhausted)")
+    parser.add_argument("--max-steps", type=int, default=10_000_000,
+                        help="stop after this many instructions (default: 10M)")
+    args = parser.parse_args()
+
+    try:
+        listing = None
+        if args.image.lower().endswith(".asm"):
+            with open(args.image, 'r') as f:
+                result = assemble_source(f.read(), args.image)
+            segments = result.segments()
+            listing = list(result.hex_lines())
+        else:
+            if not memfile.is_bin(args.image) and memfile.detect_format(args.image) == "listing":
+                with open(args.image, 'r') as f:
+                    listing = f.readlines()
+                segments = list(memfile.iter_chunks(args.image))
+            else:
+                segments = memfile.read_image(args.image)
+        if args.listing:
+            with open(args.listing, 'r') as f:
+                listing = f.readlines()
+        if args.output and listing is None:
+            raise ValueError("no listing to annotate (use --listing FILE)")
+        profile = profile_program(segments, args.inputs, args.max_steps)
+    except (OSError, ValueError, SimulationError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_report(profile, listing_sources(listing or ()), args.top)
+    if listing is not None:
+        output = args.output
+        if output is None:
+            base = args.image[:-len("_hex.mem")] if args.image.endswith("_hex.mem") else \
+                os.path.splitext(args.image)[0]
+            output = base + "_profile.txt"
+        with open(output, 'w') as f:
+            f.writelines(annotate_listing(listing, profile))
+        print(f"Annotated listing: {output}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(profile.to_dict(args.image), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
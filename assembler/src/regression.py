@@ -0,0 +1,297 @@
+"""
+Golden regression runner for the assembler test corpus.
+Finds every .asm below the given directories (default: assembler/tests,
+Test Cases/ included), pairs each with its golden outputs, then
+assembles and compares them in parallel worker processes. Nothing is
+written but the reports: sources are assembled in memory and compared
+with validate.compare_images.
+
+A source's golden outputs are, in any image format memfile reads:
+
+- <stem>.mem, <stem>_hex.mem, <stem>.bin or <stem>.expected next to it
+- _hex.mem listings in the golden directories (default: the source
+  directories and assembler/output) whose '// Machine code generated
+  from:' header names the source, and the <base>.mem beside each
+- text files there whose first line reads 'Expected machine code for
+  <name>', naming a source in the same directory
+
+Goldens with addresses (listings, sparse, .bin with header) are compared
+address by address. Text images without addresses are compared with the
+packed layout (emission order) unless --layout dense is given, and
+headerless .bin images with the dense layout.
+
+Usage: python regression.py [DIR|FILE.asm ...] [--golden-dir DIR ...] [-j JOBS] [--layout L] [--junit FILE] [--json FILE]
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import memfile
+from assembler import assemble_source
+from validate import compare_images, ordered_chunks, sorted_runs
+
+
+GOLDEN_SUFFIXES = (".mem", "_hex.mem", ".bin", ".expected")
+LISTING_HEADER = "// Machine code generated from:"
+EXPECTED_HEADER = "Expected machine code for"
+HEADER_LINES = 5            # lines searched for either header
+
+# Formats compared by address; the rest follow the layout
+ADDRESSED_FORMATS = ("listing", "sparse", "raw binary (header)")
+
+SHOW = 5                    # mismatches kept per golden
+
+
+def _path_parts(path):
+    """Normalised path components, without leading '.' and '..' (both separators)."""
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    while parts and parts[0] in (".", ".."):
+        parts.pop(0)
+    return parts
+
+
+def _header_source(path):
+    """
+    The source a golden file names in its header.
+    Returns: ('listing', path as written) or ('expected', file name), or None
+    """
+    try:
+        with open(path, 'r', errors="replace") as f:
+            for _ in range(HEADER_LINES):
+                line = f.readline()
+                if not line:
+                    break
+                text = line.lstrip("/#; \t").strip()
+                if line.startswith(LISTING_HEADER):
+                    return "listing", line[len(LISTING_HEADER):].strip()
+                if text.startswith(EXPECTED_HEADER):
+                    return "expected", text[len(EXPECTED_HEADER):].strip().split()[0]
+    except (OSError, UnicodeDecodeError):
+        pass
+    return None
+
+
+def _walk(directory, suffixes):
+    for root, _dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(suffixes):
+                yield os.path.join(root, name)
+
+
+def discover(paths, golden_dirs=()):
+    """
+    Collect sources and their golden outputs.
+    paths are .asm files or directories searched recursively; golden
+    directories are searched for listings and expected-output files in
+    addition to the source directories.
+    Returns: sorted list of (source, [golden paths])
+    """
+    sources = []
+    directories = set()
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(_walk(path, (".asm",)))
+            directories.add(os.path.abspath(path))
+        else:
+            sources.append(path)
+            directories.add(os.path.abspath(os.path.dirname(path) or "."))
+    directories.update(os.path.abspath(d) for d in golden_dirs)
+    by_abspath = {os.path.abspath(source): source for source in sources}
+    goldens = {source: [] for source in sources}
+
+    def add(source, golden):
+        if source is not None and os.path.exists(golden) and golden not in goldens[source]:
+            goldens[source].append(golden)
+
+    for source in sources:
+        stem = source[:-len(".asm")]
+        for suffix in GOLDEN_SUFFIXES:
+            add(source, stem + suffix)
+
+    seen = set()
+    for directory in sorted(directories):
+        for golden in _walk(directory, (".mem", ".txt", ".expected")):
+            if os.path.abspath(golden) in seen:
+                continue
+            seen.add(os.path.abspath(golden))
+            header = _header_source(golden)
+            if header is None:
+                continue
+            kind, named = header
+            if kind == "expected":
+                add(by_abspath.get(os.path.abspath(os.path.join(os.path.dirname(golden), named))), golden)
+                continue
+            # A listing names its source by the path it was assembled from:
+            # match it against the end of each source's absolute path
+            parts = _path_parts(named)
+            matches = [source for source in sources
+                       if parts and _path_parts(os.path.abspath(source))[-len(parts):] == parts]
+            if len(matches) != 1:
+                continue
+            add(matches[0], golden)
+            if golden.endswith("_hex.mem"):
+                add(matches[0], golden[:-len("_hex.mem")] + ".mem")
+    return sorted((source, sorted(found)) for source, found in goldens.items())
+
+
+def generated_chunks(image, fmt, layout="packed"):
+    """The assembled image as address-ordered runs to compare with a golden of format fmt."""
+    if fmt in ADDRESSED_FORMATS:
+        return sorted_runs(image.segments())
+    if fmt == "raw binary" or layout == "dense":
+        return [(0, memfile.expand_segments(image.segments()))]
+    return [(0, image.code.words)] if len(image) else []
+
+
+def run_case(source, goldens, layout="packed"):
+    """
+    Worker: assemble one source in memory and compare it with each golden.
+    Returns: dict with source, status ('passed', 'failed', 'error' or
+    'no golden'), seconds, words, error and per-golden results
+    """
+    start = time.perf_counter()
+    result = {"source": source, "status": "passed", "words": 0, "error": None, "goldens": []}
+    try:
+        with open(source, 'r') as f:
+            image = assemble_source(f.read(), source)
+        result["words"] = len(image)
+        for golden in goldens:
+            fmt = memfile.detect_format(golden)
+            compared = compare_images(ordered_chunks(golden, fmt), generated_chunks(image, fmt, layout),
+                                      keep=SHOW, names=(golden, source))
+            result["goldens"].append({
+                "file": golden,
+                "format": fmt,
+                "expected_words": compared["expected_words"],
+                "generated_words": compared["generated_words"],
+                "mismatches": compared["mismatches"],
+                "details": compared["details"],
+            })
+            if compared["mismatches"]:
+                result["status"] = "failed"
+        if not goldens:
+            result["status"] = "no golden"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_suite(cases, workers=None, layout="packed"):
+    """Run every (source, goldens) case across a process pool. Returns: run_case results in order"""
+    if not cases:
+        return []
+    sources = [source for source, _goldens in cases]
+    goldens = [found for _source, found in cases]
+    chunksize = max(1, len(cases) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_case, sources, goldens, repeat(layout), chunksize=chunksize))
+
+
+def _mismatch_lines(golden):
+    """Describe a golden's first mismatches as text lines."""
+    yield (f"{golden['file']} ({golden['format']}): {golden['mismatches']} mismatches, "
+           f"{golden['expected_words']} expected / {golden['generated_words']} generated words")
+    for address, expected, generated in golden["details"]:
+        exp_text = "--------" if expected is None else f"{expected:08X}"
+        gen_text = "--------" if generated is None else f"{generated:08X}"
+        yield f"  {address:<8} expected {exp_text}  generated {gen_text}"
+
+
+def junit_xml(results, elapsed, name="assembler-golden"):
+    """The results as a JUnit XML document (one testcase per source)."""
+    import xml.etree.ElementTree as ET
+
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in ("failed", "error", "no golden")}
+    suite = ET.Element("testsuite", name=name, tests=str(len(results)),
+                       failures=str(counts["failed"]), errors=str(counts["error"]),
+                       skipped=str(counts["no golden"]), time=f"{elapsed:.3f}")
+    for result in results:
+        case = ET.SubElement(suite, "testcase", classname=name, name=result["source"],
+                             time=f"{result['seconds']:.6f}")
+        if result["status"] == "error":
+            ET.SubElement(case, "error", message=result["error"])
+        elif result["status"] == "no golden":
+            ET.SubElement(case, "skipped", message="assembled; no golden output found")
+        elif result["status"] == "failed":
+            failed = [g for g in result["goldens"] if g["mismatches"]]
+            failure = ET.SubElement(case, "failure",
+                                    message=f"{len(failed)} of {len(result['goldens'])} goldens differ")
+            failure.text = "\n".join(line for g in failed for line in _mismatch_lines(g))
+        if result["goldens"]:
+            ET.SubElement(case, "system-out").text = "\n".join(
+                f"{g['file']}: {g['mismatches']} mismatches" for g in result["goldens"])
+    ET.indent(suite)
+    return ET.tostring(suite, encoding="unicode", xml_declaration=True) + "\n"
+
+
+def print_report(results, elapsed):
+    """Print one line per source, the mismatches of failures and the totals."""
+    print("=" * 70)
+    print("GOLDEN REGRESSION REPORT")
+    print("=" * 70)
+    print(f"{'Status':<10} {'Time':>9} {'Words':>6} {'Goldens':>7}  Source")
+    print("-" * 70)
+    for result in results:
+        print(f"{result['status']:<10} {result['seconds'] * 1000:>7.1f}ms {result['words']:>6} "
+              f"{len(result['goldens']):>7}  {result['source']}")
+        if result["error"]:
+            print(f"{'':<37}{result['error']}")
+        for golden in result["goldens"]:
+            if golden["mismatches"]:
+                for line in _mismatch_lines(golden):
+                    print(f"{'':<37}{line}")
+    print("-" * 70)
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in ("passed", "failed", "error", "no golden")}
+    print(f"Sources: {len(results)}  Passed: {counts['passed']}  Failed: {counts['failed']}  "
+          f"Errors: {counts['error']}  No golden: {counts['no golden']}")
+    print(f"Wall time: {elapsed * 1000:.1f}ms")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    # Defaults relative to this script, as validate.py
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    tests_dir = os.path.join(os.path.dirname(script_dir), "tests")
+    output_dir = os.path.join(os.path.dirname(script_dir), "output")
+
+    parser = argparse.ArgumentParser(description="Assemble the test corpus and compare it with its golden outputs")
+    parser.add_argument("paths", nargs="*", default=[tests_dir],
+                        help=".asm files or directories, searched recursively (default: assembler/tests)")
+    parser.add_argument("--golden-dir", action="append", metavar="DIR",
+                        help="also search DIR for listings and expected-output files naming a source "
+                             "(default: assembler/output; repeatable)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--layout", choices=("packed", "dense"), default="packed",
+                        help="layout text goldens without addresses are compared in (default: packed)")
+    parser.add_argument("--junit", metavar="FILE", help="write a JUnit XML report")
+    parser.add_argument("--json", metavar="FILE", help="write the results as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    golden_dirs = args.golden_dir if args.golden_dir is not None else [output_dir]
+    cases = discover(args.paths, [d for d in golden_dirs if os.path.isdir(d)])
+    results = run_suite(cases, args.jobs, args.layout)
+    elapsed = time.perf_counter() - start
+
+    print_report(results, elapsed)
+    if args.junit:
+        with open(args.junit, 'w') as f:
+            f.write(junit_xml(results, elapsed))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"seconds": elapsed, "cases": results}, f, indent=2)
+    sys.exit(1 if any(r["status"] in ("failed", "error") for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
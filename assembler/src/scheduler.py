@@ -0,0 +1,278 @@
+"""
+Pipeline-aware instruction scheduler for the assembler.
+Runs on the tokenized program after pass1_build_symbol_table and before
+encoding. Within each basic block it builds a dependency graph over
+registers, flags, the stack pointer, data memory and the I/O ports, and
+reorders independent instructions so that:
+
+- a register loaded by LDD/POP is not read by the very next instruction
+  (load-use stall, pipeline_model.COSTS["load_use"])
+- a conditional branch does not directly follow the instruction that sets
+  the flag it tests
+
+A block only changes when the reordering lowers its estimated stall
+cycles. Reordering is a permutation inside a block, so every label,
+.ORG and data word keeps its address. Blocks start at labels, .ORG,
+data lines and numeric jump targets, and end at control transfers.
+Multi-cycle SWAP/INT/RTI and second-word fetches cost the same wherever
+they sit, so they are not scheduled around.
+
+Code that reads or stores into its own instructions, or jumps to
+addresses computed at run time, must label those addresses.
+"""
+
+from assembler import (instruction_map, encoder_table, register_map, parse_immediate,
+                       sign_extend_16, OPERAND_NUM, RDST_SHIFT, LINKAGE_DIRECTIVES)
+from pipeline_model import COSTS
+from simulator import ADDR_MASK
+
+
+# Estimated stall cycles per hazard
+HAZARD_COSTS = {
+    "load_use": COSTS["load_use"],
+    "flag_use": 1,              # conditional branch straight after its flag is set
+}
+
+MAX_BLOCK = 64      # instructions per scheduling window (the graph is quadratic)
+
+TERMINATORS = frozenset(("JZ", "JN", "JC", "JMP", "CALL", "RET", "INT", "RTI", "HLT"))
+LOADS = frozenset(("LDD", "POP"))
+BRANCH_FLAG = {"JZ": "Z", "JN": "N", "JC": "C"}
+HAZARD_SOURCES = LOADS | frozenset(BRANCH_FLAG)     # blocks without these cannot stall
+
+ALL_FLAGS = ("Z", "N", "C")
+
+# Resources used implicitly, beyond the register operands: mnemonic -> (reads, writes)
+IMPLICIT_EFFECTS = {
+    "ADD":  ((), ALL_FLAGS),
+    "IADD": ((), ALL_FLAGS),
+    "INC":  ((), ALL_FLAGS),
+    "SUB":  ((), ALL_FLAGS),
+    "AND":  ((), ("Z", "N")),
+    "NOT":  ((), ("Z", "N")),
+    "SETC": ((), ("C",)),
+    "LDD":  (("MEM",), ()),
+    "STD":  ((), ("MEM",)),
+    "PUSH": (("SP",), ("SP", "MEM")),
+    "POP":  (("SP", "MEM"), ("SP",)),
+    "IN":   (("IO",), ("IO",)),
+    "OUT":  (("IO",), ("IO",)),
+}
+
+
+class _Node:
+    """One instruction of a block with the resources it reads and writes."""
+    __slots__ = ("entry", "reads", "writes", "load_dest")
+
+    def __init__(self, entry, reads, writes):
+        self.entry = entry
+        self.reads = reads
+        self.writes = writes
+        self.load_dest = entry.operands[0] if entry.mnemonic in LOADS else None
+
+
+def instruction_effects(entry):
+    """
+    Resources an instruction reads and writes: register names, flags
+    Z/N/C, SP, MEM and IO. Register operands follow the encoder's field
+    table: the Rdst field is written, the others are read.
+    Returns: (reads, writes) frozensets, or None if the operands are
+    malformed (left for pass 2 to report).
+    """
+    name = entry.mnemonic
+    implicit = IMPLICIT_EFFECTS.get(name, ((), ()))
+    reads, writes = set(implicit[0]), set(implicit[1])
+    operands = entry.operands
+    for index, shift in encoder_table[name][1]:
+        if index >= len(operands) or operands[index] not in register_map:
+            return None
+        (writes if shift == RDST_SHIFT else reads).add(operands[index])
+    if name == "SWAP":
+        writes.add(operands[0])
+    return frozenset(reads), frozenset(writes)
+
+
+def hazard_cycles(prev, node):
+    """Estimated stall cycles when node directly follows prev."""
+    cycles = 0
+    if prev.load_dest is not None and prev.load_dest in node.reads:
+        cycles += HAZARD_COSTS["load_use"]
+    flag = BRANCH_FLAG.get(node.entry.mnemonic)
+    if flag is not None and flag in prev.writes:
+        cycles += HAZARD_COSTS["flag_use"]
+    return cycles
+
+
+def sequence_cycles(nodes):
+    """Estimated stall cycles of a block executed in the given order."""
+    return sum(hazard_cycles(a, b) for a, b in zip(nodes, nodes[1:]))
+
+
+def schedule_block(nodes, pinned_first):
+    """
+    List-schedule one block. Instructions become ready once everything
+    they depend on is placed; the next one is the ready instruction that
+    stalls least after the last placed one, then the one with the longest
+    remaining dependency chain, then source order. A control transfer
+    stays last and, with pinned_first, the first (labelled) instruction
+    stays first.
+    Returns: the nodes in their new order
+    """
+    count = len(nodes)
+    succs = [[] for _ in range(count)]
+    preds = [0] * count
+    last_writer = {}        # resource -> index of its latest writer
+    readers = {}            # resource -> indexes reading it since that write
+    for j, node in enumerate(nodes):
+        if node.entry.mnemonic in TERMINATORS:
+            after = set(range(j))
+        else:
+            after = {0} if pinned_first and j else set()
+            for resource in node.reads:
+                if resource in last_writer:
+                    after.add(last_writer[resource])
+            for resource in node.writes:
+                if resource in last_writer:
+                    after.add(last_writer[resource])
+                after.update(readers.get(resource, ()))
+        for resource in node.reads:
+            readers.setdefault(resource, []).append(j)
+        for resource in node.writes:
+            last_writer[resource] = j
+            readers[resource] = []
+        for i in after:
+            succs[i].append(j)
+        preds[j] = len(after)
+
+    height = [0] * count
+    for i in range(count - 1, -1, -1):
+        for j in succs[i]:
+            height[i] = max(height[i], 1 + hazard_cycles(nodes[i], nodes[j]) + height[j])
+
+    ready = [i for i in range(count) if preds[i] == 0]
+    order = []
+    prev = None
+    while ready:
+        best = min(ready, key=lambda i: (hazard_cycles(prev, nodes[i]) if prev else 0,
+                                         -height[i], i))
+        ready.remove(best)
+        order.append(nodes[best])
+        prev = nodes[best]
+        for j in succs[best]:
+            preds[j] -= 1
+            if preds[j] == 0:
+                ready.append(j)
+    return order
+
+
+def jump_targets(program):
+    """Addresses named by numeric jump/call operands and data words."""
+    targets = set()
+    for entry in program:
+        name = entry.mnemonic
+        if name is None or name == ".ORG":
+            continue
+        if name not in instruction_map:
+            values = [name]
+        elif instruction_map[name]["format"] == "I" and entry.kinds[:1] == (OPERAND_NUM,):
+            values = [entry.operands[0]]
+        else:
+            continue
+        for value in values:
+            try:
+                targets.add(sign_extend_16(parse_immediate(value)) & ADDR_MASK)
+            except ValueError:
+                pass
+    return targets
+
+
+def basic_blocks(program, symbol_table):
+    """
+    Split the program into schedulable runs of instructions.
+    Yields: (start index, end index, start address, pinned_first)
+    """
+    targets = jump_targets(program)
+    address = 0
+    start = None
+    start_address = 0
+    pinned = False
+    for index, entry in enumerate(program):
+        name = entry.mnemonic
+        leader = entry.label is not None or address in targets
+        if start is not None and (leader or name not in instruction_map
+                                  or index - start >= MAX_BLOCK):
+            yield start, index, start_address, pinned
+            start = None
+        if name == ".ORG":
+            address = parse_immediate(entry.operands[0], symbol_table)
+            continue
+        if name is None or name in LINKAGE_DIRECTIVES:
+            continue
+        if name not in instruction_map:
+            address += 1
+            continue
+        if start is None:
+            start, start_address, pinned = index, address, entry.label is not None
+        address += instruction_map[name]["num_words"]
+        if name in TERMINATORS:
+            yield start, index + 1, start_address, pinned
+            start = None
+    if start is not None:
+        yield start, len(program), start_address, pinned
+
+
+def schedule_program(program, symbol_table):
+    """
+    Reorder instructions within basic blocks to hide pipeline hazards.
+    Takes the tokenized program and the symbol table from pass 1.
+    Returns: (scheduled program, report) where report lists every block
+    with a hazard as dicts with address, label, line, instructions,
+    before, after and saved (estimated stall cycles per execution).
+    """
+    scheduled = list(program)
+    report = []
+    effects_cache = {}      # (mnemonic, operands) -> effects; instructions repeat heavily
+    for start, end, address, pinned in basic_blocks(program, symbol_table):
+        block = program[start:end]
+        if not any(entry.mnemonic in HAZARD_SOURCES for entry in block):
+            continue
+        nodes = []
+        for entry in block:
+            key = (entry.mnemonic, entry.operands)
+            effects = effects_cache.get(key)
+            if effects is None:
+                effects = effects_cache[key] = instruction_effects(entry) or ()
+            if not effects:
+                break
+            nodes.append(_Node(entry, *effects))
+        if len(nodes) < len(block):
+            continue
+        before = sequence_cycles(nodes)
+        if not before:
+            continue
+        order = schedule_block(nodes, pinned)
+        after = sequence_cycles(order)
+        if after < before:
+            scheduled[start:end] = [node.entry for node in order]
+        else:
+            after = before
+        report.append({
+            "address": address,
+            "label": program[start].label,
+            "line": program[start].line_num,
+            "instructions": end - start,
+            "before": before,
+            "after": after,
+            "saved": before - after,
+        })
+    return scheduled, report
+
+
+def report_lines(report):
+    """Yield the scheduling report as printable lines."""
+    for block in report:
+        where = block["label"] or f"line {block['line']}"
+        yield (f"  0x{block['address']:04X} {where:<16} {block['instructions']:>3} instr  "
+               f"stalls {block['before']} -> {block['after']}  (saved {block['saved']})\n")
+    total = sum(block["saved"] for block in report)
+    yield f"  Total saved (one pass through each block): {total} cycles\n"
@@ -0,0 +1,386 @@
+"""
+Functional instruction-set simulator for assembled images.
+Executes the instruction_map ISA at the architectural level (no pipeline
+timing), following the ISA tables in README.md:
+
+- RESET:     PC <- M[0]
+- INTERRUPT: M[SP--] <- PC; M[SP--] <- CCR; PC <- M[1]
+- INT i:     M[SP--] <- PC+1; M[SP--] <- CCR; PC <- M[i+2]
+- RTI:       CCR <- M[++SP]; PC <- M[++SP]
+- JZ/JN/JC clear the flag they test when taken
+- SP starts at MEMORY_DEPTH - 1, as in memory/stack_pointer.vhd
+
+CCR bits follow execute/ccr.vhd: [0]=C, [1]=N, [2]=Z.
+
+enable_profiling() makes run() count executions and taken conditional
+branches per address in array('Q') counters (see profiler.py), and
+enable_tracing() records every instruction it executes into a compact
+trace file (see tracefile.py).
+
+Images load exactly as ram.vhd would: a packed .mem starts at address 0,
+so programs using .ORG need a dense/sparse .mem, a .bin, or the .asm.
+
+Usage: python simulator.py <image.mem|image.bin|program.asm> [--in V ...] [--max-steps N] [--trace FILE]
+"""
+
+from array import array
+
+import memfile
+from assembler import (instruction_map, OPCODE_SHIFT, INDEX_SHIFT, RDST_SHIFT, RS1_SHIFT,
+                       RS2_SHIFT, assemble_source)
+
+
+MEMORY_DEPTH = 1 << 18          # words, as memory/ram.vhd
+ADDR_MASK = MEMORY_DEPTH - 1
+WORD_MASK = 0xFFFFFFFF
+RESET_VECTOR = 0
+INTERRUPT_VECTOR = 1
+
+# Opcode numbers, taken from instruction_map
+OPCODES = {name: int(info["opcode"], 2) for name, info in instruction_map.items()}
+MNEMONICS = {op: name for name, op in OPCODES.items()}
+OP_NOP, OP_HLT, OP_SETC = OPCODES["NOP"], OPCODES["HLT"], OPCODES["SETC"]
+OP_INC, OP_NOT, OP_LDM = OPCODES["INC"], OPCODES["NOT"], OPCODES["LDM"]
+OP_MOV, OP_SWAP, OP_IADD = OPCODES["MOV"], OPCODES["SWAP"], OPCODES["IADD"]
+OP_ADD, OP_SUB, OP_AND = OPCODES["ADD"], OPCODES["SUB"], OPCODES["AND"]
+OP_JZ, OP_JN, OP_JC, OP_JMP = OPCODES["JZ"], OPCODES["JN"], OPCODES["JC"], OPCODES["JMP"]
+OP_OUT, OP_IN, OP_PUSH, OP_POP = OPCODES["OUT"], OPCODES["IN"], OPCODES["PUSH"], OPCODES["POP"]
+OP_LDD, OP_STD, OP_CALL, OP_RET = OPCODES["LDD"], OPCODES["STD"], OPCODES["CALL"], OPCODES["RET"]
+OP_INT, OP_RTI = OPCODES["INT"], OPCODES["RTI"]
+
+# Words per instruction, indexed by opcode (0 = undefined opcode)
+INSTRUCTION_SIZE = [0] * 32
+for _name, _info in instruction_map.items():
+    INSTRUCTION_SIZE[OPCODES[_name]] = _info["num_words"]
+
+
+class SimulationError(RuntimeError):
+    """Raised when the program does something the ISA does not define."""
+
+
+def decode_instruction(word, second_word, pc):
+    """
+    Decode one instruction from its first and following word.
+    Returns: (opcode, rdst, rs1, rs2, value, next_pc) where value is the
+    second word for two-word instructions or the INT vector address.
+    """
+    op = word >> OPCODE_SHIFT
+    size = INSTRUCTION_SIZE[op]
+    if size == 0:
+        raise SimulationError(f"Undefined opcode {op:05b} at 0x{pc:05X} (word {word:08X})")
+    if size == 2:
+        value = second_word
+    elif op == OP_INT:
+        value = (word >> INDEX_SHIFT) & 0x3
+    else:
+        value = 0
+    return (op, (word >> RDST_SHIFT) & 7, (word >> RS1_SHIFT) & 7, (word >> RS2_SHIFT) & 7,
+            value, (pc + size) & ADDR_MASK)
+
+
+def decode_word(memory, pc):
+    """Decode the instruction at pc in memory (see decode_instruction)."""
+    return decode_instruction(memory[pc], memory[(pc + 1) & ADDR_MASK], pc)
+
+
+def load_program(path):
+    """
+    Load a memory image for simulation.
+    .asm sources are assembled in memory; any memfile format is accepted.
+    Returns: list of (base_address, array('I')) segments
+    """
+    if path.lower().endswith(".asm"):
+        with open(path, 'r') as f:
+            return assemble_source(f.read(), path).segments()
+    return memfile.read_image(path)
+
+
+class Simulator:
+    """
+    Architectural state plus a predecoding interpreter.
+    Memory is one array('I') of MEMORY_DEPTH words; decoded instructions
+    are cached per address and dropped when a store hits them.
+    """
+
+    def __init__(self, segments=(), inputs=()):
+        self.memory = array('I', bytes(4 * MEMORY_DEPTH))
+        for base, run in segments:
+            if base + len(run) > MEMORY_DEPTH:
+                raise SimulationError(f"Segment at 0x{base:X} does not fit in memory")
+            self.memory[base:base + len(run)] = run
+        self.regs = [0] * 8
+        self.inputs = iter(inputs)   # IN port values; reads 0 once exhausted
+        self.outputs = []            # values written by OUT
+        self.steps = 0               # instructions retired
+        self._decoded = [None] * MEMORY_DEPTH
+        self.exec_counts = None      # array('Q') per address once profiling
+        self.taken_counts = None     # taken JZ/JN/JC per address once profiling
+        self.trace = None            # tracefile.TraceWriter once tracing
+        self.reset()
+
+    def reset(self):
+        """RESET: clear registers and flags, SP to top, PC <- M[0]."""
+        self.regs[:] = [0] * 8
+        self.z = self.n = self.c = 0
+        self.sp = MEMORY_DEPTH - 1
+        self.pc = self.memory[RESET_VECTOR] & ADDR_MASK
+        self.halted = False
+
+    @property
+    def ccr(self):
+        """Flags packed as in ccr.vhd: [0]=C, [1]=N, [2]=Z."""
+        return self.c | (self.n << 1) | (self.z << 2)
+
+    @ccr.setter
+    def ccr(self, value):
+        self.c = value & 1
+        self.n = (value >> 1) & 1
+        self.z = (value >> 2) & 1
+
+    def enable_profiling(self):
+        """
+        Count, from the next run() on, how often each address is executed
+        and how often the conditional branch there is taken. Only
+        Simulator.run counts (not BlockExecutor's translated blocks).
+        """
+        self.exec_counts = array('Q', bytes(8 * MEMORY_DEPTH))
+        self.taken_counts = array('Q', bytes(8 * MEMORY_DEPTH))
+
+    def enable_tracing(self, f, chunk_steps=None):
+        """
+        Record, from the next run() on, every instruction executed and the
+        registers, CCR, SP, memory words and output values it changes, into
+        f (a binary file). Call the returned writer's close() when done.
+        As with profiling, only Simulator.run is traced.
+        Returns: the tracefile.TraceWriter
+        """
+        from tracefile import TraceWriter, CHUNK_STEPS
+
+        self.trace = TraceWriter(f, self, chunk_steps or CHUNK_STEPS)
+        return self.trace
+
+    def write_memory(self, address, value):
+        """Store a word, invalidating any decoded instruction covering it."""
+        address &= ADDR_MASK
+        self.memory[address] = value & WORD_MASK
+        self._decoded[address] = None
+        self._decoded[(address - 1) & ADDR_MASK] = None
+
+    def interrupt(self):
+        """Take the external interrupt before the next instruction."""
+        memory = self.memory
+        sp = self.sp
+        self.write_memory(sp, self.pc)
+        self.write_memory(sp - 1, self.ccr)
+        self.sp = (sp - 2) & ADDR_MASK
+        self.pc = memory[INTERRUPT_VECTOR] & ADDR_MASK
+        self.halted = False
+        if self.trace is not None:
+            self.trace.interrupt(self.sp)
+
+    def run(self, max_steps=None):
+        """
+        Execute until HLT or max_steps instructions.
+        Returns: number of instructions executed by this call
+        """
+        if self.halted:
+            return 0
+        memory = self.memory
+        decoded = self._decoded
+        regs = self.regs
+        outputs = self.outputs
+        inputs = self.inputs
+        pc, sp = self.pc, self.sp
+        z, n, c = self.z, self.n, self.c
+        limit = -1 if max_steps is None else max_steps
+        count = 0
+        counts, taken = self.exec_counts, self.taken_counts
+        trace = self.trace
+
+        try:
+            while count != limit:
+                d = decoded[pc]
+                if d is None:
+                    d = decoded[pc] = decode_word(memory, pc)
+                op, rd, r1, r2, value, next_pc = d
+                count += 1
+                if counts is not None:
+                    counts[pc] += 1
+
+                if op == OP_ADD or op == OP_IADD or op == OP_INC:
+                    if op == OP_ADD:
+                        r = regs[r1] + regs[r2]
+                    elif op == OP_IADD:
+                        r = regs[r1] + value
+                    else:
+                        r = regs[r1] + 1
+                    c = r >> 32
+                    r &= WORD_MASK
+                    regs[rd] = r
+                    n = r >> 31
+                    z = 1 if r == 0 else 0
+                elif op == OP_SUB:
+                    a = regs[r1]
+                    b = regs[r2]
+                    c = 1 if a < b else 0
+                    r = (a - b) & WORD_MASK
+                    regs[rd] = r
+                    n = r >> 31
+                    z = 1 if r == 0 else 0
+                elif op == OP_AND or op == OP_NOT:
+                    r = regs[r1] & regs[r2] if op == OP_AND else regs[r1] ^ WORD_MASK
+                    regs[rd] = r
+                    n = r >> 31
+                    z = 1 if r == 0 else 0
+                elif op == OP_JZ:
+                    if z:
+                        z = 0
+                        if taken is not None:
+                            taken[pc] += 1
+                        next_pc = value & ADDR_MASK
+                elif op == OP_JN:
+                    if n:
+                        n = 0
+                        if taken is not None:
+                            taken[pc] += 1
+                        next_pc = value & ADDR_MASK
+                elif op == OP_JC:
+                    if c:
+                        c = 0
+                        if taken is not None:
+                            taken[pc] += 1
+                        next_pc = value & ADDR_MASK
+                elif op == OP_JMP:
+                    next_pc = value & ADDR_MASK
+                elif op == OP_LDM:
+                    regs[rd] = value
+                elif op == OP_MOV:
+                    regs[rd] = regs[r1]
+                elif op == OP_LDD:
+                    regs[rd] = memory[(regs[r1] + value) & ADDR_MASK]
+                elif op == OP_STD:
+                    address = (regs[r1] + value) & ADDR_MASK
+                    memory[address] = regs[r2]
+                    decoded[address] = None
+                    decoded[(address - 1) & ADDR_MASK] = None
+                elif op == OP_OUT:
+                    outputs.append(regs[r2])
+                elif op == OP_IN:
+                    regs[rd] = next(inputs, 0) & WORD_MASK
+                elif op == OP_PUSH:
+                    memory[sp] = regs[r2]
+                    decoded[sp] = None
+                    decoded[(sp - 1) & ADDR_MASK] = None
+                    sp = (sp - 1) & ADDR_MASK
+                elif op == OP_POP:
+                    sp = (sp + 1) & ADDR_MASK
+                    regs[rd] = memory[sp]
+                elif op == OP_CALL:
+                    memory[sp] = next_pc
+                    decoded[sp] = None
+                    decoded[(sp - 1) & ADDR_MASK] = None
+                    sp = (sp - 1) & ADDR_MASK
+                    next_pc = value & ADDR_MASK
+                elif op == OP_RET:
+                    sp = (sp + 1) & ADDR_MASK
+                    next_pc = memory[sp] & ADDR_MASK
+                elif op == OP_SWAP:
+                    regs[r1], regs[rd] = regs[rd], regs[r1]
+                elif op == OP_SETC:
+                    c = 1
+                elif op == OP_NOP:
+                    pass
+                elif op == OP_HLT:
+                    self.halted = True
+                    next_pc = pc
+                    if trace is not None:
+                        trace.step(pc, d, sp, c | (n << 1) | (z << 2))
+                    break
+                elif op == OP_INT:
+                    for word in (next_pc, c | (n << 1) | (z << 2)):
+                        memory[sp] = word
+                        decoded[sp] = None
+                        decoded[(sp - 1) & ADDR_MASK] = None
+                        sp = (sp - 1) & ADDR_MASK
+                    next_pc = memory[value] & ADDR_MASK
+                elif op == OP_RTI:
+                    sp = (sp + 1) & ADDR_MASK
+                    flags = memory[sp]
+                    c, n, z = flags & 1, (flags >> 1) & 1, (flags >> 2) & 1
+                    sp = (sp + 1) & ADDR_MASK
+                    next_pc = memory[sp] & ADDR_MASK
+                if trace is not None:
+                    trace.step(pc, d, sp, c | (n << 1) | (z << 2))
+                pc = next_pc
+        finally:
+            self.pc, self.sp = pc, sp
+            self.z, self.n, self.c = z, n, c
+            self.steps += count
+
+        return count
+
+    def state(self):
+        """Snapshot of the architectural state as a dict."""
+        return {
+            "pc": self.pc,
+            "sp": self.sp,
+            "ccr": self.ccr,
+            "regs": list(self.regs),
+            "steps": self.steps,
+            "halted": self.halted,
+        }
+
+
+def main():
+    import argparse
+    import os
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Functional simulator for assembled programs")
+    parser.add_argument("image", help=".mem/.bin image or .asm source")
+    parser.add_argument("--in", dest="inputs", type=lambda s: int(s, 0), nargs="*", default=[],
+                        help="IN port values, consumed in order (0 once exhausted)")
+    parser.add_argument("--max-steps", type=int, default=10_000_000,
+                        help="stop after this many instructions (default: 10M)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record an execution trace (read it with tracefile.py)")
+    args = parser.parse_args()
+
+    try:
+        sim = Simulator(load_program(args.image), args.inputs)
+        if args.trace:
+            trace_file = open(args.trace, 'wb')
+            sim.enable_tracing(trace_file)
+        start = time.perf_counter()
+        try:
+            sim.run(args.max_steps)
+        finally:
+            if args.trace:
+                sim.trace.close()
+                trace_file.close()
+        elapsed = time.perf_counter() - start
+    except (OSError, ValueError, SimulationError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"SIMULATION: {args.image}")
+    print("=" * 60)
+    status = "halted" if sim.halted else "step limit reached"
+    print(f"Instructions: {sim.steps} ({status})")
+    if elapsed > 0:
+        print(f"Speed: {sim.steps / elapsed / 1e6:.2f} M instr/s")
+    print(f"PC: 0x{sim.pc:05X}  SP: 0x{sim.sp:05X}  CCR: Z={sim.z} N={sim.n} C={sim.c}")
+    for i, value in enumerate(sim.regs):
+        print(f"  R{i}: 0x{value:08X} ({value})")
+    shown = " ".join(f"{v:X}" for v in sim.outputs[:32])
+    more = f" ... ({len(sim.outputs)} values)" if len(sim.outputs) > 32 else ""
+    print(f"Output port: {shown or '-'}{more}")
+    if args.trace:
+        print(f"Trace: {args.trace} ({os.path.getsize(args.trace)} bytes)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Single-pass streaming assembler (assembler.py --stream).
+Reads the source line by line and encodes each statement as soon as it
+is read; its words go straight to their final place in the output image.
+A second word or data word naming a label that is not defined yet is
+written as 0 and recorded as a fixup, then patched in place once the
+label is defined. Memory grows with the number of labels and pending
+fixups, not with the number of lines.
+
+Only images whose word positions are known as each word is written are
+supported: packed or dense .mem files and headerless .bin images. No
+_hex.mem listing is produced.
+
+Operands are resolved as by the two-pass assembler, with one limit: an
+operand starting with a digit or '-' is always a number. One that only
+parses as bare hex (ABC) is written as a number and patched if a label
+of that name turns up later. .ORG operands see the labels defined above
+them, as in pass 1.
+"""
+
+import os
+import struct
+
+from assembler import (parse_line, parse_immediate, encode_words, sign_extend_16,
+                       instruction_map, encoder_table, LINKAGE_DIRECTIVES)
+
+
+LAYOUTS = ("packed", "dense")   # .mem layouts with a fixed position per word
+
+WORD_BYTES = 33                 # one 32-character binary word and its newline
+ZERO_LINE = b"0" * 32 + b"\n"
+
+
+class ImageWriter:
+    """
+    Writes words at their image position in a seekable binary-mode file:
+    emission order for packed .mem, address order for dense .mem and .bin
+    (gaps are zero).
+    """
+
+    def __init__(self, f, layout="packed", fmt="mem"):
+        self.f = f
+        self.binary = fmt == "bin"
+        self.by_address = self.binary or layout == "dense"
+        self.size = 4 if self.binary else WORD_BYTES
+        self.count = 0              # words written, in emission order
+        self.end = 0                # image length in words
+        self.cursor = 0             # file position, in words
+
+    def encode(self, words):
+        if self.binary:
+            return struct.pack(f"<{len(words)}I", *words)
+        return "".join(f"{word:032b}\n" for word in words).encode("ascii")
+
+    def _seek(self, position):
+        if position > self.end and not self.binary:
+            # Dense .mem: zero lines up to the new address
+            self._seek(self.end)
+            gap = position - self.end
+            while gap:
+                chunk = min(gap, 4096)
+                self.f.write(ZERO_LINE * chunk)
+                gap -= chunk
+            self.cursor = self.end = position
+        elif position != self.cursor:
+            self.f.seek(position * self.size)
+            self.cursor = position
+
+    def write(self, address, words):
+        """Write the words emitted at address; returns the image position of the first."""
+        position = address if self.by_address else self.count
+        self._seek(position)
+        self.f.write(self.encode(words))
+        self.count += len(words)
+        self.cursor = position + len(words)
+        self.end = max(self.end, self.cursor)
+        return position
+
+    def patch(self, position, word):
+        """Overwrite the word at an image position."""
+        self._seek(position)
+        self.f.write(self.encode((word,)))
+        self.cursor = position + 1
+
+
+def _maybe_label(operand):
+    """True if an operand is spelled like a label (starts with a letter or '_')."""
+    return operand[:1].isalpha() or operand[:1] == "_"
+
+
+def assemble_stream(lines, writer):
+    """
+    Assemble an iterable of source lines in one pass into an ImageWriter.
+    Returns: (symbol_table, summary) where summary holds lines, words,
+    fixups (patched) and peak_pending (most fixups waiting at once)
+    Raises ValueError on assembly errors.
+    """
+    symbol_table = {}
+    pending = {}            # symbol -> [[image position, line number, is data, tentative, live]]
+    pending_at = {}         # image position -> fixup, for images laid out by address
+    waiting = peak = patched = 0
+    address = 0
+    line_num = 0
+
+    def defer(symbol, position, is_data, tentative):
+        nonlocal waiting, peak
+        fixup = [position, line_num, is_data, tentative, True]
+        pending.setdefault(symbol, []).append(fixup)
+        if writer.by_address:
+            pending_at[position] = fixup
+        waiting += 1
+        peak = max(peak, waiting)
+
+    def write(words):
+        if address < writer.end and pending_at:
+            # A later .ORG section overwrites words: their fixups are not patched
+            # (but an undefined symbol is still an error)
+            for position in range(address, address + len(words)):
+                fixup = pending_at.pop(position, None)
+                if fixup is not None:
+                    fixup[4] = False
+        return writer.write(address, words)
+
+    for line_num, line in enumerate(lines, 1):
+        label, name, operands = parse_line(line)
+        if label:
+            if label in symbol_table:
+                raise ValueError(f"Line {line_num}: Duplicate label '{label}'")
+            symbol_table[label] = address
+            fixups = pending.pop(label, None)
+            if fixups:
+                value = sign_extend_16(address)
+                for fixup in fixups:
+                    if fixup[4]:
+                        writer.patch(fixup[0], value)
+                        pending_at.pop(fixup[0], None)
+                        patched += 1
+                waiting -= len(fixups)
+
+        if name is None or name in LINKAGE_DIRECTIVES:
+            continue
+        if name == ".ORG":
+            if not operands:
+                raise ValueError(f"Line {line_num}: .ORG requires an address")
+            try:
+                address = parse_immediate(operands[0], symbol_table)
+            except Exception as e:
+                raise ValueError(f"Line {line_num}: Invalid .ORG address: {e}")
+            if address < 0:
+                raise ValueError(f"Line {line_num}: Invalid .ORG address: {address}")
+            continue
+
+        if name in instruction_map:
+            imm_operand = encoder_table[name][2]
+            table = symbol_table
+            symbol = None
+            if imm_operand is not None and imm_operand < len(operands):
+                operand = operands[imm_operand]
+                if operand not in symbol_table and _maybe_label(operand):
+                    symbol = operand
+                    try:
+                        parse_immediate(operand)
+                        tentative = True
+                    except ValueError:
+                        tentative = False
+                        table = {operand: 0}
+            try:
+                words = encode_words(name, operands, table)
+            except Exception as e:
+                raise ValueError(f"Line {line_num}: {e}")
+            position = write(words)
+            if symbol is not None:
+                defer(symbol, position + 1, False, tentative)
+        else:
+            # Raw data word: a number or a label name
+            if name in symbol_table:
+                value = symbol_table[name]
+            else:
+                try:
+                    value = parse_immediate(name)
+                    tentative = True
+                except ValueError:
+                    if not _maybe_label(name):
+                        raise ValueError(f"Line {line_num}: Unknown instruction '{name}'")
+                    value = 0
+                    tentative = False
+            words = (sign_extend_16(value),)
+            position = write(words)
+            if name not in symbol_table and _maybe_label(name):
+                defer(name, position, True, tentative)
+        address += len(words)
+
+    unresolved = [(fixup[1], symbol, fixup[2]) for symbol, fixups in pending.items()
+                  for fixup in fixups if not fixup[3]]
+    if unresolved:
+        line_num, symbol, is_data = min(unresolved)
+        if is_data:
+            raise ValueError(f"Line {line_num}: Unknown instruction '{symbol}'")
+        raise ValueError(f"Line {line_num}: Invalid immediate value: {symbol}")
+    summary = {
+        "lines": line_num,
+        "words": writer.count,
+        "fixups": patched,
+        "peak_pending": peak,
+    }
+    return symbol_table, summary
+
+
+def stream_file(input_file, output_file, quiet=False, layout="packed", fmt="mem", symbols=None):
+    """
+    Assemble input_file in one pass straight into output_file (.mem in
+    a streaming layout, or a headerless .bin with fmt="bin"). The image
+    is built under a temporary name and only replaces output_file once
+    the whole source has assembled. symbols, if given, is a path to
+    write the symbol table to.
+    Returns: (symbol_table, summary) as for assemble_stream
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Streaming supports the {' and '.join(LAYOUTS)} layouts, not {layout}")
+    if not quiet:
+        print(f"Assembling (single pass): {input_file}")
+        print("=" * 60)
+
+    tmp_file = output_file + ".tmp"
+    try:
+        with open(input_file, 'r') as source, open(tmp_file, 'wb') as f:
+            symbol_table, summary = assemble_stream(source, ImageWriter(f, layout, fmt))
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    if symbols:
+        with open(symbols, 'w') as f:
+            f.writelines(f"  {label}: {addr} (0x{addr:04X})\n" for label, addr in symbol_table.items())
+    if not quiet:
+        print("Output files:")
+        print(f"  Binary (for machine): {output_file}")
+        if symbols:
+            print(f"  Symbols: {symbols}")
+        print(f"Lines: {summary['lines']}  Labels: {len(symbol_table)}")
+        print(f"Forward references patched: {summary['fixups']} "
+              f"(at most {summary['peak_pending']} pending at once)")
+        print(f"Total instructions: {summary['words']} words")
+    return symbol_table, summary
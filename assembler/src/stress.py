@@ -0,0 +1,456 @@
+"""
+Random constrained program generator and parallel stress campaign.
+
+generate_case(seed) builds a random program that uses every format in
+assembler.formats and is valid by construction:
+
+- control flow is bounded: JZ/JN/JC/JMP only skip forward or close a
+  loop that counts R6 down from at most MAX_TRIPS, and CALL only reaches
+  subroutines further down the call order, so nothing recurses
+- the stack stays balanced: PUSH and POP come in matched runs inside a
+  straight stretch of code, and every subroutine and handler returns with
+  SP where it found it
+- LDD/STD address DATA + offset through R7, which holds DATA and is never
+  written, with offsets inside the DATA_WORDS words reserved there
+
+R6 and R7 are reserved; random instructions write R0..R5 only. Loops hold
+no CALL or INT, and the external interrupt handler no CALL, so R6 is
+never clobbered mid-loop.
+
+check_source() assembles a case and executes it on the functional
+simulator, then cross-checks everything that must agree with that run:
+the final SP (stack balance), the translating executor (with the
+external interrupt taken at the same step), the single-pass streaming
+assembler, a disassemble/reassemble round trip, and -O, --schedule and
+--reorder-blocks builds (same outputs, registers and flags). The first check that fails
+names the failure.
+
+A failing case is minimised by deleting whole units (an instruction, a
+PUSH/POP run, a skip, a loop, a call) while the same check still fails,
+then written as <name>.asm, with the seed, IN values and failure in its
+header, and a dense <name>.mem that memory/ram.vhd loads.
+
+Usage: python stress.py [-n COUNT] [--seed S] [-j JOBS] [--length N] [-o DIR] [--json FILE]
+"""
+
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from assembler import assemble_source
+from simulator import Simulator, SimulationError, MEMORY_DEPTH
+
+
+CODE_BASE = 0x10            # code starts past the vector table
+DATA_BASE = 0x2000          # .ORG of the data words LDD/STD address
+DATA_WORDS = 32
+MAX_TRIPS = 8               # loop iterations
+MAX_STEPS = 200_000         # instructions before a case counts as runaway
+
+DESTINATIONS = ("R0", "R1", "R2", "R3", "R4", "R5")
+SOURCES = DESTINATIONS + ("R6", "R7")
+
+# Unit kinds and their weights, per block kind
+MAIN_UNITS = (("op", 12), ("stack", 2), ("skip", 3), ("loop", 2), ("call", 2), ("int", 1))
+FUNCTION_UNITS = (("op", 12), ("stack", 2), ("skip", 3), ("loop", 2), ("call", 1))
+HANDLER_UNITS = (("op", 12), ("stack", 2), ("skip", 3), ("call", 1))
+ISR_UNITS = (("op", 12), ("stack", 2), ("skip", 3))
+LOOP_UNITS = (("op", 12), ("stack", 2), ("skip", 2))
+
+FUNCTIONS = 3
+
+
+class Case:
+    """
+    A generated program as removable units.
+    blocks: list of (label, terminator, units) in layout order; a unit is
+    a tuple of source lines.
+    """
+    __slots__ = ("seed", "inputs", "interrupt_at", "blocks", "data")
+
+    def __init__(self, seed, inputs, interrupt_at, blocks, data):
+        self.seed = seed
+        self.inputs = inputs            # IN port values
+        self.interrupt_at = interrupt_at  # step to take the external interrupt at, or None
+        self.blocks = blocks
+        self.data = data                # data words, as spelled in the source
+
+    def units(self):
+        """Number of removable units."""
+        return sum(len(units) for _label, _end, units in self.blocks)
+
+    def without(self, dropped):
+        """
+        Copy with the units at the given flat indices removed; subroutines
+        no longer called are dropped with their CALLs gone.
+        """
+        blocks = []
+        index = 0
+        for label, end, units in self.blocks:
+            kept = [unit for i, unit in enumerate(units, index) if i not in dropped]
+            index += len(units)
+            blocks.append((label, end, kept))
+        calls = {label: {line.split()[1] for unit in units for line in unit if line.startswith("CALL ")}
+                 for label, _end, units in blocks}
+        # Subroutines reachable from the entry points, through kept blocks only
+        reached = {label for label in calls if not label.startswith("FUNC")}
+        pending = list(reached)
+        while pending:
+            for callee in calls.get(pending.pop(), ()):
+                if callee not in reached:
+                    reached.add(callee)
+                    pending.append(callee)
+        blocks = [block for block in blocks if block[0] in reached]
+        return Case(self.seed, self.inputs, self.interrupt_at, blocks, self.data)
+
+    def source(self):
+        """The program as .asm text."""
+        lines = [".ORG 0", "MAIN", "ISR", "HANDLER0", "HANDLER1", f".ORG 0x{CODE_BASE:X}"]
+        for label, end, units in self.blocks:
+            lines.append(f"{label}:")
+            if label == "MAIN":
+                lines.append("    LDM R7, DATA")
+            for unit in units:
+                lines.extend(line if line.endswith(":") else "    " + line for line in unit)
+            lines.append("    " + end)
+        lines.append(f".ORG 0x{DATA_BASE:X}")
+        lines.append("DATA:")
+        lines.extend("    " + word for word in self.data)
+        return "\n".join(lines) + "\n"
+
+
+def _immediate(rng):
+    """A 16-bit immediate in one of the spellings the assembler accepts."""
+    style = rng.randrange(4)
+    if style == 0:
+        return str(rng.randint(-32768, 32767))
+    if style == 1:
+        return f"0x{rng.randrange(0x10000):X}"
+    if style == 2:
+        return f"0{rng.randrange(0x1000):03X}"      # bare hex, starting with a digit
+    return str(rng.choice((0, 1, -1, 0x7FFF, -0x8000, 0xFFFF)))
+
+
+def _offset(rng):
+    offset = rng.randrange(DATA_WORDS)
+    return str(offset) if rng.randrange(2) else f"0x{offset:X}"
+
+
+def _instruction(rng):
+    """One straight-line instruction (no control transfer, no stack use)."""
+    d, s, t = rng.choice(DESTINATIONS), rng.choice(SOURCES), rng.choice(SOURCES)
+    name = rng.choice(("NOP", "SETC", "INC", "NOT", "IN", "MOV", "SWAP", "ADD", "SUB", "AND",
+                       "LDM", "IADD", "LDD", "STD", "OUT"))
+    if name in ("NOP", "SETC"):
+        return name
+    if name in ("INC", "NOT", "IN"):
+        return f"{name} {d}"
+    if name == "MOV":
+        return f"MOV {s}, {d}"
+    if name == "SWAP":
+        return f"SWAP {d}, {rng.choice(DESTINATIONS)}"
+    if name in ("ADD", "SUB", "AND"):
+        return f"{name} {d}, {s}, {t}"
+    if name == "LDM":
+        return f"LDM {d}, {_immediate(rng)}"
+    if name == "IADD":
+        return f"IADD {d}, {s}, {_immediate(rng)}"
+    if name == "LDD":
+        return f"LDD {d}, {_offset(rng)}(R7)"
+    if name == "STD":
+        return f"STD {s}, {_offset(rng)}(R7)"
+    return f"OUT {s}"
+
+
+class _Generator:
+    """Draws units for one case; labels are numbered per case."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.labels = 0
+
+    def label(self, prefix):
+        self.labels += 1
+        return f"{prefix}{self.labels}"
+
+    def units(self, kinds, count, function=None):
+        names = [kind for kind, _weight in kinds]
+        weights = [weight for _kind, weight in kinds]
+        out = []
+        for _ in range(count):
+            kind = self.rng.choices(names, weights)[0]
+            if kind == "call" and (function is not None and function + 1 >= FUNCTIONS):
+                kind = "op"
+            out.append(self.unit(kind, function))
+        return out
+
+    def unit(self, kind, function=None):
+        rng = self.rng
+        if kind == "op":
+            return (_instruction(rng),)
+        if kind == "stack":
+            depth = rng.randint(1, 3)
+            return (tuple(f"PUSH {rng.choice(SOURCES)}" for _ in range(depth))
+                    + tuple(_instruction(rng) for _ in range(rng.randint(0, 2)))
+                    + tuple(f"POP {rng.choice(DESTINATIONS)}" for _ in range(depth)))
+        if kind == "skip":
+            target = self.label("SKIP")
+            return ((f"{rng.choice(('JZ', 'JN', 'JC', 'JMP'))} {target}",)
+                    + tuple(_instruction(rng) for _ in range(rng.randint(1, 3)))
+                    + (f"{target}:",))
+        if kind == "loop":
+            top, done = self.label("LOOP"), self.label("DONE")
+            body = [line for unit in self.units(LOOP_UNITS, rng.randint(1, 4)) for line in unit]
+            return ((f"LDM R6, {rng.randint(1, MAX_TRIPS)}", f"{top}:") + tuple(body)
+                    + ("IADD R6, R6, -1", f"JZ {done}", f"JMP {top}", f"{done}:"))
+        if kind == "call":
+            first = 0 if function is None else function + 1
+            return (f"CALL FUNC{rng.randrange(first, FUNCTIONS)}",)
+        if kind == "int":
+            return (f"INT {rng.randrange(2)}",)
+        raise ValueError(f"Unknown unit kind: {kind}")
+
+
+def generate_case(seed, length=40):
+    """Random program of about length units in MAIN. Returns: a Case"""
+    rng = random.Random(seed)
+    gen = _Generator(rng)
+    blocks = [("MAIN", "HLT", gen.units(MAIN_UNITS, length))]
+    for number in range(FUNCTIONS):
+        blocks.append((f"FUNC{number}", "RET",
+                       gen.units(FUNCTION_UNITS, rng.randint(1, max(1, length // 4)), number)))
+    blocks.append(("ISR", "RTI", gen.units(ISR_UNITS, rng.randint(1, 6))))
+    for number in range(2):
+        blocks.append((f"HANDLER{number}", "RTI", gen.units(HANDLER_UNITS, rng.randint(1, 6))))
+    data = [_immediate(rng) for _ in range(DATA_WORDS)]
+    inputs = [rng.randrange(1 << 32) for _ in range(rng.randint(0, 8))]
+    interrupt_at = rng.randint(1, 4 * length) if rng.randrange(2) else None
+    return Case(seed, inputs, interrupt_at, blocks, data)
+
+
+def _run(sim, interrupt_at=None, max_steps=MAX_STEPS):
+    """Run to HLT, taking the external interrupt after interrupt_at instructions."""
+    if interrupt_at is not None:
+        sim.run(interrupt_at)
+        if not sim.halted:
+            sim.interrupt()
+    sim.run(max_steps - sim.steps)
+    return sim
+
+
+def _observed(sim):
+    """What a rebuilt program must reproduce: outputs, registers and flags."""
+    return sim.outputs, sim.regs, (sim.z, sim.n, sim.c), sim.halted
+
+
+def check_source(text, inputs=(), interrupt_at=None, max_steps=MAX_STEPS):
+    """
+    Assemble, run and cross-check one program.
+    Returns: (steps, failure) where failure is None or (check, message)
+    """
+    import io
+
+    import memfile
+    from disassembler import disassemble, source_lines
+    from streaming import ImageWriter, assemble_stream
+    from translator import BlockExecutor
+
+    try:
+        image = assemble_source(text, "stress")
+    except ValueError as e:
+        return 0, ("assemble", str(e))
+    segments = image.segments()
+    try:
+        ref = _run(Simulator(segments, inputs), max_steps=max_steps)
+    except SimulationError as e:
+        return 0, ("run", str(e))
+    if not ref.halted:
+        return ref.steps, ("run", f"no HLT within {max_steps} instructions")
+    if ref.sp != MEMORY_DEPTH - 1:
+        return ref.steps, ("stack", f"SP 0x{ref.sp:05X} at HLT")
+
+    try:
+        sim = _run(Simulator(segments, inputs), interrupt_at, max_steps)
+        block = _run(BlockExecutor(segments, inputs), interrupt_at, max_steps)
+    except SimulationError as e:
+        return ref.steps, ("translate", str(e))
+    if block.state() != sim.state() or block.outputs != sim.outputs or block.memory != sim.memory:
+        return ref.steps, ("translate", f"state differs from the interpreter "
+                                        f"(interrupt at step {interrupt_at})")
+
+    streamed = io.BytesIO()
+    try:
+        assemble_stream(text.splitlines(), ImageWriter(streamed, "dense", "mem"))
+    except ValueError as e:
+        return ref.steps, ("stream", str(e))
+    if streamed.getvalue().decode("ascii") != "".join(memfile.mem_lines(segments, "dense")):
+        return ref.steps, ("stream", "single-pass image differs")
+
+    try:
+        rebuilt = assemble_source("".join(source_lines(disassemble(segments))), "disassembly")
+    except ValueError as e:
+        return ref.steps, ("disassemble", str(e))
+    if rebuilt.segments() != segments:
+        return ref.steps, ("disassemble", "reassembled image differs")
+
+    for check, options in (("optimize", {"optimize": True}), ("schedule", {"schedule": True}),
+                           ("reorder", {"reorder": True, "train_inputs": inputs})):
+        try:
+            variant = _run(Simulator(assemble_source(text, "stress", **options).segments(), inputs),
+                           max_steps=max_steps)
+        except (ValueError, SimulationError) as e:
+            return ref.steps, (check, str(e))
+        if _observed(variant) != _observed(ref):
+            return ref.steps, (check, "outputs, registers or flags differ from the plain build")
+    return ref.steps, None
+
+
+def minimize(case, check, max_steps=MAX_STEPS):
+    """
+    Delete units while check still fails (chunks halving down to single
+    units). Returns: the smallest failing Case found
+    """
+    def fails(candidate):
+        failure = check_source(candidate.source(), candidate.inputs, candidate.interrupt_at,
+                               max_steps)[1]
+        return failure is not None and failure[0] == check
+
+    chunk = max(1, case.units() // 2)
+    while True:
+        start = 0
+        while start < case.units():
+            candidate = case.without(set(range(start, start + chunk)))
+            if candidate.units() < case.units() and fails(candidate):
+                case = candidate
+            else:
+                start += chunk
+        if chunk == 1:
+            return case
+        chunk = max(1, chunk // 2)
+
+
+def run_seed(seed, length=40, max_steps=MAX_STEPS, shrink=True):
+    """
+    Worker: generate, check and (on failure) minimise one case.
+    Returns: dict with seed, steps, seconds and failure (None, or check,
+    message, units, minimized units, source)
+    """
+    start = time.perf_counter()
+    case = generate_case(seed, length)
+    steps, failure = check_source(case.source(), case.inputs, case.interrupt_at, max_steps)
+    result = {"seed": seed, "steps": steps, "failure": None}
+    if failure is not None:
+        check, message = failure
+        small = minimize(case, check, max_steps) if shrink else case
+        result["failure"] = {
+            "check": check,
+            "message": message,
+            "units": case.units(),
+            "minimized_units": small.units(),
+            "inputs": small.inputs,
+            "interrupt_at": small.interrupt_at,
+            "source": small.source(),
+        }
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_campaign(seeds, length=40, workers=None, max_steps=MAX_STEPS, shrink=True):
+    """Check every seed across a process pool. Returns: run_seed results in seed order"""
+    seeds = list(seeds)
+    chunksize = max(1, len(seeds) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_seed, seeds, repeat(length), repeat(max_steps), repeat(shrink),
+                             chunksize=chunksize))
+
+
+def write_case(result, output_dir):
+    """
+    Write a failing case as <output_dir>/stress_<seed>.asm and, if it
+    assembles, a dense .mem. Returns: the .asm path
+    """
+    failure = result["failure"]
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"stress_{result['seed']}")
+    inputs = " ".join(f"0x{value:X}" for value in failure["inputs"])
+    header = [
+        f"# Stress case, seed {result['seed']}: {failure['check']} check failed",
+        f"# {failure['message']}",
+        f"# Minimised from {failure['units']} to {failure['minimized_units']} units",
+        f"# IN port values: {inputs or '-'}",
+    ]
+    if failure["interrupt_at"] is not None:
+        header.append(f"# External interrupt after {failure['interrupt_at']} instructions")
+    with open(base + ".asm", 'w') as f:
+        f.write("\n".join(header) + "\n\n" + failure["source"])
+    try:
+        assemble_source(failure["source"], base + ".asm").write_mem(base + ".mem", "dense")
+    except ValueError:
+        pass
+    return base + ".asm"
+
+
+def print_report(results, elapsed, written):
+    """Print the campaign totals and every failure."""
+    failed = [r for r in results if r["failure"]]
+    print("=" * 70)
+    print("STRESS CAMPAIGN")
+    print("=" * 70)
+    print(f"Cases: {len(results)}  Failed: {len(failed)}")
+    print(f"Instructions executed: {sum(r['steps'] for r in results)}")
+    if elapsed > 0:
+        print(f"Wall time: {elapsed:.2f}s ({len(results) / elapsed:.1f} cases/s)")
+    if failed:
+        print("-" * 70)
+        for result, path in zip(failed, written):
+            failure = result["failure"]
+            print(f"seed {result['seed']:<10} {failure['check']:<12} {failure['message']}")
+            print(f"{'':<16}{failure['units']} -> {failure['minimized_units']} units: {path}")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Random constrained programs and a parallel stress campaign")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="cases to run (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="first seed; cases use seed..seed+count-1")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--length", type=int, default=40, help="units in MAIN per case (default: 40)")
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS,
+                        help=f"instructions before a case counts as runaway (default: {MAX_STEPS})")
+    parser.add_argument("-o", "--output-dir", default="stress_failures",
+                        help="where failing cases are written (default: stress_failures)")
+    parser.add_argument("--no-minimize", action="store_true", help="write failing cases as generated")
+    parser.add_argument("--emit", metavar="SEED", type=int,
+                        help="only write the program for SEED to <output dir>/stress_<SEED>.asm")
+    parser.add_argument("--json", metavar="FILE", help="also write per-case results as JSON")
+    args = parser.parse_args()
+
+    if args.emit is not None:
+        case = generate_case(args.emit, args.length)
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, f"stress_{args.emit}.asm")
+        with open(path, 'w') as f:
+            f.write(case.source())
+        print(f"Wrote {path} (IN values: {' '.join(f'0x{v:X}' for v in case.inputs) or '-'})")
+        return
+
+    start = time.perf_counter()
+    results = run_campaign(range(args.seed, args.seed + args.count), args.length, args.jobs,
+                           args.max_steps, not args.no_minimize)
+    elapsed = time.perf_counter() - start
+    written = [write_case(r, args.output_dir) for r in results if r["failure"]]
+    print_report(results, elapsed, written)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"cases": results, "seconds": elapsed}, f, indent=2)
+    sys.exit(1 if written else 0)
+
+
+if __name__ == "__main__":
+    main()
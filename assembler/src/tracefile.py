@@ -0,0 +1,565 @@
+"""
+Compact execution traces: recorded by Simulator.enable_tracing
+(simulator.py --trace FILE), streamed back by iter_steps.
+
+A trace is a header followed by chunks of up to chunk_steps retired
+instructions. Each chunk stores its records column by column, every
+column an array of little-endian words compressed with zlib:
+
+    header:  magic 'ATRC' | version u32 | chunk steps u32 | SP u32 |
+             CCR u32 | R0..R7 u32       (state before the first step)
+    chunk:   steps u32 | base PC u32 | compressed size u32
+             per column, then the columns in COLUMNS order
+
+    pc       int32   PC minus the previous step's (the base PC for the
+                     first step: the previous chunk's last PC, or the
+                     simulator's PC when tracing started)
+    word     uint32  first word of the instruction
+    ext      uint32  second word, for two-word instructions only
+    changes  uint16  per step: bits 0-7 registers changed, CCR_CHANGED,
+                     SP_CHANGED, OUT_WRITTEN, INTERRUPTED, memory
+                     writes in bits 12-14, ENTRY_ONLY
+    regs     uint32  new value of each changed register, R0 first
+    ccr      uint8   new CCR, when changed
+    sp       uint32  new SP, when changed
+    addr     uint32  address of each memory write
+    value    uint32  value of each memory write
+    out      uint32  value written to the output port
+
+Only what changed is stored, and with the PCs delta-encoded the columns
+of a loop repeat from one iteration to the next, so they compress to
+well under a byte per step (about 0.75 for a loop of stores and calls).
+A step's changes are those seen when it retires, including those of an
+external interrupt taken just before it (marked INTERRUPTED: the stack
+writes and SP change of the interrupt entry). An interrupt taken with no
+instruction after it before the trace is closed is written as a last,
+ENTRY_ONLY record: no instruction, its PC the handler's.
+
+Usage: python tracefile.py <trace> [other trace] [--start N] [--count N]
+       (one trace: print its steps; two traces: report where they first differ)
+"""
+
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from assembler import OPCODE_SHIFT
+from simulator import INSTRUCTION_SIZE, ADDR_MASK, OP_STD, OP_PUSH, OP_CALL, OP_INT, OP_OUT
+
+
+TRACE_MAGIC = b"ATRC"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<4sIIII8I")
+
+CHUNK_STEPS = 1 << 16       # steps per chunk
+COMPRESSION = 1             # zlib level: traces are written while the program runs
+
+# Column name and array typecode, in file order
+COLUMNS = (("pc", 'i'), ("word", 'I'), ("ext", 'I'), ("changes", 'H'), ("regs", 'I'),
+           ("ccr", 'B'), ("sp", 'I'), ("addr", 'I'), ("value", 'I'), ("out", 'I'))
+CHUNK_HEADER = struct.Struct(f"<II{len(COLUMNS)}I")
+
+# changes column bits
+REGS_CHANGED = 0xFF
+CCR_CHANGED = 1 << 8
+SP_CHANGED = 1 << 9
+OUT_WRITTEN = 1 << 10
+INTERRUPTED = 1 << 11
+WRITES_SHIFT = 12
+ENTRY_ONLY = 1 << 15        # an interrupt entry with no instruction (word 0, not decoded)
+
+# Per opcode: TWO_WORDS if it has a second word, plus what it writes
+# besides registers, CCR and SP
+TWO_WORDS = 1
+WRITES_OUT = 2              # the output port
+WRITES_EFFECTIVE = 4        # M[Rsrc + offset]
+WRITES_STACK = 6            # M[SP + 1] after it retires
+WRITES_STACK_2 = 8          # M[SP + 2] and M[SP + 1]
+STEP_KIND = [TWO_WORDS if size == 2 else 0 for size in INSTRUCTION_SIZE]
+STEP_KIND[OP_OUT] |= WRITES_OUT
+STEP_KIND[OP_STD] |= WRITES_EFFECTIVE
+STEP_KIND[OP_PUSH] |= WRITES_STACK
+STEP_KIND[OP_CALL] |= WRITES_STACK
+STEP_KIND[OP_INT] |= WRITES_STACK_2
+
+
+def _column_bytes(column):
+    if sys.byteorder != "little" and column.itemsize > 1:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return zlib.compress(column.tobytes(), COMPRESSION)
+
+
+def _column_array(typecode, data):
+    column = array(typecode, zlib.decompress(data))
+    if sys.byteorder != "little" and column.itemsize > 1:
+        column.byteswap()
+    return column
+
+
+class TraceWriter:
+    """
+    Collects trace columns for one simulator and writes them out a chunk
+    at a time. Simulator.run calls step() after each instruction;
+    close() writes the last chunk.
+    """
+    __slots__ = ("f", "sim", "memory", "regs", "chunk_steps", "shadow", "ccr", "sp",
+                 "pc", "base_pc", "entry_writes", "steps",
+                 "pcs", "words", "exts", "changes", "reg_values", "ccrs", "sps", "addrs", "values",
+                 "outs")
+
+    def __init__(self, f, sim, chunk_steps=CHUNK_STEPS):
+        self.f = f
+        self.sim = sim
+        self.memory = sim.memory
+        self.regs = sim.regs
+        self.chunk_steps = chunk_steps
+        self.shadow = list(sim.regs)        # register values as last recorded
+        self.ccr = sim.ccr
+        self.sp = sim.sp
+        self.pc = sim.pc                    # PC of the last step
+        self.entry_writes = []              # addresses stored by an interrupt entry
+        self.steps = 0                      # steps written
+        self._new_chunk()
+        f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, chunk_steps, self.sp, self.ccr,
+                                  *self.shadow))
+
+    def _new_chunk(self):
+        self.base_pc = self.pc              # PC the chunk's first delta is taken from
+        (self.pcs, self.words, self.exts, self.changes, self.reg_values, self.ccrs, self.sps,
+         self.addrs, self.values, self.outs) = [array(typecode) for _name, typecode in COLUMNS]
+
+    def step(self, pc, decoded, sp, ccr):
+        """
+        Record the instruction just executed at pc (decoded as by
+        decode_word) and what it changed, given SP and CCR after it.
+        """
+        op, rd, r1, _r2, value, _next_pc = decoded
+        self.pcs.append(pc - self.pc)
+        self.pc = pc
+        self.words.append(self.memory[pc])
+        kind = STEP_KIND[op]
+        if kind & TWO_WORDS:
+            self.exts.append(value)
+
+        changes = 0
+        regs = self.regs
+        shadow = self.shadow
+        if regs != shadow:
+            # Usually only Rdst changed; otherwise compare all eight
+            old = shadow[rd]
+            shadow[rd] = regs[rd]
+            if regs == shadow:
+                changes = 1 << rd
+                self.reg_values.append(regs[rd])
+            else:
+                shadow[rd] = old
+                for i in range(8):
+                    if regs[i] != shadow[i]:
+                        changes |= 1 << i
+                        self.reg_values.append(regs[i])
+                shadow[:] = regs
+        if ccr != self.ccr:
+            changes |= CCR_CHANGED
+            self.ccrs.append(ccr)
+            self.ccr = ccr
+        if sp != self.sp:
+            changes |= SP_CHANGED
+            self.sps.append(sp)
+            self.sp = sp
+        if kind > TWO_WORDS or self.entry_writes:
+            writes = self.entry_writes
+            if writes:
+                changes |= INTERRUPTED
+            kind &= ~TWO_WORDS
+            if kind == WRITES_OUT:
+                changes |= OUT_WRITTEN
+                self.outs.append(self.sim.outputs[-1])
+            elif kind == WRITES_EFFECTIVE:
+                writes.append((regs[r1] + value) & ADDR_MASK)
+            elif kind == WRITES_STACK:
+                writes.append((sp + 1) & ADDR_MASK)
+            elif kind == WRITES_STACK_2:
+                writes += ((sp + 2) & ADDR_MASK, (sp + 1) & ADDR_MASK)
+            memory = self.memory
+            for address in writes:
+                self.addrs.append(address)
+                self.values.append(memory[address])
+            changes |= len(writes) << WRITES_SHIFT
+            self.entry_writes = []
+        self.changes.append(changes)
+        if len(self.changes) == self.chunk_steps:
+            self.flush()
+
+    def interrupt(self, sp):
+        """Note an external interrupt entry (PC and CCR pushed below the old SP)."""
+        self.entry_writes += ((sp + 2) & ADDR_MASK, (sp + 1) & ADDR_MASK)
+
+    def _entry_only(self):
+        """Record a pending interrupt entry as a step of its own, with no instruction."""
+        pc = self.sim.pc
+        self.pcs.append(pc - self.pc)
+        self.pc = pc
+        self.words.append(0)
+        changes = ENTRY_ONLY | INTERRUPTED | len(self.entry_writes) << WRITES_SHIFT
+        sp = self.sim.sp
+        if sp != self.sp:
+            changes |= SP_CHANGED
+            self.sps.append(sp)
+            self.sp = sp
+        for address in self.entry_writes:
+            self.addrs.append(address)
+            self.values.append(self.memory[address])
+        self.entry_writes = []
+        self.changes.append(changes)
+
+    def flush(self):
+        """Write the retired steps as one chunk."""
+        count = len(self.changes)
+        if not count:
+            return
+        data = [_column_bytes(column) for column in (
+            self.pcs, self.words, self.exts, self.changes, self.reg_values, self.ccrs, self.sps,
+            self.addrs, self.values, self.outs)]
+        self.f.write(CHUNK_HEADER.pack(count, self.base_pc, *map(len, data)))
+        for column in data:
+            self.f.write(column)
+        self.steps += count
+        self._new_chunk()
+
+    def close(self):
+        """
+        Write the last chunk, with an interrupt entry no step has followed
+        yet (the file itself stays open).
+        """
+        if self.entry_writes:
+            self._entry_only()
+        self.flush()
+        self.sim.trace = None
+
+
+class Step:
+    """One retired instruction, or an ENTRY_ONLY interrupt entry, and what it changed."""
+    __slots__ = ("index", "pc", "word", "ext", "regs", "ccr", "sp", "writes", "out", "interrupted")
+
+    def __init__(self, index, pc, word, ext, regs, ccr, sp, writes, out, interrupted):
+        self.index = index              # steps before this one
+        self.pc = pc
+        self.word = word                # first instruction word, or None for an entry only
+        self.ext = ext                  # second word, or None
+        self.regs = regs                # tuple of (register, new value)
+        self.ccr = ccr                  # new CCR, or None if unchanged
+        self.sp = sp                    # new SP, or None if unchanged
+        self.writes = writes            # tuple of (address, value)
+        self.out = out                  # value written to the output port, or None
+        self.interrupted = interrupted  # an external interrupt was taken just before it
+
+    def key(self):
+        """Everything recorded for the step, for comparing two traces."""
+        return (self.pc, self.word, self.ext, self.regs, self.ccr, self.sp, self.writes,
+                self.out, self.interrupted)
+
+    def describe(self):
+        """The step as one line of text."""
+        from disassembler import DECODE_TABLE, render
+
+        if self.word is None:
+            parts = [f"{self.index:>10}  0x{self.pc:05X}  --------  {'(entry only)':<20}"]
+        else:
+            entry = DECODE_TABLE[self.word >> OPCODE_SHIFT]
+            text = render(entry, self.word, self.ext) if entry else f"0x{self.word:08X}"
+            parts = [f"{self.index:>10}  0x{self.pc:05X}  {self.word:08X}  {text:<20}"]
+        if self.interrupted:
+            parts.append("[interrupt]")
+        parts.extend(f"R{reg}={value:08X}" for reg, value in self.regs)
+        if self.ccr is not None:
+            parts.append(f"CCR={self.ccr:03b}")
+        if self.sp is not None:
+            parts.append(f"SP={self.sp:05X}")
+        parts.extend(f"M[{address:05X}]={value:08X}" for address, value in self.writes)
+        if self.out is not None:
+            parts.append(f"OUT={self.out:08X}")
+        return " ".join(parts).rstrip()
+
+
+def read_header(f):
+    """
+    Read a trace header from a binary file positioned at its start.
+    Returns: (chunk_steps, sp, ccr, regs) where regs is a list of 8 values
+    Raises ValueError if it is not a trace of this version.
+    """
+    data = f.read(TRACE_HEADER.size)
+    if len(data) < TRACE_HEADER.size or data[:4] != TRACE_MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'trace')}: not a trace file")
+    _magic, version, chunk_steps, sp, ccr, *regs = TRACE_HEADER.unpack(data)
+    if version != TRACE_VERSION:
+        raise ValueError(f"{getattr(f, 'name', 'trace')}: unsupported trace version {version}")
+    return chunk_steps, sp, ccr, regs
+
+
+def iter_raw_chunks(f):
+    """
+    Yield the chunks of a trace file positioned after its header.
+    Returns: iterator of (steps, base_pc, compressed column bytes)
+    """
+    name = getattr(f, "name", "trace")
+    while True:
+        head = f.read(CHUNK_HEADER.size)
+        if not head:
+            return
+        if len(head) < CHUNK_HEADER.size:
+            raise ValueError(f"{name}: truncated chunk header")
+        steps, base_pc, *sizes = CHUNK_HEADER.unpack(head)
+        data = []
+        for size in sizes:
+            column = f.read(size)
+            if len(column) < size:
+                raise ValueError(f"{name}: truncated chunk")
+            data.append(column)
+        yield steps, base_pc, data
+
+
+def _columns(steps, data):
+    """Decompress a chunk's columns into a dict of arrays."""
+    cols = {name: _column_array(typecode, column)
+            for (name, typecode), column in zip(COLUMNS, data)}
+    if len(cols["changes"]) != steps or len(cols["pc"]) != steps or len(cols["word"]) != steps:
+        raise ValueError(f"trace chunk of {steps} steps has columns of other lengths")
+    return cols
+
+
+def decode_chunk(steps, base_pc, data, first=0):
+    """Expand one chunk's columns into Step records (first is the index of its first step)."""
+    cols = _columns(steps, data)
+    ext = iter(cols["ext"])
+    regs = iter(cols["regs"])
+    ccrs = iter(cols["ccr"])
+    sps = iter(cols["sp"])
+    addresses = iter(cols["addr"])
+    values = iter(cols["value"])
+    outs = iter(cols["out"])
+    pc = base_pc
+    for i, (delta, word, changes) in enumerate(zip(cols["pc"], cols["word"], cols["changes"])):
+        pc += delta
+        written = ()
+        if changes & REGS_CHANGED:
+            written = tuple((reg, next(regs)) for reg in range(8) if changes >> reg & 1)
+        count = changes >> WRITES_SHIFT & 7
+        if changes & ENTRY_ONLY:
+            word = None
+        yield Step(first + i, pc, word,
+                   next(ext) if word is not None and INSTRUCTION_SIZE[word >> OPCODE_SHIFT] == 2
+                   else None,
+                   written,
+                   next(ccrs) if changes & CCR_CHANGED else None,
+                   next(sps) if changes & SP_CHANGED else None,
+                   tuple((next(addresses), next(values)) for _ in range(count)) if count else (),
+                   next(outs) if changes & OUT_WRITTEN else None,
+                   bool(changes & INTERRUPTED))
+
+
+class TraceState:
+    """Registers, CCR and SP followed along a trace."""
+    __slots__ = ("regs", "ccr", "sp")
+
+    def __init__(self, regs, ccr, sp):
+        self.regs = list(regs)
+        self.ccr = ccr
+        self.sp = sp
+
+    def apply(self, step):
+        """Update the state with what one step changed."""
+        for reg, value in step.regs:
+            self.regs[reg] = value
+        if step.ccr is not None:
+            self.ccr = step.ccr
+        if step.sp is not None:
+            self.sp = step.sp
+
+    def apply_chunk(self, steps, data):
+        """Update the state to the end of a whole chunk, scanning back only until every register is found."""
+        cols = _columns(steps, data)
+        if cols["ccr"]:
+            self.ccr = cols["ccr"][-1]
+        if cols["sp"]:
+            self.sp = cols["sp"][-1]
+        values = cols["regs"]
+        position = len(values)
+        missing = REGS_CHANGED
+        for changes in reversed(cols["changes"]):
+            mask = changes & REGS_CHANGED
+            if not mask:
+                continue
+            for reg in range(7, -1, -1):
+                if mask >> reg & 1:
+                    position -= 1
+                    if missing >> reg & 1:
+                        self.regs[reg] = values[position]
+                        missing &= ~(1 << reg)
+            if not missing:
+                break
+
+
+def iter_steps(path, start=0):
+    """
+    Stream the steps of a trace file from step index start on; chunks
+    wholly before start are skipped without being decompressed.
+    Returns: iterator of Step
+    """
+    with open(path, 'rb') as f:
+        read_header(f)
+        first = 0
+        for steps, base_pc, data in iter_raw_chunks(f):
+            if first + steps > start:
+                for step in decode_chunk(steps, base_pc, data, first):
+                    if step.index >= start:
+                        yield step
+            first += steps
+
+
+def trace_summary(path):
+    """
+    Size figures of a trace, read from the chunk headers only.
+    Returns: dict with steps, chunks, bytes and bytes per step
+    """
+    steps = chunks = 0
+    with open(path, 'rb') as f:
+        read_header(f)
+        while True:
+            head = f.read(CHUNK_HEADER.size)
+            if len(head) < CHUNK_HEADER.size:
+                break
+            count, _base_pc, *sizes = CHUNK_HEADER.unpack(head)
+            f.seek(sum(sizes), 1)
+            steps += count
+            chunks += 1
+    size = os.path.getsize(path)
+    return {"steps": steps, "chunks": chunks, "bytes": size,
+            "bytes_per_step": size / steps if steps else 0.0}
+
+
+def _differences(a, b):
+    """Names of the recorded fields in which two steps differ."""
+    fields = ("pc", "word", "ext", "regs", "ccr", "sp", "writes", "out", "interrupted")
+    if a is None or b is None:
+        return ["end of trace"]
+    return [name for name, x, y in zip(fields, a.key(), b.key()) if x != y]
+
+
+def first_divergence(path_a, path_b, context=3):
+    """
+    Find the first step at which two traces differ. Chunks that are byte
+    for byte the same in both are skipped without being decoded, so two
+    long runs that split late are compared at close to file read speed.
+    Returns: None if the traces are the same, else a dict with index (the
+    first differing step), a and b (the Steps there, None past the end
+    of a trace), fields (what differs), before (up to context common
+    steps leading to it) and state (TraceState before the step)
+    """
+    from collections import deque
+    from itertools import chain
+
+    with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+        _chunk_a, sp, ccr, regs = read_header(fa)
+        header_b = read_header(fb)
+        state = TraceState(regs, ccr, sp)
+        if (sp, ccr, regs) != header_b[1:]:
+            return {"index": 0, "a": None, "b": None, "fields": ["initial state"], "before": [],
+                    "state": state}
+
+        chunks_a, chunks_b = iter_raw_chunks(fa), iter_raw_chunks(fb)
+        index = 0
+        last = None
+        while True:
+            chunk_a, chunk_b = next(chunks_a, None), next(chunks_b, None)
+            if chunk_a is None and chunk_b is None:
+                return None
+            if chunk_a != chunk_b:
+                break
+            state.apply_chunk(chunk_a[0], chunk_a[2])
+            last = chunk_a
+            index += chunk_a[0]
+
+        before = deque(maxlen=context)
+        if last is not None and context:
+            before.extend(decode_chunk(last[0], last[1], last[2], index - last[0]))
+        steps_a = chain.from_iterable(decode_chunk(*chunk, 0) for chunk in chain(
+            (chunk_a,) if chunk_a else (), chunks_a))
+        steps_b = chain.from_iterable(decode_chunk(*chunk, 0) for chunk in chain(
+            (chunk_b,) if chunk_b else (), chunks_b))
+        while True:
+            a, b = next(steps_a, None), next(steps_b, None)
+            if a is None and b is None:
+                return None
+            for step in (a, b):
+                if step is not None:
+                    step.index = index
+            if a is None or b is None or a.key() != b.key():
+                return {"index": index, "a": a, "b": b, "fields": _differences(a, b),
+                        "before": list(before), "state": state}
+            state.apply(a)
+            before.append(a)
+            index += 1
+
+
+def print_divergence(path_a, path_b, found):
+    """Print a first_divergence result."""
+    print("=" * 70)
+    print("TRACE DIVERGENCE")
+    print("=" * 70)
+    print(f"A: {path_a}")
+    print(f"B: {path_b}")
+    if found is None:
+        print("The traces are identical.")
+        print("=" * 70)
+        return
+    print(f"First difference at step {found['index']}: {', '.join(found['fields'])}")
+    state = found["state"]
+    print("-" * 70)
+    print(f"State before it: SP=0x{state.sp:05X}  CCR={state.ccr:03b}")
+    print("  " + "  ".join(f"R{i}={value:08X}" for i, value in enumerate(state.regs)))
+    print("-" * 70)
+    for step in found["before"]:
+        print(f"  {step.describe()}")
+    for name, step in (("A", found["a"]), ("B", found["b"])):
+        print(f"{name} {step.describe() if step is not None else '(trace ends)'}")
+    print("=" * 70)
+
+
+def main():
+    import argparse
+    from itertools import islice
+
+    parser = argparse.ArgumentParser(description="Print an execution trace, or find where two traces first differ")
+    parser.add_argument("trace", help="trace written by simulator.py --trace")
+    parser.add_argument("other", nargs="?", help="second trace to compare against")
+    parser.add_argument("--start", type=int, default=0, help="first step to print (default: 0)")
+    parser.add_argument("--count", type=int, default=50, help="steps to print (default: 50)")
+    parser.add_argument("--context", type=int, default=5,
+                        help="common steps shown before a divergence (default: 5)")
+    args = parser.parse_args()
+
+    try:
+        if args.other:
+            found = first_divergence(args.trace, args.other, args.context)
+            print_divergence(args.trace, args.other, found)
+            sys.exit(0 if found is None else 1)
+        summary = trace_summary(args.trace)
+        print("=" * 70)
+        print(f"TRACE: {args.trace}")
+        print("=" * 70)
+        print(f"Steps: {summary['steps']}  Chunks: {summary['chunks']}  "
+              f"Size: {summary['bytes']} bytes ({summary['bytes_per_step']:.3f} bytes/step)")
+        print("-" * 70)
+        for step in islice(iter_steps(args.trace, args.start), args.count):
+            print(step.describe())
+        print("=" * 70)
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Basic-block translating executor.
+Same architectural behaviour as simulator.Simulator, but straight-line
+runs of instructions are translated once into generated Python functions
+and cached by start address. A block ends after JZ/JN/JC/CALL/RET/INT/
+RTI, before HLT or an undefined opcode, or after MAX_BLOCK instructions;
+unconditional JMPs are followed into their target so a loop body closed
+by a JMP becomes one block.
+
+Stores (STD, PUSH, CALL, INT) check a per-word coverage map; a store into
+translated code drops every block covering that word, and if the running
+block itself was hit it exits right after the store so execution resumes
+from freshly decoded code. Cold code and words that keep being rewritten
+stay on the interpreter, so one-off or self-modifying code does not pay
+for translation over and over.
+
+Usage: python translator.py <image.mem|image.bin|program.asm> [--in V ...] [--max-steps N] [--compare]
+"""
+
+from simulator import (Simulator, SimulationError, decode_word, load_program, MEMORY_DEPTH,
+                       ADDR_MASK, WORD_MASK, INSTRUCTION_SIZE, OP_NOP, OP_HLT, OP_SETC, OP_INC,
+                       OP_NOT, OP_LDM, OP_MOV, OP_SWAP, OP_IADD, OP_ADD, OP_SUB, OP_AND, OP_JZ,
+                       OP_JN, OP_JC, OP_JMP, OP_OUT, OP_IN, OP_PUSH, OP_POP, OP_LDD, OP_STD,
+                       OP_CALL, OP_RET, OP_INT, OP_RTI)
+
+
+MAX_BLOCK = 64
+HOT_THRESHOLD = 2       # visits to a block start before it is translated
+VOLATILE_LIMIT = 4      # rewrites of a code word before it is left to the interpreter
+
+TERMINATORS = frozenset((OP_JZ, OP_JN, OP_JC, OP_JMP, OP_CALL, OP_RET, OP_INT, OP_RTI))
+STORES = frozenset((OP_STD, OP_PUSH, OP_CALL, OP_INT))
+
+
+def _flags(target):
+    """Lines setting N and Z from the register or name 'r' just written."""
+    return [f"n = {target} >> 31", f"z = 0 if {target} else 1"]
+
+
+def _store(address, value, resume_pc, executed, start):
+    """Lines storing value at address, invalidating translated code it hits."""
+    return [
+        f"memory[{address}] = {value}",
+        f"decoded[{address}] = None",
+        f"decoded[({address} - 1) & {ADDR_MASK}] = None",
+        f"if covered[{address}]:",
+        f"    invalidate({address})",
+        f"    if blocks[{start}] is None:",
+        f"        return ({resume_pc}, z, n, c, sp, {executed})",
+    ]
+
+
+def block_extent(memory, pc, limit=MAX_BLOCK, barrier=None, decoded=None):
+    """
+    Decode the run of instructions executed from pc up to the next
+    control transfer. Unconditional JMPs are followed (unless they loop
+    back into the run); it stops after any other terminator, before HLT,
+    an undefined opcode or a word marked in barrier, or after limit
+    instructions. decoded is an optional per-address decode cache to read
+    and fill.
+    Returns: (list of (address, decoded), list of (first, end) address spans)
+    """
+    instructions = []
+    spans = []
+    span_start = pc
+    while len(instructions) < limit:
+        op = memory[pc] >> 27
+        size = INSTRUCTION_SIZE[op]
+        if size == 0 or op == OP_HLT or pc + size > MEMORY_DEPTH:
+            break
+        if barrier is not None and (barrier[pc] or (size == 2 and barrier[pc + 1])):
+            break
+        if decoded is None:
+            d = decode_word(memory, pc)
+        else:
+            d = decoded[pc]
+            if d is None:
+                d = decoded[pc] = decode_word(memory, pc)
+        instructions.append((pc, d))
+        pc = d[5]
+        if op == OP_JMP:
+            target = d[4] & ADDR_MASK
+            spans.append((span_start, pc))
+            span_start = pc = target
+            if any(first <= target < end for first, end in spans):
+                break
+        elif op in TERMINATORS:
+            break
+    if pc > span_start:
+        spans.append((span_start, pc))
+    return instructions, spans
+
+
+def translate_block(memory, pc, limit=MAX_BLOCK, barrier=None):
+    """
+    Generate the source of a block function starting at pc.
+    The function takes and returns the flags and SP:
+        block(z, n, c, sp) -> (next_pc, z, n, c, sp, executed)
+    Returns: (source, instruction_count, spans); count is 0 when the
+    instruction at pc must be interpreted.
+    """
+    start = pc
+    instructions, spans = block_extent(memory, pc, limit, barrier)
+    if not instructions:
+        return None, 0, spans
+
+    body = []
+    exit_pc = instructions[-1][1][5]
+    for k, (_at, (op, rd, r1, r2, value, next_pc)) in enumerate(instructions, 1):
+        if op == OP_ADD or op == OP_IADD or op == OP_INC:
+            operand = f"regs[{r2}]" if op == OP_ADD else (value if op == OP_IADD else 1)
+            body += [f"r = regs[{r1}] + {operand}", "c = r >> 32", f"r &= {WORD_MASK}",
+                     f"regs[{rd}] = r"] + _flags("r")
+        elif op == OP_SUB:
+            body += [f"a = regs[{r1}]", f"b = regs[{r2}]", "c = 1 if a < b else 0",
+                     f"r = (a - b) & {WORD_MASK}", f"regs[{rd}] = r"] + _flags("r")
+        elif op == OP_AND:
+            body += [f"r = regs[{r1}] & regs[{r2}]", f"regs[{rd}] = r"] + _flags("r")
+        elif op == OP_NOT:
+            body += [f"r = regs[{r1}] ^ {WORD_MASK}", f"regs[{rd}] = r"] + _flags("r")
+        elif op in (OP_JZ, OP_JN, OP_JC):
+            flag = {OP_JZ: "z", OP_JN: "n", OP_JC: "c"}[op]
+            taken = {"z": "0, n, c", "n": "z, 0, c", "c": "z, n, 0"}[flag]
+            body += [f"if {flag}:", f"    return ({value & ADDR_MASK}, {taken}, sp, {k})"]
+        elif op == OP_JMP:
+            if k == len(instructions):
+                exit_pc = value & ADDR_MASK
+        elif op == OP_LDM:
+            body.append(f"regs[{rd}] = {value}")
+        elif op == OP_MOV:
+            body.append(f"regs[{rd}] = regs[{r1}]")
+        elif op == OP_SWAP:
+            body.append(f"regs[{r1}], regs[{rd}] = regs[{rd}], regs[{r1}]")
+        elif op == OP_LDD:
+            body.append(f"regs[{rd}] = memory[(regs[{r1}] + {value}) & {ADDR_MASK}]")
+        elif op == OP_STD:
+            body.append(f"a = (regs[{r1}] + {value}) & {ADDR_MASK}")
+            body += _store("a", f"regs[{r2}]", next_pc, k, start)
+        elif op == OP_OUT:
+            body.append(f"outputs.append(regs[{r2}])")
+        elif op == OP_IN:
+            body.append(f"regs[{rd}] = next(inputs, 0) & {WORD_MASK}")
+        elif op == OP_PUSH or op == OP_CALL:
+            pushed = f"regs[{r2}]" if op == OP_PUSH else next_pc
+            resume = next_pc if op == OP_PUSH else value & ADDR_MASK
+            body += ["a = sp", f"sp = (sp - 1) & {ADDR_MASK}"]
+            body += _store("a", pushed, resume, k, start)
+            if op == OP_CALL:
+                exit_pc = value & ADDR_MASK
+        elif op == OP_POP:
+            body += [f"sp = (sp + 1) & {ADDR_MASK}", f"regs[{rd}] = memory[sp]"]
+        elif op == OP_RET:
+            body.append(f"sp = (sp + 1) & {ADDR_MASK}")
+            exit_pc = f"memory[sp] & {ADDR_MASK}"
+        elif op == OP_SETC:
+            body.append("c = 1")
+        elif op == OP_INT:
+            # Both pushes happen before any exit, so resume at the vector
+            body += ["a = sp", "b = (sp - 1) & {}".format(ADDR_MASK), f"sp = (sp - 2) & {ADDR_MASK}",
+                     f"memory[a] = {next_pc}", "memory[b] = c | (n << 1) | (z << 2)"]
+            for address in ("a", "b"):
+                body += [f"decoded[{address}] = None",
+                         f"decoded[({address} - 1) & {ADDR_MASK}] = None",
+                         f"if covered[{address}]:", f"    invalidate({address})"]
+            exit_pc = f"memory[{value}] & {ADDR_MASK}"
+        elif op == OP_RTI:
+            body += [f"sp = (sp + 1) & {ADDR_MASK}", "f = memory[sp]",
+                     "c, n, z = f & 1, (f >> 1) & 1, (f >> 2) & 1",
+                     f"sp = (sp + 1) & {ADDR_MASK}"]
+            exit_pc = f"memory[sp] & {ADDR_MASK}"
+        elif op == OP_NOP:
+            pass
+    body.append(f"return ({exit_pc}, z, n, c, sp, {len(instructions)})")
+
+    source = (f"def block_{start:05X}(z, n, c, sp, regs=regs, memory=memory, decoded=decoded,\n"
+              f"        covered=covered, invalidate=invalidate, blocks=blocks, outputs=outputs,\n"
+              f"        inputs=inputs):\n"
+              + "".join(f"    {line}\n" for line in body))
+    return source, len(instructions), spans
+
+
+class BlockExecutor(Simulator):
+    """
+    Simulator that runs cached translated blocks instead of decoding
+    every instruction. A block start is translated once it has been
+    reached HOT_THRESHOLD times; until then, and for tails shorter than a
+    block (to honour max_steps exactly), HLT and undefined opcodes, code
+    runs on the interpreter. Words rewritten VOLATILE_LIMIT times are
+    never translated again.
+    """
+
+    def __init__(self, segments=(), inputs=()):
+        super().__init__(segments, inputs)
+        self._blocks = [None] * MEMORY_DEPTH    # start -> (function, length, spans)
+        self._heat = bytearray(MEMORY_DEPTH)
+        self._covered = bytearray(MEMORY_DEPTH)
+        self._volatile = bytearray(MEMORY_DEPTH)
+        self._owners = {}                       # address -> [block start, ...]
+        self._rewrites = {}                     # address -> invalidation count
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.interpreted = 0
+
+    def write_memory(self, address, value):
+        """Store a word, dropping translated blocks that cover it."""
+        super().write_memory(address, value)
+        address &= ADDR_MASK
+        if self._covered[address]:
+            self.invalidate(address)
+
+    def invalidate(self, address):
+        """Drop every translated block covering address."""
+        for start in self._owners.pop(address, ()):
+            entry = self._blocks[start]
+            if entry is None:
+                continue
+            self._blocks[start] = None
+            self.invalidations += 1
+            for first, end in entry[2]:
+                for covered in range(first, end):
+                    owners = self._owners.get(covered)
+                    if owners is None:
+                        continue
+                    if start in owners:
+                        owners.remove(start)
+                    if not owners:
+                        del self._owners[covered]
+                        self._covered[covered] = 0
+        self._covered[address] = 0
+        rewrites = self._rewrites.get(address, 0) + 1
+        self._rewrites[address] = rewrites
+        if rewrites >= VOLATILE_LIMIT:
+            self._volatile[address] = 1
+
+    def _translate(self, pc):
+        """Translate and cache the block at pc; None if it must be interpreted."""
+        source, length, spans = translate_block(self.memory, pc, MAX_BLOCK, self._volatile)
+        if not length:
+            return None
+        namespace = {"regs": self.regs, "memory": self.memory, "decoded": self._decoded,
+                     "covered": self._covered, "invalidate": self.invalidate,
+                     "blocks": self._blocks, "outputs": self.outputs, "inputs": self.inputs}
+        exec(compile(source, f"<block 0x{pc:05X}>", "exec"), namespace)
+        entry = self._blocks[pc] = (namespace[f"block_{pc:05X}"], length, spans)
+        for first, end in spans:
+            for address in range(first, end):
+                self._owners.setdefault(address, []).append(pc)
+                self._covered[address] = 1
+        self.misses += 1
+        return entry
+
+    def _store_addresses(self, op, r1, value):
+        """Addresses the instruction about to execute will store to."""
+        sp = self.sp
+        if op == OP_STD:
+            return ((self.regs[r1] + value) & ADDR_MASK,)
+        if op == OP_PUSH or op == OP_CALL:
+            return (sp,)
+        if op == OP_INT:
+            return (sp, (sp - 1) & ADDR_MASK)
+        return ()
+
+    def _interpret(self, max_steps):
+        """
+        Run up to one block's worth of instructions from self.pc on the
+        interpreter, invalidating translated blocks its stores hit.
+        Returns: number of instructions executed
+        """
+        instructions, spans = block_extent(self.memory, self.pc, max_steps, decoded=self._decoded)
+        if not instructions:
+            executed = Simulator.run(self, 1)    # HLT, or raises on an undefined opcode
+        else:
+            executed = i = 0
+            while i < len(instructions):
+                j = i
+                while j < len(instructions) and instructions[j][1][0] not in STORES:
+                    j += 1
+                if j > i:
+                    executed += Simulator.run(self, j - i)
+                    i = j
+                    continue
+                op, _rd, r1, _r2, value, _next_pc = instructions[i][1]
+                written = self._store_addresses(op, r1, value)
+                executed += Simulator.run(self, 1)
+                i += 1
+                for address in written:
+                    if self._covered[address]:
+                        self.invalidate(address)
+                if any(first <= address < end for address in written for first, end in spans):
+                    break
+        self.steps -= executed
+        self.interpreted += executed
+        return executed
+
+    def run(self, max_steps=None):
+        """
+        Execute until HLT or max_steps instructions.
+        Returns: number of instructions executed by this call
+        """
+        if self.halted:
+            return 0
+        blocks = self._blocks
+        heat = self._heat
+        limit = -1 if max_steps is None else max_steps
+        pc, sp = self.pc, self.sp
+        z, n, c = self.z, self.n, self.c
+        count = hits = 0
+
+        try:
+            while count != limit:
+                entry = blocks[pc]
+                if entry is None:
+                    if heat[pc] < HOT_THRESHOLD - 1:
+                        heat[pc] += 1
+                    else:
+                        heat[pc] = 0
+                        entry = self._translate(pc)
+                else:
+                    hits += 1
+                if entry is not None and (limit == -1 or limit - count >= entry[1]):
+                    pc, z, n, c, sp, executed = entry[0](z, n, c, sp)
+                    count += executed
+                    continue
+                self.pc, self.sp, self.z, self.n, self.c = pc, sp, z, n, c
+                count += self._interpret(MAX_BLOCK if limit == -1 else limit - count)
+                pc, sp, z, n, c = self.pc, self.sp, self.z, self.n, self.c
+                if self.halted:
+                    break
+        finally:
+            self.pc, self.sp = pc, sp
+            self.z, self.n, self.c = z, n, c
+            self.steps += count
+            self.hits += hits
+
+        return count
+
+    def stats(self):
+        """Block cache counters as a dict."""
+        return {
+            "blocks": sum(1 for entry in self._blocks if entry is not None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "volatile_words": sum(self._volatile),
+            "interpreted": self.interpreted,
+        }
+
+
+def main():
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Basic-block translating executor")
+    parser.add_argument("image", help=".mem/.bin image or .asm source")
+    parser.add_argument("--in", dest="inputs", type=lambda s: int(s, 0), nargs="*", default=[],
+                        help="IN port values, consumed in order (0 once exhausted)")
+    parser.add_argument("--max-steps", type=int, default=10_000_000,
+                        help="stop after this many instructions (default: 10M)")
+    parser.add_argument("--compare", action="store_true",
+                        help="also run the interpreter, check the final state and report the speedup")
+    args = parser.parse_args()
+
+    try:
+        segments = load_program(args.image)
+        sim = BlockExecutor(segments, args.inputs)
+        start = time.perf_counter()
+        sim.run(args.max_steps)
+        elapsed = time.perf_counter() - start
+        if args.compare:
+            ref = Simulator(segments, args.inputs)
+            start = time.perf_counter()
+            ref.run(args.max_steps)
+            ref_elapsed = time.perf_counter() - start
+    except (OSError, ValueError, SimulationError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"BLOCK EXECUTION: {args.image}")
+    print("=" * 60)
+    status = "halted" if sim.halted else "step limit reached"
+    print(f"Instructions: {sim.steps} ({status})")
+    if elapsed > 0:
+        print(f"Speed: {sim.steps / elapsed / 1e6:.2f} M instr/s")
+    stats = sim.stats()
+    lookups = stats["hits"] + stats["misses"]
+    rate = 100.0 * stats["hits"] / lookups if lookups else 0.0
+    print(f"Blocks: {stats['blocks']}  Hits: {stats['hits']}  Misses: {stats['misses']} "
+          f"({rate:.2f}% hit rate)")
+    print(f"Invalidations: {stats['invalidations']}  Volatile words: {stats['volatile_words']}  "
+          f"Interpreted: {stats['interpreted']}")
+    print(f"PC: 0x{sim.pc:05X}  SP: 0x{sim.sp:05X}  CCR: Z={sim.z} N={sim.n} C={sim.c}")
+    for i, value in enumerate(sim.regs):
+        print(f"  R{i}: 0x{value:08X} ({value})")
+    shown = " ".join(f"{v:X}" for v in sim.outputs[:32])
+    more = f" ... ({len(sim.outputs)} values)" if len(sim.outputs) > 32 else ""
+    print(f"Output port: {shown or '-'}{more}")
+    if args.compare:
+        print("-" * 60)
+        same = (ref.state() == sim.state() and ref.outputs == sim.outputs
+                and ref.memory == sim.memory)
+        print(f"Interpreter: {'identical state' if same else 'STATE MISMATCH'}")
+        if elapsed > 0:
+            print(f"Speedup: {ref_elapsed / elapsed:.1f}x")
+    print("=" * 60)
+    if args.compare and not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
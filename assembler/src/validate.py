@@ -1,125 +1,308 @@
 """
 Validation script for the assembler output.
 Compares generated machine code with expected values.
+
+Both files may be in any image format memfile reads (binary text, hex
+text, sparse '@' records, _hex.mem listings, raw .bin); the format is
+detected per file. Images are streamed and compared chunk by chunk by
+address, so memory use stays flat and matching runs are compared as
+whole array slices rather than word by word.
+
+Usage: python validate.py [expected generated] [--max-mismatches N] [--show N] [--zero-fill] [--json FILE]
 """
 
+import memfile
+
+
+# Formats whose words are stored in ascending address order by construction
+SEQUENTIAL_FORMATS = ("binary text", "hex text", "raw binary", "empty")
+
+class _Cursor:
+    """Position in an ascending stream of (base_address, array('I')) runs."""
+
+    def __init__(self, chunks, name):
+        self.chunks = iter(chunks)
+        self.name = name
+        self.words = 0              # words read so far
+        self.run = None
+        self.pos = 0
+        self.address = None         # address of the current word, None at the end
+        self._end = -1
+        self._next_chunk()
+
+    def _next_chunk(self):
+        for base, run in self.chunks:
+            if not run:
+                continue
+            if base < self._end:
+                raise ValueError(f"{self.name}: segment at 0x{base:X} is out of address order")
+            self.run, self.pos, self.address = run, 0, base
+            self._end = base + len(run)
+            self.words += len(run)
+            return
+        self.run, self.address = None, None
+
+    @property
+    def remaining(self):
+        """Words left in the current run."""
+        return len(self.run) - self.pos
+
+    def take(self, n):
+        """Return the next n words of the current run (as an array) and advance."""
+        if self.pos == 0 and n == len(self.run):
+            words = self.run
+        else:
+            words = self.run[self.pos:self.pos + n]
+        self.pos += n
+        self.address += n
+        if self.pos == len(self.run):
+            self._next_chunk()
+        return words
+
+
+def sorted_runs(runs):
+    """Runs (base_address, array('I')) in address order; where they overlap, later runs win."""
+    ordered = sorted(runs, key=lambda run: run[0])
+    end = -1
+    for base, run in ordered:
+        if base < end:
+            break
+        end = base + len(run)
+    else:
+        return ordered
+    words = {}
+    for base, run in runs:
+        words.update(zip(range(base, base + len(run)), run))
+    addresses = sorted(words)
+    return memfile.build_segments(addresses, [words[a] for a in addresses])
+
+
+def sorted_chunks(path):
+    """Read a whole image into memory and return its runs in address order (later words win)."""
+    return sorted_runs(list(memfile.iter_chunks(path)))
+
+
+def ordered_chunks(path, fmt=None):
+    """
+    Chunk stream of an image in ascending address order. Sequential
+    formats are streamed directly; images with addresses (sparse,
+    listings, .bin with header) are checked first and only read into
+    memory and sorted if they are out of order.
+    """
+    fmt = fmt or memfile.detect_format(path)
+    if fmt in SEQUENTIAL_FORMATS:
+        return memfile.iter_chunks(path)
+    if fmt == "sparse":
+        in_order = _sparse_in_order(path)
+    else:
+        in_order = _runs_in_order(run for run in memfile.iter_chunks(path))
+    return memfile.iter_chunks(path) if in_order else sorted_chunks(path)
+
+
+def _runs_in_order(runs):
+    """True if (base_address, words) runs ascend without overlapping."""
+    end = -1
+    for base, words in runs:
+        if base < end:
+            return False
+        end = base + len(words)
+    return True
+
+
+def _sparse_in_order(path):
+    """
+    Order check for sparse text images that only parses the '@' records.
+    Every other line counts as a word, so blank or comment lines can only
+    make the check more cautious, never wrong.
+    """
+    def runs():
+        base = count = 0
+        with open(path, 'r') as f:
+            for line in f:
+                if line[:1] == "@":
+                    yield base, range(count)
+                    base, count = int(line[1:], 16), 0
+                else:
+                    count += 1
+        yield base, range(count)
+    return _runs_in_order((base, words) for base, words in runs() if words)
+
+
+def compare_images(expected, generated, max_mismatches=None, zero_fill=False, keep=50,
+                   names=("expected", "generated")):
+    """
+    Compare two chunk streams, each in ascending address order, by address.
+    A word present on one side only is a mismatch, unless zero_fill is set
+    and the word is zero (memory powers up cleared). Comparison stops once
+    max_mismatches mismatches have been found.
+    Returns: dict with word counts, matching and mismatch counts, whether it
+    stopped early, and the first keep mismatches as (address, expected,
+    generated), where a missing word is None.
+    """
+    exp = _Cursor(expected, names[0])
+    gen = _Cursor(generated, names[1])
+    compared = matching = mismatches = 0
+    details = []
+    stopped = False
+
+    def record(address, a, b):
+        nonlocal mismatches, stopped
+        mismatches += 1
+        if len(details) < keep:
+            details.append((address, a, b))
+        if max_mismatches is not None and mismatches >= max_mismatches:
+            stopped = True
+
+    def one_sided(cursor, limit, expected_side):
+        nonlocal mismatches
+        address = cursor.address
+        n = cursor.remaining if limit is None else min(cursor.remaining, limit - address)
+        words = cursor.take(n)
+        if max_mismatches is None and len(details) >= keep:
+            # Only counting now: no per-word work
+            mismatches += n - words.count(0) if zero_fill else n
+            return
+        for i, word in enumerate(words):
+            if zero_fill and word == 0:
+                continue
+            if expected_side:
+                record(address + i, word, 0 if zero_fill else None)
+            else:
+                record(address + i, 0 if zero_fill else None, word)
+            if stopped:
+                return
+
+    while not stopped and (exp.address is not None or gen.address is not None):
+        if gen.address is None or (exp.address is not None and exp.address < gen.address):
+            one_sided(exp, gen.address, True)
+        elif exp.address is None or gen.address < exp.address:
+            one_sided(gen, exp.address, False)
+        else:
+            address = exp.address
+            n = min(exp.remaining, gen.remaining)
+            a = exp.take(n)
+            b = gen.take(n)
+            if a == b:
+                compared += n
+                matching += n
+                continue
+            for i in range(n):
+                compared += 1
+                if a[i] == b[i]:
+                    matching += 1
+                else:
+                    record(address + i, a[i], b[i])
+                    if stopped:
+                        break
+
+    return {
+        "expected_words": exp.words,
+        "generated_words": gen.words,
+        "compared": compared,
+        "matching": matching,
+        "mismatches": mismatches,
+        "stopped_early": stopped,
+        "details": details,
+    }
+
+
 def load_expected(filename):
-    """Load expected hex values from file (ignores comments)."""
-    expected = []
-    with open(filename, 'r') as f:
-        for line in f:
-            line = line.split(';')[0].split('#')[0].strip()
-            if line and len(line) == 8:  # Valid 8-char hex
-                try:
-                    int(line, 16)  # Validate it's hex
-                    expected.append(line.upper())
-                except ValueError:
-                    pass
-    return expected
+    """Load expected words as 8-character upper-case hex strings (comments ignored)."""
+    return [f"{word:08X}" for _address, word in memfile.iter_words(filename)]
 
 
 def load_generated(filename):
-    """Load generated hex values from .mem file."""
-    generated = []
-    with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            # Skip comment lines
-            if line.startswith('//'):
-                continue
-            if line and len(line) == 8:
-                try:
-                    int(line, 16)  # Validate it's hex
-                    generated.append(line.upper())
-                except ValueError:
-                    pass
-    return generated
+    """Load generated words, from any image format, as 8-character upper-case hex strings."""
+    return [f"{word:08X}" for _address, word in memfile.iter_words(filename)]
 
 
-def validate(expected_file, generated_file):
+def validate(expected_file, generated_file, max_mismatches=None, zero_fill=False, show=50,
+             json_file=None):
     """Compare expected vs generated and report differences."""
-    expected = load_expected(expected_file)
-    generated = load_generated(generated_file)
-    
+    expected_format = memfile.detect_format(expected_file)
+    generated_format = memfile.detect_format(generated_file)
+    result = compare_images(ordered_chunks(expected_file, expected_format),
+                            ordered_chunks(generated_file, generated_format),
+                            max_mismatches=max_mismatches, zero_fill=zero_fill, keep=show,
+                            names=(expected_file, generated_file))
+    result["expected_file"] = expected_file
+    result["generated_file"] = generated_file
+    result["expected_format"] = expected_format
+    result["generated_format"] = generated_format
+
     print("=" * 70)
     print("ASSEMBLER VALIDATION REPORT")
     print("=" * 70)
-    print(f"Expected file:  {expected_file}")
-    print(f"Generated file: {generated_file}")
-    print(f"Expected count: {len(expected)}")
-    print(f"Generated count: {len(generated)}")
+    print(f"Expected file:  {expected_file} ({result['expected_format']})")
+    print(f"Generated file: {generated_file} ({result['generated_format']})")
+    print(f"Expected count: {result['expected_words']}")
+    print(f"Generated count: {result['generated_words']}")
     print("-" * 70)
-    
-    errors = []
-    max_len = max(len(expected), len(generated))
-    
-    for i in range(max_len):
-        exp = expected[i] if i < len(expected) else "--------"
-        gen = generated[i] if i < len(generated) else "--------"
-        
-        if exp != gen:
-            errors.append((i, exp, gen))
-    
-    if not errors:
-        print("\n✅ SUCCESS! All {} instructions match!\n".format(len(generated)))
+
+    mismatches = result["mismatches"]
+    if not mismatches:
+        print("\n✅ SUCCESS! All {} words match!\n".format(result["compared"]))
     else:
-        print(f"\n❌ FAILED! {len(errors)} mismatches found:\n")
-        print(f"{'Addr':<6} {'Expected':<12} {'Generated':<12} {'Status'}")
+        more = " (stopped early)" if result["stopped_early"] else ""
+        print(f"\n❌ FAILED! {mismatches} mismatches found{more}:\n")
+        print(f"{'Addr':<8} {'Expected':<12} {'Generated':<12} {'Status'}")
         print("-" * 45)
-        for addr, exp, gen in errors:
-            print(f"{addr:<6} {exp:<12} {gen:<12} MISMATCH")
-    
-    # Show summary
+        for address, exp, gen in result["details"]:
+            exp_text = "--------" if exp is None else f"{exp:08X}"
+            gen_text = "--------" if gen is None else f"{gen:08X}"
+            print(f"{address:<8} {exp_text:<12} {gen_text:<12} MISMATCH")
+        if mismatches > len(result["details"]):
+            print(f"... {mismatches - len(result['details'])} more")
+
     print("-" * 70)
-    print(f"Total instructions: {len(generated)}")
-    print(f"Matching: {len(generated) - len(errors)}")
-    print(f"Mismatches: {len(errors)}")
-    print("=" * 70)
-    
-    # Detailed comparison (first 20 and last 10)
-    print("\n" + "=" * 70)
-    print("DETAILED COMPARISON (first 30 + last 10 instructions)")
+    print(f"Compared addresses: {result['compared']}")
+    print(f"Matching: {result['matching']}")
+    print(f"Mismatches: {mismatches}")
     print("=" * 70)
-    print(f"{'Addr':<6} {'Expected':<12} {'Generated':<12} {'Match'}")
-    print("-" * 45)
-    
-    # First 30
-    for i in range(min(30, max_len)):
-        exp = expected[i] if i < len(expected) else "--------"
-        gen = generated[i] if i < len(generated) else "--------"
-        match = "✓" if exp == gen else "✗"
-        print(f"{i:<6} {exp:<12} {gen:<12} {match}")
-    
-    if max_len > 40:
-        print("...")
-        # Last 10
-        for i in range(max(30, max_len - 10), max_len):
-            exp = expected[i] if i < len(expected) else "--------"
-            gen = generated[i] if i < len(generated) else "--------"
-            match = "✓" if exp == gen else "✗"
-            print(f"{i:<6} {exp:<12} {gen:<12} {match}")
-    
-    print("=" * 70)
-    
-    return len(errors) == 0
 
+    if json_file:
+        import json
+        report = dict(result)
+        report["details"] = [{"address": a, "expected": e, "generated": g}
+                             for a, e, g in result["details"]]
+        with open(json_file, 'w') as f:
+            json.dump(report, f, indent=2)
 
-if __name__ == "__main__":
-    import sys
+    return mismatches == 0
+
+
+def main():
+    import argparse
     import os
-    
-    # Get script directory
+    import sys
+
+    # Defaults: the test program and its output, relative to this script
     script_dir = os.path.dirname(os.path.abspath(__file__))
     tests_dir = os.path.join(os.path.dirname(script_dir), "tests")
     output_dir = os.path.join(os.path.dirname(script_dir), "output")
-    
-    expected_file = os.path.join(tests_dir, "expected_output.txt")
-    generated_file = os.path.join(output_dir, "test_output.mem")
-    
-    # Allow command line override
-    if len(sys.argv) >= 3:
-        expected_file = sys.argv[1]
-        generated_file = sys.argv[2]
-    
-    success = validate(expected_file, generated_file)
+
+    parser = argparse.ArgumentParser(description="Compare expected and generated memory images")
+    parser.add_argument("expected", nargs="?", default=os.path.join(tests_dir, "expected_output.txt"),
+                        help="expected image (any format; default: tests/expected_output.txt)")
+    parser.add_argument("generated", nargs="?", default=os.path.join(output_dir, "test_output.mem"),
+                        help="generated image (any format; default: output/test_output.mem)")
+    parser.add_argument("--max-mismatches", type=int, metavar="N",
+                        help="stop after N mismatches")
+    parser.add_argument("--show", type=int, default=50, metavar="N",
+                        help="mismatches to list (default: 50)")
+    parser.add_argument("--zero-fill", action="store_true",
+                        help="treat words missing from one image as zero")
+    parser.add_argument("--json", metavar="FILE", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        success = validate(args.expected, args.generated, args.max_mismatches, args.zero_fill,
+                           args.show, args.json)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
     sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
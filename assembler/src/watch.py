@@ -0,0 +1,364 @@
+"""
+Watch mode: keeps one program assembled while it is being edited.
+The parsed lines, symbol table, encoded words and the .mem file's layout
+stay in memory between saves. After an edit the new source is diffed by
+line against the last good version and only the changed lines are parsed
+and encoded again; other lines are encoded again only when a symbol they
+name was added, removed or moved. An edit that keeps every label, word
+count and .ORG in place leaves the rest of the program untouched;
+otherwise addresses are recomputed from the cached line sizes.
+
+The .mem file is patched in place, word by word, while its shape (word
+count, and for the dense and sparse layouts the address runs) stays the
+same; otherwise it is rewritten. An edit that fails to assemble is
+reported and leaves the last good image in place. Only the .mem image is
+maintained: run assembler.py for listings, -O and --schedule.
+
+Usage: python watch.py <input.asm> [output.mem] [--layout L] [--interval SECONDS]
+"""
+
+import difflib
+import os
+import time
+from array import array
+
+import memfile
+from assembler import (SourceLine, tokenize, line_size, place_line, encode_line, data_names,
+                       encoder_table)
+
+
+WORD_BYTES = 33     # one 32-character binary word and its newline
+
+
+class _Line(SourceLine):
+    """
+    One source line, blank ones included, as tokenize() parses it, with
+    its size in words, encoding (None until encoded) and where it was
+    last placed. line_num is brought up to date before each pass.
+    """
+    __slots__ = ("size", "dep", "words", "address", "offset")
+
+    def __init__(self, text):
+        entries = tokenize([text])
+        if entries:
+            entry = entries[0]
+            super().__init__(1, entry.text, entry.label, entry.mnemonic, entry.operands, entry.kinds)
+        else:
+            super().__init__(1, text.strip(), None, None, (), ())
+        name = self.mnemonic
+        self.size = line_size(self)
+        self.dep = None             # operand that may name a symbol
+        self.words = None
+        self.address = None         # address of the first word
+        self.offset = None          # byte offset of the first word in the .mem file
+        if self.size == 0:
+            self.words = ()
+        elif name in encoder_table:
+            imm_operand = encoder_table[name][2]
+            if imm_operand is not None and imm_operand < len(self.operands):
+                self.dep = self.operands[imm_operand]
+        else:
+            self.dep = name         # data word: a number or a label name
+
+    def shape(self):
+        """What pass 1 sees of the line, or None if it neither defines nor takes space."""
+        if self.label is None and self.size == 0 and self.mnemonic != ".ORG":
+            return None
+        org = self.operands[:1] if self.mnemonic == ".ORG" else None
+        return self.label, self.size, org
+
+
+def _common_prefix(a, b, limit):
+    """Length of the common prefix of lists a and b, at most limit."""
+    length = 0
+    step = 1024
+    while length + step <= limit and a[length:length + step] == b[length:length + step]:
+        length += step
+    while length < limit and a[length] == b[length]:
+        length += 1
+    return length
+
+
+class IncrementalAssembler:
+    """
+    Assembles successive versions of one source, redoing only the work an
+    edit makes necessary, and keeps a .mem file in the given layout up to
+    date. Lines are assembled as by assemble_source (without -O or
+    --schedule).
+    """
+
+    def __init__(self, output_file, layout="packed"):
+        if layout not in memfile.LAYOUTS:
+            raise ValueError(f"Unknown layout: {layout}")
+        self.output_file = output_file
+        self.layout = layout
+        self.text_lines = []        # source lines of the last good version
+        self.lines = []             # _Line per source line
+        self.symbol_table = {}
+        self.frame = None           # shape of the .mem file; patching needs it unchanged
+        self.stamp = None           # (size, mtime_ns) of the .mem file as last written
+        self.word_count = 0
+
+    def update(self, text):
+        """
+        Bring the image and the .mem file up to date with a new version of
+        the source. Nothing changes if the new version fails to assemble.
+        Returns: dict with parsed, encoded, moved (symbols added, removed or
+        moved), words_written, words, rewritten and seconds
+        Raises ValueError on assembly errors.
+        """
+        start = time.perf_counter()
+        text_lines = text.split('\n')
+        prefix, old_end, region, parsed = self._diff(text_lines)
+        old_region = self.lines[prefix:old_end]
+        lines = self.lines[:prefix] + region + self.lines[old_end:]
+
+        if self.lines and self._same_shape(old_region, region):
+            # Same labels, sizes and .ORGs in order: addresses and file offsets carry over
+            old = [(line.address, line.offset) for line in old_region if line.shape() is not None]
+            shaped = [index for index, line in enumerate(region, prefix) if line.shape() is not None]
+            positions = dict(zip(shaped, old))
+            symbol_table, frame, word_count = self.symbol_table, self.frame, self.word_count
+            moved = set()
+            dirty = range(prefix, prefix + len(region))
+        else:
+            addresses, symbol_table = self._place(lines)
+            offsets, frame, word_count = self._layout(lines, addresses)
+            positions = dict(enumerate(zip(addresses, offsets)))
+            moved = {symbol for symbol in symbol_table.keys() | self.symbol_table.keys()
+                     if symbol_table.get(symbol) != self.symbol_table.get(symbol)}
+            dirty = range(len(lines))
+        encoded = self._encode(lines, dirty, symbol_table, moved)
+
+        rewritten = (frame is None or frame != self.frame or self.stamp != self._stat())
+        if rewritten:
+            self._rewrite(lines, positions, encoded)
+            words_written = word_count
+        else:
+            words_written = self._patch(lines, dirty, positions, encoded)
+
+        for index, words in encoded.items():
+            lines[index].words = words
+        for index, (address, offset) in positions.items():
+            line = lines[index]
+            line.address, line.offset = address, offset
+        self.text_lines = text_lines
+        self.lines = lines
+        self.symbol_table = symbol_table
+        self.frame = frame
+        self.stamp = self._stat()
+        self.word_count = word_count
+        return {
+            "parsed": parsed,
+            "encoded": len(encoded),
+            "moved": sorted(moved),
+            "words_written": words_written,
+            "words": word_count,
+            "rewritten": rewritten,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _diff(self, text_lines):
+        """
+        Match the new source lines against the previous ones.
+        Returns: (prefix, old_end, region, parsed) where lines before
+        prefix and from old_end on are unchanged, and region holds the
+        _Lines that replace self.lines[prefix:old_end]: kept ones where
+        the diff matched, parsed new ones for changed text.
+        """
+        old = self.text_lines
+        limit = min(len(old), len(text_lines))
+        prefix = _common_prefix(old, text_lines, limit)
+        suffix = _common_prefix(old[::-1], text_lines[::-1], limit - prefix)
+        old_end = len(old) - suffix
+
+        region = []
+        parsed = 0
+        matcher = difflib.SequenceMatcher(None, old[prefix:old_end],
+                                          text_lines[prefix:len(text_lines) - suffix],
+                                          autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                region.extend(self.lines[prefix + i1:prefix + i2])
+            else:
+                region.extend(_Line(text) for text in text_lines[prefix + j1:prefix + j2])
+                parsed += j2 - j1
+        return prefix, old_end, region, parsed
+
+    @staticmethod
+    def _same_shape(old_region, region):
+        """True if both runs of lines define the same labels, sizes and .ORGs in order."""
+        old_shapes = [shape for shape in map(_Line.shape, old_region) if shape is not None]
+        shapes = [shape for shape in map(_Line.shape, region) if shape is not None]
+        return old_shapes == shapes
+
+    @staticmethod
+    def _place(lines):
+        """
+        Pass 1 over the cached lines (see assembler.place_line).
+        Returns: (address of each line, symbol table)
+        """
+        symbol_table = {}
+        addresses = []
+        address = 0
+        names = data_names(lines)
+        for index, line in enumerate(lines):
+            line.line_num = index + 1
+            following = place_line(line, address, symbol_table, names)
+            if line.mnemonic == ".ORG":
+                address = following
+            addresses.append(address)
+            address = following
+        return addresses, symbol_table
+
+    @staticmethod
+    def _encode(lines, dirty, symbol_table, moved):
+        """
+        Pass 2 for the new lines among dirty, and lines naming a moved symbol.
+        Returns: {line index: tuple of words}
+        """
+        encoded = {}
+        for index in dirty:
+            line = lines[index]
+            if line.size == 0:
+                continue
+            if line.words is not None and (not moved or line.dep not in moved):
+                continue
+            line.line_num = index + 1
+            encoded[index] = encode_line(line, symbol_table)
+        return encoded
+
+    def _layout(self, lines, addresses):
+        """
+        Byte offset of every line's first word in the .mem file, and the
+        file's shape: the word count (packed), the emission-order runs
+        (sparse) or the address runs (dense; None if runs overlap, since
+        later words then hide earlier ones).
+        Returns: (offsets, frame, word_count)
+        """
+        offsets = []
+        runs = []               # [base, length] in emission order
+        position = 0            # bytes before the next word (packed and sparse)
+        end = None
+        for line, address in zip(lines, addresses):
+            if line.size == 0:
+                offsets.append(None)
+                continue
+            if address != end:
+                runs.append([address, 0])
+                if self.layout == "sparse":
+                    position += len(f"@{address:X}\n")
+            runs[-1][1] += line.size
+            end = address + line.size
+            offsets.append(WORD_BYTES * address if self.layout == "dense" else position)
+            position += WORD_BYTES * line.size
+        word_count = sum(length for _base, length in runs)
+
+        if self.layout == "packed":
+            return offsets, word_count, word_count
+        if self.layout == "sparse":
+            return offsets, [tuple(run) for run in runs], word_count
+        merged = []
+        for base, length in sorted(runs):
+            if merged and base < merged[-1][1]:
+                return offsets, None, word_count
+            if merged and base == merged[-1][1]:
+                merged[-1][1] = base + length
+            else:
+                merged.append([base, base + length])
+        return offsets, [tuple(run) for run in merged], word_count
+
+    def _rewrite(self, lines, positions, encoded):
+        """Write the whole .mem file."""
+        segments = []
+        end = None
+        for index, line in enumerate(lines):
+            if line.size == 0:
+                continue
+            address = positions[index][0] if index in positions else line.address
+            if address != end:
+                segments.append((address, array('I')))
+            segments[-1][1].extend(encoded.get(index, line.words))
+            end = address + line.size
+        memfile.write_mem(self.output_file, segments, self.layout)
+
+    def _patch(self, lines, dirty, positions, encoded):
+        """
+        Overwrite, in place, the words of dirty lines that were encoded
+        again or moved within the file.
+        Returns: number of words written
+        """
+        written = 0
+        with open(self.output_file, 'r+b') as f:
+            for index in dirty:
+                line = lines[index]
+                if line.size == 0:
+                    continue
+                offset = positions[index][1]
+                words = encoded.get(index, line.words)
+                if offset == line.offset and words == line.words:
+                    continue
+                f.seek(offset)
+                f.write("".join(f"{word:032b}\n" for word in words).encode("ascii"))
+                written += len(words)
+        return written
+
+    def _stat(self):
+        """(size, mtime_ns) of the .mem file, or None if it is missing."""
+        try:
+            st = os.stat(self.output_file)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+
+def update_line(path, result):
+    """One-line summary of an IncrementalAssembler.update result."""
+    moved = result["moved"]
+    labels = f", {len(moved)} symbols changed" if moved else ""
+    share = 100.0 * result["words_written"] / result["words"] if result["words"] else 0.0
+    how = "rewritten" if result["rewritten"] else "patched in place"
+    return (f"[{time.strftime('%H:%M:%S')}] {path}: {result['parsed']} lines parsed, "
+            f"{result['encoded']} encoded{labels}; {result['words_written']} of "
+            f"{result['words']} words {how} ({share:.1f}%) in {result['seconds'] * 1000:.1f}ms")
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Re-assemble a source incrementally whenever it changes")
+    parser.add_argument("input", help="input .asm file")
+    parser.add_argument("output", nargs="?", help="output .mem file (default: input with .mem)")
+    parser.add_argument("--layout", choices=memfile.LAYOUTS, default="packed",
+                        help=".mem layout (default: packed)")
+    parser.add_argument("--interval", type=float, default=0.25, metavar="SECONDS",
+                        help="how often to check the source for changes (default: 0.25)")
+    args = parser.parse_args()
+
+    output_file = args.output or args.input.rsplit('.', 1)[0] + ".mem"
+    assembler = IncrementalAssembler(output_file, args.layout)
+    print("=" * 60)
+    print(f"Watching {args.input} -> {output_file} (Ctrl-C to stop)")
+    print("=" * 60)
+    seen = None
+    try:
+        while True:
+            try:
+                st = os.stat(args.input)
+                stamp = (st.st_size, st.st_mtime_ns)
+                if stamp != seen:
+                    seen = stamp
+                    with open(args.input, 'r') as f:
+                        text = f.read()
+                    print(update_line(args.input, assembler.update(text)))
+            except (OSError, ValueError) as e:
+                print(f"[{time.strftime('%H:%M:%S')}] Error: {e}")
+            sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,14 @@ USE ieee.std_logic_textio.ALL;
 USE IEEE.STD_LOGIC_UNSIGNED.ALL;
 USE IEEE.numeric_std.ALL;
 USE std.textio.ALL;
+USE work.ram_image_pkg.ALL;
+
+-- Initial contents come from one of two places:
+-- * ram_image_pkg with RAM_INIT_ENABLED (assembler.py --format vhd): the
+--   populated words are set at elaboration and rewritten on reset, with
+--   no file I/O. Words outside the image keep their value across a reset.
+-- * otherwise (the empty default package): INIT_FILENAME is read with
+--   textio on reset, one line per word from address 0.
 
 ENTITY ram IS
     GENERIC (
@@ -23,7 +31,23 @@ END ENTITY ram;
 
 ARCHITECTURE arch_ram OF ram IS
     TYPE MemoryArray IS ARRAY(0 TO MEMORY_DEPTH-1) OF STD_LOGIC_VECTOR(31 DOWNTO 0);
-    SIGNAL memory : MemoryArray := (OTHERS => (OTHERS => '0'));
+
+    -- Memory with the ram_image_pkg words in place (all zeros if it is empty);
+    -- words past MEMORY_DEPTH are dropped, as the textio path stops there
+    FUNCTION package_image RETURN MemoryArray IS
+        VARIABLE image : MemoryArray := (OTHERS => (OTHERS => '0'));
+    BEGIN
+        FOR s IN RAM_INIT_SEGMENTS'RANGE LOOP
+            FOR i IN 0 TO RAM_INIT_SEGMENTS(s).count - 1 LOOP
+                IF RAM_INIT_SEGMENTS(s).base + i < MEMORY_DEPTH THEN
+                    image(RAM_INIT_SEGMENTS(s).base + i) := RAM_INIT_WORDS(RAM_INIT_SEGMENTS(s).first + i);
+                END IF;
+            END LOOP;
+        END LOOP;
+        RETURN image;
+    END FUNCTION package_image;
+
+    SIGNAL memory : MemoryArray := package_image;
 
 BEGIN
 
@@ -39,22 +63,33 @@ BEGIN
         VARIABLE file_status : FILE_OPEN_STATUS;
     BEGIN
         IF (reset = '1') THEN
-            -- Safe File Loading
-            file_open(file_status, memory_file, INIT_FILENAME, READ_MODE);
-            
-            IF file_status = OPEN_OK THEN
-                FOR i IN memory'RANGE LOOP
-                    IF NOT ENDFILE(memory_file) THEN
-                        readline(memory_file, fileLineContent);
-                        read(fileLineContent, temp_data);
-                        memory(i) <= temp_data;
-                    ELSE
-                        EXIT;
-                    END IF;
+            IF RAM_INIT_ENABLED THEN
+                -- Package image: only the populated words
+                FOR s IN RAM_INIT_SEGMENTS'RANGE LOOP
+                    FOR i IN 0 TO RAM_INIT_SEGMENTS(s).count - 1 LOOP
+                        IF RAM_INIT_SEGMENTS(s).base + i < MEMORY_DEPTH THEN
+                            memory(RAM_INIT_SEGMENTS(s).base + i) <= RAM_INIT_WORDS(RAM_INIT_SEGMENTS(s).first + i);
+                        END IF;
+                    END LOOP;
                 END LOOP;
-                file_close(memory_file);
             ELSE
-                assert false report "RAM init file open failed: " & INIT_FILENAME severity error;
+                -- Safe File Loading
+                file_open(file_status, memory_file, INIT_FILENAME, READ_MODE);
+                
+                IF file_status = OPEN_OK THEN
+                    FOR i IN memory'RANGE LOOP
+                        IF NOT ENDFILE(memory_file) THEN
+                            readline(memory_file, fileLineContent);
+                            read(fileLineContent, temp_data);
+                            memory(i) <= temp_data;
+                        ELSE
+                            EXIT;
+                        END IF;
+                    END LOOP;
+                    file_close(memory_file);
+                ELSE
+                    assert false report "RAM init file open failed: " & INIT_FILENAME severity error;
+                END IF;
             END IF;
             
         -- Normal operation on clock edge
@@ -0,0 +1,23 @@
+-- Generated by assembler.py; do not edit.
+-- Empty image: RAM_INIT_ENABLED is FALSE, so ram.vhd reads INIT_FILENAME with textio.
+-- Replace with: python assembler/src/assembler.py <program.asm> memory/ram_image_pkg.vhd --format vhd
+LIBRARY ieee;
+USE ieee.std_logic_1164.ALL;
+
+PACKAGE ram_image_pkg IS
+    TYPE ram_segment IS RECORD
+        base  : NATURAL;    -- address of the first word
+        first : NATURAL;    -- its index in RAM_INIT_WORDS
+        count : NATURAL;
+    END RECORD;
+    TYPE ram_segment_array IS ARRAY (NATURAL RANGE <>) OF ram_segment;
+    TYPE ram_word_array IS ARRAY (NATURAL RANGE <>) OF STD_LOGIC_VECTOR(31 DOWNTO 0);
+
+    CONSTANT RAM_INIT_ENABLED : BOOLEAN := FALSE;
+
+    CONSTANT RAM_INIT_SEGMENTS : ram_segment_array(0 TO 0) := (
+        0 => (0, 0, 0));
+
+    CONSTANT RAM_INIT_WORDS : ram_word_array(0 TO 0) := (
+        0 => X"00000000");
+END PACKAGE ram_image_pkg;
@@ -0,0 +1,74 @@
+#!/bin/bash
+# ============================================================================
+# RAM start-up time: textio .mem loading vs ram_image_pkg constants (GHDL)
+# ============================================================================
+# Assembles a program as a dense .mem and as ram_image_pkg, builds
+# memory/tb_ram_init against ram.vhd once with the empty package (textio
+# path) and once with the generated one, checks both report the same
+# words and prints the best wall time of RUNS runs of each.
+# Usage: ./scripts/ram_init_startup.sh <program.asm> [runs]
+# ============================================================================
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
+ASSEMBLER_DIR="$PROJECT_ROOT/assembler/src"
+GHDL_FLAGS="--std=08 -fsynopsys"
+
+if [ -z "$1" ]; then
+    echo "Usage: $0 <program.asm> [runs]"
+    exit 1
+fi
+PROGRAM="$(cd "$(dirname "$1")" && pwd)/$(basename "$1")"
+RUNS="${2:-5}"
+
+WORK="$(mktemp -d)"
+trap 'rm -rf "$WORK"' EXIT
+
+python3 "$ASSEMBLER_DIR/assembler.py" "$PROGRAM" "$WORK/image.mem" --layout dense --quiet
+python3 "$ASSEMBLER_DIR/assembler.py" "$PROGRAM" "$WORK/image.vhd" --format vhd --quiet
+PYTHONPATH="$ASSEMBLER_DIR" python3 -c \
+    'import sys, memfile; sys.stdout.writelines(memfile.vhdl_lines([], enabled=False))' > "$WORK/empty_pkg.vhd"
+
+# build <directory> <package file>
+build() {
+    mkdir -p "$1"
+    (cd "$1" && ghdl -a $GHDL_FLAGS "$2" "$PROJECT_ROOT/memory/ram.vhd" "$PROJECT_ROOT/memory/tb_ram_init.vhd" \
+        && ghdl -e $GHDL_FLAGS tb_ram_init)
+}
+
+# best_ms <directory>: best wall time of RUNS runs, in milliseconds
+best_ms() {
+    local best=""
+    for _ in $(seq "$RUNS"); do
+        local start end ms
+        start=$(date +%s%N)
+        (cd "$1" && ghdl -r $GHDL_FLAGS tb_ram_init -gINIT_FILENAME="$WORK/image.mem" > run.log 2>&1)
+        end=$(date +%s%N)
+        ms=$(( (end - start) / 1000000 ))
+        if [ -z "$best" ] || [ "$ms" -lt "$best" ]; then
+            best=$ms
+        fi
+    done
+    echo "$best"
+}
+
+build "$WORK/textio" "$WORK/empty_pkg.vhd"
+build "$WORK/package" "$WORK/image.vhd"
+TEXTIO_MS=$(best_ms "$WORK/textio")
+PACKAGE_MS=$(best_ms "$WORK/package")
+
+if ! diff <(grep -o 'M\[.*' "$WORK/textio/run.log") <(grep -o 'M\[.*' "$WORK/package/run.log") > /dev/null; then
+    echo "Error: the two initialisation paths report different words"
+    diff <(grep -o 'M\[.*' "$WORK/textio/run.log") <(grep -o 'M\[.*' "$WORK/package/run.log") || true
+    exit 1
+fi
+
+echo "======================================"
+echo "RAM start-up: $PROGRAM ($(wc -l < "$WORK/image.mem") dense words)"
+echo "======================================"
+echo "textio (.mem):        ${TEXTIO_MS} ms"
+echo "ram_image_pkg:        ${PACKAGE_MS} ms"
+echo "Saved:                $((TEXTIO_MS - PACKAGE_MS)) ms"
+echo "======================================"